@@ -0,0 +1,176 @@
+"""
+Multi-account session pool for instaloader
+Loads several saved sessions / cookie files and routes each request to whichever
+account still has rate-limit budget, so throughput grows with the accounts we provision
+"""
+
+import os
+import threading
+import time
+from http.cookiejar import MozillaCookieJar
+
+import instaloader
+from instaloader import RateController
+
+from metrics import metrics
+from rate_control import TokenBucket
+
+# Roughly what a single logged-in account sustains without tripping 429s
+DEFAULT_RATE = 20 / 60.0  # requests per second
+DEFAULT_BURST = 5
+RATE_LIMIT_COOLDOWN = 300
+# InstaloaderContext methods that send a request; PooledContext routes each call
+REQUEST_METHODS = ('get_json', 'get_page_data', 'graphql_query', 'doc_id_graphql_query', 'graphql_node_list',
+                   'get_iphone_json', 'get_raw', 'head')
+
+
+class CountingRateController(RateController):
+    """Instaloader's own rate controller, counting queries and 429s into metrics"""
+
+    def wait_before_query(self, query_type):
+        metrics.incr('instaloader_queries')
+        with metrics.phase('instaloader_throttle'):
+            super().wait_before_query(query_type)
+
+    def handle_429(self, query_type):
+        metrics.incr('instaloader_429')
+        super().handle_429(query_type)
+
+
+class BucketRateController(CountingRateController):
+    """Instaloader rate controller that also draws from the account's token bucket"""
+
+    def __init__(self, context, bucket):
+        super().__init__(context)
+        self.bucket = bucket
+
+    def wait_before_query(self, query_type):
+        self.bucket.acquire()
+        super().wait_before_query(query_type)
+
+    def handle_429(self, query_type):
+        # Take this account out of rotation so the pool routes around it
+        self.bucket.penalize(RATE_LIMIT_COOLDOWN)
+        super().handle_429(query_type)
+
+
+class Account:
+    """One logged-in Instaloader and its request budget"""
+
+    def __init__(self, name, loader, bucket):
+        self.name = name
+        self.loader = loader
+        self.bucket = bucket
+        self.lock = threading.RLock()  # one request at a time per context
+
+    @property
+    def context(self):
+        return self.loader.context
+
+
+class PooledContext:
+    """Stands in for an InstaloaderContext, sending each request through the account with most budget
+
+    Profiles and posts built on it (including every page of a NodeIterator and
+    each sidecar expansion) spread their requests across the pool, with no need
+    to rebuild instaloader structures from their private fields. Everything
+    else (is_logged_in, username, log, ...) is answered by the first account.
+    routed() counts the requests the calling thread has sent through the pool.
+    """
+
+    def __init__(self, pool):
+        context = pool.accounts[0].context
+        missing = [name for name in REQUEST_METHODS if not callable(getattr(context, name, None))]
+        if missing:
+            raise RuntimeError(f"instaloader {instaloader.__version__} has no InstaloaderContext.{', '.join(missing)}; "
+                               f"AccountPool needs an instaloader release that has them")
+        self._pool = pool
+        self._context = context
+        self._local = threading.local()
+
+    def routed(self):
+        return getattr(self._local, 'routed', 0)
+
+    def __getattr__(self, name):
+        if name not in REQUEST_METHODS:
+            return getattr(self._context, name)
+
+        def request(*args, **kwargs):
+            account = self._pool.choose()
+            self._local.routed = self.routed() + 1
+            with account.lock:
+                return getattr(account.context, name)(*args, **kwargs)
+        return request
+
+
+def session_username(path):
+    """Account name from a session file name, e.g. session-nagoyaka.hibi -> nagoyaka.hibi"""
+    name = os.path.basename(path)
+    for prefix in ('session-', 'session_'):
+        if name.startswith(prefix):
+            return name[len(prefix):]
+    return os.path.splitext(name)[0]
+
+
+def load_cookie_file(path):
+    """Instagram cookies from a Netscape cookies.txt as a plain dict"""
+    jar = MozillaCookieJar(path)
+    jar.load(ignore_discard=True, ignore_expires=True)
+    cookies = {cookie.name: cookie.value for cookie in jar if 'instagram.com' in cookie.domain}
+    if 'sessionid' not in cookies or 'csrftoken' not in cookies:
+        raise ValueError(f"{path} has no Instagram sessionid/csrftoken cookies")
+    return cookies
+
+
+class AccountPool:
+    """Routes instaloader work to the account with the most budget left"""
+
+    def __init__(self, accounts):
+        if not accounts:
+            raise ValueError("AccountPool needs at least one account")
+        self.accounts = accounts
+        self._lock = threading.Lock()
+        self.context = PooledContext(self)
+
+    @classmethod
+    def from_files(cls, paths, loader_factory, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        """Build a pool from instaloader session files and/or cookies.txt files
+
+        loader_factory(rate_controller) must return a configured Instaloader.
+        """
+        accounts = []
+        for path in paths:
+            name = session_username(path)
+            bucket = TokenBucket(rate, burst)
+            loader = loader_factory(lambda context, bucket=bucket: BucketRateController(context, bucket))
+            if path.endswith('.txt'):
+                loader.context.load_session(name, load_cookie_file(path))
+            else:
+                loader.load_session_from_file(name, path)
+            accounts.append(Account(name, loader, bucket))
+            print(f"✓ Loaded session for {name} from {path}")
+        return cls(accounts)
+
+    def choose(self):
+        """Account with the most tokens available, waiting if every bucket is empty"""
+        while True:
+            with self._lock:
+                best = max(self.accounts, key=lambda account: account.bucket.available())
+                if best.bucket.available() >= 1:
+                    return best
+                delay = min(account.bucket.wait_time() for account in self.accounts)
+            time.sleep(max(delay, 0.05))
+
+    def profile(self, username):
+        """Look up a profile on the pooled context, so its lookup, post pages and carousels all spread across accounts"""
+        routed = self.context.routed()
+        profile = instaloader.Profile.from_username(self.context, username)
+        if self.context.routed() == routed:
+            # A request method missing from REQUEST_METHODS would silently pin everything to the first account
+            raise RuntimeError(f"instaloader {instaloader.__version__} looked up @{username} without a request "
+                               f"AccountPool knows about; add its method to account_pool.REQUEST_METHODS")
+        return profile
+
+    def status(self):
+        """(name, tokens available) for every account"""
+        return [(account.name, round(account.bucket.available(), 2)) for account in self.accounts]
@@ -0,0 +1,142 @@
+"""
+ZIP / tar output for downloads
+Response bodies go into archive entries instead of into files that are zipped
+afterwards, but they are not streamed: each body is buffered in a
+SpooledTemporaryFile until it has fully arrived, then copied into the archive
+under a lock, so a failed download never leaves a truncated entry behind and
+downloads don't queue behind one another's network time.
+
+The cost: memory holds up to one SPOOL_SIZE buffer per running download
+(workers x SPOOL_SIZE), and bodies over SPOOL_SIZE (videos) spill to a temp
+file first, so they hit the disk twice. Bodies up to SPOOL_SIZE (nearly all
+images) are written once. ZIP64 is used as soon as an entry or the archive
+passes 4 GB.
+"""
+
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+
+from metrics import metrics
+
+SPOOL_SIZE = 4 * 1024 * 1024  # per running download; bigger bodies (videos) spill to a temp file
+COPY_SIZE = 1024 * 1024
+ARCHIVE_FORMATS = {'.zip': 'zip', '.tar': 'tar'}
+
+
+def archive_format(path):
+    """'zip' or 'tar' from an archive path's extension"""
+    fmt = ARCHIVE_FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"{path}: archive must end in {' or '.join(ARCHIVE_FORMATS)}")
+    return fmt
+
+
+def spool():
+    """Buffer for one response body; over SPOOL_SIZE it becomes a temp file, so large bodies are written twice"""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+
+class ArchiveWriter:
+    """ZIP or tar archive that download threads add finished bodies to
+
+    Written to path + '.part' and renamed into place by close(), so a crashed
+    run never leaves something that looks like a complete archive. An existing
+    archive is never overwritten. Callbacks given to when_closed() run once the
+    archive is in place, e.g. to record its entries as downloaded.
+    """
+
+    def __init__(self, path, fmt=None):
+        if os.path.exists(path):
+            raise FileExistsError(f"{path} already exists; pick a new archive name")
+        self.path = path
+        self.fmt = fmt or archive_format(path)
+        self.count = 0
+        self.bytes = 0
+        self._part = path + '.part'
+        self._names = set()
+        self._on_close = []
+        self._lock = threading.Lock()
+        if self.fmt == 'zip':
+            # Images are already compressed; storing them keeps the writer I/O bound
+            self._archive = zipfile.ZipFile(self._part, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(self._part, 'w', format=tarfile.PAX_FORMAT)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _unique(self, name):
+        if name in self._names:
+            stem, ext = os.path.splitext(name)
+            num = 2
+            while f"{stem}_{num}{ext}" in self._names:
+                num += 1
+            name = f"{stem}_{num}{ext}"
+        self._names.add(name)
+        return name
+
+    def add(self, name, fileobj, size):
+        """Copy size bytes from fileobj into a new entry; returns the name used"""
+        start = time.perf_counter()
+        with self._lock:
+            name = self._unique(name)
+            if self.fmt == 'zip':
+                info = zipfile.ZipInfo(name, time.localtime()[:6])
+                info.file_size = size  # lets zipfile pick ZIP64 for entries over 4 GB up front
+                with self._archive.open(info, 'w') as entry:
+                    shutil.copyfileobj(fileobj, entry, COPY_SIZE)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size = size
+                info.mtime = time.time()
+                self._archive.addfile(info, fileobj)
+            self.count += 1
+            self.bytes += size
+        metrics.observe('archive_write', time.perf_counter() - start)
+        return name
+
+    def add_file(self, name, path):
+        """Add a file that is already on disk"""
+        with open(path, 'rb') as f:
+            return self.add(name, f, os.path.getsize(path))
+
+    def when_closed(self, callback):
+        """Call callback() after close() has put the finished archive in place (never after abort())"""
+        with self._lock:
+            self._on_close.append(callback)
+
+    def close(self):
+        with self._lock:
+            if self._archive is None:
+                return
+            self._archive.close()
+            self._archive = None
+            callbacks, self._on_close = self._on_close, []
+        try:
+            os.link(self._part, self.path)  # unlike a rename, never replaces an archive another run just finished
+            os.remove(self._part)
+        except FileExistsError:
+            raise FileExistsError(f"{self.path} appeared while writing; this run's archive is {self._part}")
+        except OSError:
+            os.replace(self._part, self.path)  # file systems without hard links
+        metrics.incr('bytes_written', os.path.getsize(self.path))
+        for callback in callbacks:
+            callback()
+
+    def abort(self):
+        """Close and delete the unfinished archive"""
+        with self._lock:
+            if self._archive is None:
+                return
+            self._archive.close()
+            self._archive = None
+            self._on_close = []
+        os.remove(self._part)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Derivative stage benchmark
+Writes a profile's worth of synthetic 1080x1350 JPEGs (500, like minju.csv)
+and times generate_derivatives with one process and with one per core, plus
+the re-run where everything is already up to date
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from derivatives import generate_derivatives, image_files
+
+
+def write_images(directory, count, seed):
+    rng = np.random.default_rng(seed)
+    for num in range(count):
+        base = (rng.random((16, 16, 3)) * 255).astype('uint8')
+        image = Image.fromarray(base).resize((1080, 1350), Image.BICUBIC).filter(ImageFilter.GaussianBlur(4))
+        # Some fine detail so the encoder has real work to do
+        noise = rng.integers(0, 24, size=(1350, 1080, 3), dtype=np.uint8)
+        image = Image.fromarray(np.clip(np.asarray(image, dtype=np.int16) + noise - 12, 0, 255).astype('uint8'))
+        image.save(os.path.join(directory, f"{num:04d}_1_1_n.jpg"), quality=90)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the process-pool derivative stage')
+    parser.add_argument('--images', type=int, default=500, help='Synthetic images to process (default: 500)')
+    parser.add_argument('--sizes', default='320,640', help='Derivative sizes (default: 320,640)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processes for the parallel run (default: one per core)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    work_dir = tempfile.mkdtemp(prefix='bench_derivatives_')
+    try:
+        src_dir = os.path.join(work_dir, 'downloads')
+        os.makedirs(src_dir)
+        write_images(src_dir, args.images, args.seed)
+        paths = image_files(src_dir)
+        print(f"🧪 {len(paths)} synthetic 1080x1350 JPEGs → {args.sizes}px WebP ({os.cpu_count()} CPU cores)")
+
+        results = {}
+        for workers in sorted({1, args.workers}):
+            out_dir = os.path.join(work_dir, f'derivatives_{workers}')
+            stats = generate_derivatives(paths, out_dir, sizes, workers=workers)
+            results[workers] = stats["seconds"]
+            print(f"⚙️  {workers} process{'es' if workers > 1 else ''}: {stats['seconds']:.2f}s, "
+                  f"{stats['processed'] / stats['seconds']:.1f} images/s, "
+                  f"{results[1] / stats['seconds']:.1f}x vs one process")
+
+        start = time.perf_counter()
+        stats = generate_derivatives(paths, out_dir, sizes, workers=args.workers)
+        print(f"↷ Re-run with everything up to date: {stats['skipped']} skipped in {time.perf_counter() - start:.2f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Downloader throughput benchmark
+Serves synthetic media from a local keep-alive HTTP server standing in for the CDN
+and compares serial vs concurrent runs of downloader.download_all
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader import download_all, display_stats
+
+
+class FakeCDNHandler(BaseHTTPRequestHandler):
+    """Serves /v/<n>_n.jpg with a fixed body size and per-request latency"""
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real CDN
+    body = b''
+    latency = 0.0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with FakeCDNHandler.lock:
+            FakeCDNHandler.connections += 1
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(size, latency):
+    FakeCDNHandler.body = os.urandom(size)
+    FakeCDNHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCDNHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(base_url, count, workers):
+    # Same naming scheme as the media in minju.csv, signed to stay valid for a day
+    oe = f"{int(time.time()) + 86400:X}"
+    items = [(i, f"{base_url}/v/t51.2885-15/{510000000 + i}_18054089165599399_{i}_n.jpg?oe={oe}")
+             for i in range(1, count + 1)]
+    output_dir = tempfile.mkdtemp(prefix='bench_dl_')
+    FakeCDNHandler.connections = 0
+    try:
+        stats = download_all(items, output_dir, workers=workers)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    stats["connections"] = FakeCDNHandler.connections
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark downloader.py against a local fake CDN')
+    parser.add_argument('--files', type=int, default=500, help='Number of files to download (default: 500)')
+    parser.add_argument('--size', type=int, default=200_000, help='Bytes per file (default: 200000)')
+    parser.add_argument('--latency', type=float, default=0.02, help='Server latency per request in seconds (default: 0.02)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16, 32], help='Worker counts to compare')
+    args = parser.parse_args()
+
+    server = start_server(args.size, args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"🧪 {args.files} files x {args.size} bytes, {args.latency * 1000:.0f} ms latency, fake CDN at {base_url}")
+
+    baseline = None
+    for workers in args.workers:
+        stats = run(base_url, args.files, workers)
+        seconds = stats["seconds"] or 1e-9
+        baseline = baseline or seconds
+        print(f"\n⚙️  workers={workers}: {args.files / seconds:.1f} files/s, "
+              f"{stats['bytes'] / 1e6 / seconds:.1f} MB/s, {stats['connections']} TCP connections, "
+              f"{baseline / seconds:.1f}x vs first run")
+        display_stats(stats)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Extract → parse → save pipeline benchmark (offline)
+Puts fake_gallery_dl.py on PATH as `gallery-dl` and runs the extractor scripts
+against it, reporting throughput, time to first record and peak RSS for each.
+Use --save / --compare to catch regressions between runs.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (name, script, extra args)
+SCENARIOS = [
+    ('insta_gallery_dl batch', 'insta_gallery_dl.py', []),
+    ('insta_gallery_dl hedged', 'insta_gallery_dl.py', ['--hedge', '30']),
+    ('insta_gallery_dl stream', 'insta_gallery_dl.py', ['--stream']),
+    ('advanced batch', 'insta_gallery_dl_advanced.py', []),
+    ('advanced stream', 'insta_gallery_dl_advanced.py', ['--stream']),
+]
+
+
+def install_fake_gallery_dl(bin_dir):
+    """Write a `gallery-dl` launcher for fake_gallery_dl.py into bin_dir"""
+    path = os.path.join(bin_dir, 'gallery-dl')
+    with open(path, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCH_DIR, "fake_gallery_dl.py")}" "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def csv_rows(path):
+    """Data rows written to a CSV so far (header excluded)"""
+    try:
+        with open(path, 'rb') as f:
+            return max(0, f.read().count(b'\n') - 1)
+    except FileNotFoundError:
+        return 0
+
+
+def run_scenario(script, extra, env, work_dir, records):
+    """Run one script against the fake gallery-dl and measure it"""
+    output = os.path.join(work_dir, 'urls.csv')
+    if os.path.exists(output):
+        os.remove(output)
+    cmd = [sys.executable, os.path.join(ROOT, script), '--backend', 'subprocess',
+           '--profile', 'bench', '--limit', str(records), '--output', output] + extra
+
+    start = time.perf_counter()
+    first_record = None
+    proc = subprocess.Popen(cmd, env=env, cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # wait4 gives this run's own rusage (the script plus the gallery-dl it waited for)
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        if first_record is None and csv_rows(output):
+            first_record = time.perf_counter() - start
+        time.sleep(0.002)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    rows = csv_rows(output)
+    if first_record is None and rows:
+        first_record = elapsed
+    return {
+        "returncode": proc.returncode,
+        "records": rows,
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round(rows / elapsed, 1) if elapsed else 0.0,
+        "time_to_first_record": round(first_record, 3) if first_record is not None else None,
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),  # KB on Linux
+    }
+
+
+def compare(results, settings, baseline_path, tolerance):
+    """Print scenarios that got slower than the saved baseline by more than tolerance"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        saved = json.load(f)
+    if any(saved.get(key) != value for key, value in settings.items()):
+        print(f"⚠️  {baseline_path} was recorded with different settings; the comparison is only indicative")
+    baseline = saved["results"]
+    regressions = 0
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before["records_per_sec"]:
+            continue
+        change = result["records_per_sec"] / before["records_per_sec"] - 1
+        if change < -tolerance:
+            regressions += 1
+            print(f"❌ {name}: {before['records_per_sec']:,.0f} → {result['records_per_sec']:,.0f} records/s "
+                  f"({change * 100:+.0f}%)")
+    if not regressions:
+        print(f"✅ No scenario slower than {baseline_path} by more than {tolerance * 100:.0f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the extractor scripts against a fake gallery-dl')
+    parser.add_argument('--records', type=int, default=5000, help='Records the fake profile has (default: 5000)')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Records per second gallery-dl emits, 0 for unthrottled (default: 0)')
+    parser.add_argument('--first-delay', type=float, default=0,
+                        help='Seconds before gallery-dl prints its first record (default: 0)')
+    parser.add_argument('--only', nargs='+', metavar='NAME', help='Run only scenarios whose name contains NAME')
+    parser.add_argument('--save', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Fail if throughput dropped versus this saved JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown for --compare (default: 0.2)')
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.only or any(part in s[0] for part in args.only)]
+    work_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    bin_dir = os.path.join(work_dir, 'bin')
+    os.makedirs(bin_dir)
+    install_fake_gallery_dl(bin_dir)
+
+    env = dict(os.environ)
+    env.update({
+        "PATH": bin_dir + os.pathsep + env.get("PATH", ""),
+        "FAKE_GDL_RECORDS": str(args.records),
+        "FAKE_GDL_RATE": str(args.rate),
+        "FAKE_GDL_FIRST_DELAY": str(args.first_delay),
+    })
+
+    rate = f"{args.rate:g} records/s" if args.rate else "unthrottled"
+    print(f"🧪 {args.records} records from a fake gallery-dl ({rate}, first record after {args.first_delay:g}s)")
+    print(f"\n{'scenario':<26} {'records':>8} {'seconds':>8} {'records/s':>10} {'first rec':>9} {'peak RSS':>9}")
+
+    results = {}
+    try:
+        for name, script, extra in scenarios:
+            result = run_scenario(script, extra, env, work_dir, args.records)
+            results[name] = result
+            first = result["time_to_first_record"]
+            first = f"{first:.2f}s" if first is not None else "-"
+            status = "" if result["returncode"] == 0 else f"  (exit {result['returncode']})"
+            print(f"{name:<26} {result['records']:>8} {result['seconds']:>7.2f}s {result['records_per_sec']:>10,.0f} "
+                  f"{first:>9} {result['peak_rss_mb']:>7.1f}MB{status}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    settings = {"records": args.records, "rate": args.rate, "first_delay": args.first_delay}
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(dict(settings, results=results), f, indent=2)
+        print(f"\n💾 Saved results to {args.save}")
+
+    if args.compare:
+        print()
+        if compare(results, settings, args.compare, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Pacing benchmark (simulated, no network)
+Replays insta.py's old fixed random sleeps and the AIMD controller against a
+simulated Instagram that 429s when more than --limit requests land in a sliding window,
+using a virtual clock so the whole comparison runs in well under a second
+"""
+
+import argparse
+import os
+import random
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_control import AIMDController
+
+
+class SimulatedInstagram:
+    """Sliding-window rate limiter with a virtual clock"""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.now = 0.0
+        self.requests = deque()
+        self.rate_limits = 0
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def request(self, latency=0.4):
+        self.now += latency
+        while self.requests and self.requests[0] <= self.now - self.window:
+            self.requests.popleft()
+        if len(self.requests) >= self.limit:
+            self.rate_limits += 1
+            return False
+        self.requests.append(self.now)
+        return True
+
+
+def run_fixed(server, posts, rng):
+    """The schedule insta.py used: 2-5 s per post, +10-20 s every 5th, 2-5 min after a 429"""
+    done = 0
+    while done < posts:
+        if not server.request():
+            server.sleep(rng.randint(120, 300))
+            continue
+        done += 1
+        base_delay = rng.uniform(2, 5)
+        if done % 5 == 0:
+            server.sleep(base_delay + rng.randint(10, 20))
+        else:
+            server.sleep(base_delay)
+    return server.now
+
+
+def run_aimd(server, posts, rng, cooldown):
+    pacer = AIMDController(initial_delay=3.5, cooldown=cooldown, sleep=server.sleep, rand=rng.random)
+    done = 0
+    while done < posts:
+        if not server.request():
+            pacer.pause(pacer.on_rate_limit())
+            continue
+        done += 1
+        pacer.on_success()
+        pacer.wait()
+    return server.now, pacer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fixed sleeps with AIMD pacing on a simulated rate limiter')
+    parser.add_argument('--posts', type=int, default=500, help='Posts to process (default: 500)')
+    parser.add_argument('--limit', type=int, default=40, help='Requests allowed per window (default: 40)')
+    parser.add_argument('--window', type=float, default=60.0, help='Rate-limit window in seconds (default: 60)')
+    parser.add_argument('--cooldown', type=float, default=60.0, help='AIMD base cooldown, like insta.py --delay (default: 60)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"🧪 {args.posts} posts, server allows {args.limit} requests / {args.window:.0f}s")
+
+    fixed_server = SimulatedInstagram(args.limit, args.window)
+    fixed = run_fixed(fixed_server, args.posts, random.Random(args.seed))
+
+    aimd_server = SimulatedInstagram(args.limit, args.window)
+    aimd, pacer = run_aimd(aimd_server, args.posts, random.Random(args.seed), args.cooldown)
+
+    print(f"\n⏱  Fixed sleeps: {fixed / 60:7.1f} min simulated, {fixed_server.rate_limits} rate limits")
+    print(f"⏱  AIMD pacing:  {aimd / 60:7.1f} min simulated, {aimd_server.rate_limits} rate limits, "
+          f"settled at {pacer.rate * 60:.0f} requests/min")
+    print(f"\n🚀 Wall-clock saving: {(1 - aimd / fixed) * 100:.0f}% ({fixed / aimd:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Record decoder benchmark
+Builds a large synthetic --dump-json dump shaped like gallery-dl's Instagram
+records and measures records/sec for full json.loads (the old path) and for
+every field-selective decoder installed here
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gallery_dl_stream import extract_record_url
+from record_decoder import available_decoders, get_decoder
+from synthetic_records import synthetic_record
+
+
+def build_dump(count, seed):
+    rng = random.Random(seed)
+    return [json.dumps(synthetic_record(rng, num)) for num in range(count)]
+
+
+def run(name, decode, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = 0
+        for line in lines:
+            data = decode(line)
+            if data and extract_record_url(data):
+                found += 1
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    assert found == len(lines), f"{name} lost records"
+    return len(lines) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark gallery-dl record decoders on a synthetic dump')
+    parser.add_argument('--records', type=int, default=20000, help='Records in the dump (default: 20000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per decoder; the best is reported (default: 3)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    lines = build_dump(args.records, args.seed)
+    size = sum(len(line) for line in lines)
+    print(f"🧪 {args.records} records, {size / 1024 / 1024:.1f} MB ({size / args.records / 1024:.1f} KB/record)")
+
+    baseline = run('json.loads (full)', json.loads, lines, args.repeat)
+    print(f"\n⏱  {'json.loads (full)':<18} {baseline:>10,.0f} records/s")
+    for name in available_decoders():
+        rate = run(name, get_decoder(name).decode, lines, args.repeat)
+        print(f"⏱  {name:<18} {rate:>10,.0f} records/s  ({rate / baseline:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Repost index benchmark
+Fills a RepostIndex with millions of random hashes plus a few planted
+near-duplicates, then measures reload time and per-lookup latency of the
+vectorized Hamming search, and how fast phash() hashes a typical JPEG
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from repost_index import RepostIndex, phash
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.choice(64, size=count, replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def synthetic_jpeg(rng, width=1080, height=1350):
+    base = (rng.random((12, 12, 3)) * 255).astype('uint8')
+    image = Image.fromarray(base).resize((width, height), Image.BICUBIC).filter(ImageFilter.GaussianBlur(6))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark repost lookups against a large hash index')
+    parser.add_argument('--size', type=int, default=2_000_000, help='Hashes in the index (default: 2000000)')
+    parser.add_argument('--queries', type=int, default=200, help='Lookups to time (default: 200)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    work_dir = tempfile.mkdtemp(prefix='bench_reposts_')
+    path = os.path.join(work_dir, 'reposts.sqlite3')
+    try:
+        hashes = rng.integers(0, 2**64, size=args.size, dtype=np.uint64)
+        start = time.perf_counter()
+        with RepostIndex(path) as index:
+            index.add_many((f"k{i}", None, int(value)) for i, value in enumerate(hashes))
+        print(f"🧪 Indexed {args.size:,} hashes in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(path) / 1e6:.0f} MB on disk)")
+
+        start = time.perf_counter()
+        index = RepostIndex(path)
+        print(f"📂 Reloaded in {time.perf_counter() - start:.2f}s")
+
+        # Half the queries are reposts (a few bits off a known hash), half are new images
+        picks = rng.integers(0, args.size, size=args.queries)
+        latencies = []
+        found = 0
+        for num, pick in enumerate(picks):
+            if num % 2 == 0:
+                query = flip_bits(int(hashes[pick]), 3, rng)
+            else:
+                query = int(rng.integers(0, 2**64, dtype=np.uint64))
+            start = time.perf_counter()
+            matches = index.search(query)
+            latencies.append(time.perf_counter() - start)
+            found += num % 2 == 0 and any(key == f"k{pick}" for key, _, _ in matches)
+        latencies.sort()
+        print(f"🔍 {args.queries} lookups: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, "
+              f"max {latencies[-1] * 1000:.1f} ms; {found}/{(args.queries + 1) // 2} planted reposts found")
+        index.close()
+
+        images = [synthetic_jpeg(rng) for _ in range(20)]
+        start = time.perf_counter()
+        for data in images:
+            phash(io.BytesIO(data))
+        print(f"🖼️  phash: {len(images) / (time.perf_counter() - start):.0f} images/s (1080x1350 JPEG)")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark
+Times importing each entry point in a fresh interpreter, measured inside that
+interpreter so Python's own startup doesn't count, and lists which heavy
+dependencies each one dragged in. `instaload` should stay well under --budget.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['instaload', 'metrics', 'instagram_extractor', 'insta', 'insta_gallery_dl', 'downloader']
+HEAVY = ['instaloader', 'gallery_dl', 'requests', 'numpy', 'PIL', 'http.server']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module, runs):
+    """Median in-process import time of module over `runs` fresh interpreters, plus what it loaded"""
+    samples = []
+    heavy = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+                                cwd=ROOT, capture_output=True, text=True, check=True)
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(probe["seconds"])
+        heavy = probe["heavy"]
+    return statistics.median(samples), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark how long each entry point takes to import')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per module (default: 5)')
+    parser.add_argument('--budget', type=float, default=100, help='Import budget for instaload in ms (default: 100)')
+    args = parser.parse_args()
+
+    results = {}
+    for module in MODULES:
+        seconds, heavy = time_import(module, args.runs)
+        results[module] = seconds
+        print(f"⏱️  import {module:<20} {seconds * 1000:7.1f} ms  {', '.join(heavy) or '-'}")
+
+    ms = results['instaload'] * 1000
+    if ms > args.budget:
+        print(f"❌ instaload took {ms:.1f} ms, over the {args.budget:g} ms budget")
+        return 1
+    print(f"✅ instaload imports in {ms:.1f} ms (budget {args.budget:g} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the gallery-dl executable, for offline benchmarks
+Prints synthetic Instagram records instead of talking to Instagram, in the
+same shapes as gallery-dl 1.32: --dump-json prints one indented array of
+[type, ...] messages when the run ends, or one message per line as it goes
+with -o output.jsonl=true; --get-urls prints a URL per line. Tuned with
+environment variables:
+
+    FAKE_GDL_RECORDS      records available on the "profile" (default: 1000)
+    FAKE_GDL_RATE         records per second, 0 for as fast as possible (default: 0)
+    FAKE_GDL_FIRST_DELAY  seconds before the first record, like a profile lookup (default: 0)
+    FAKE_GDL_SEED         random seed (default: 1)
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+from synthetic_records import synthetic_record
+
+FAKE_VERSION = '1.32.16-fake'
+MESSAGE_DIRECTORY = 2
+MESSAGE_URL = 3
+
+
+def requested_range(argv):
+    """Upper bound of --range 1-N, or None"""
+    if '--range' in argv:
+        bounds = argv[argv.index('--range') + 1].split('-')
+        if len(bounds) == 2 and bounds[1]:
+            return int(bounds[1])
+    return None
+
+
+def jsonl_requested(argv):
+    """True if -o output.jsonl=true (or --option) was passed"""
+    for flag, value in zip(argv, argv[1:]):
+        if flag in ('-o', '--option') and value.replace(' ', '').lower() in ('output.jsonl=true', 'output.jsonl=1'):
+            return True
+    return False
+
+
+def messages(record):
+    """gallery-dl's messages for one file: a directory message opening each post, then the URL"""
+    if record['num'] == 1:
+        post = {key: value for key, value in record.items() if key not in ('url', 'display_url', 'width', 'height')}
+        yield [MESSAGE_DIRECTORY, post]
+    yield [MESSAGE_URL, record['url'], record]
+
+
+def main(argv):
+    if '--version' in argv:
+        print(FAKE_VERSION)
+        return 0
+
+    count = int(os.environ.get('FAKE_GDL_RECORDS', '1000'))
+    limit = requested_range(argv)
+    if limit is not None:
+        count = min(count, limit)
+    rate = float(os.environ.get('FAKE_GDL_RATE', '0'))
+    rng = random.Random(int(os.environ.get('FAKE_GDL_SEED', '1')))
+
+    dump = '--dump-json' in argv or '-j' in argv
+    if not dump and '--get-urls' not in argv and '-g' not in argv:
+        return 0  # e.g. --write-info-json runs print nothing on stdout
+    jsonl = dump and jsonl_requested(argv)
+
+    time.sleep(float(os.environ.get('FAKE_GDL_FIRST_DELAY', '0')))
+    start = time.monotonic()
+    out = sys.stdout
+    collected = []
+    for num in range(count):
+        if rate:
+            delay = start + num / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        record = synthetic_record(rng, num)
+        if not dump:
+            out.write(record['url'] + "\n")
+        elif jsonl:
+            for message in messages(record):
+                out.write(json.dumps(message) + "\n")
+        else:
+            collected.extend(messages(record))
+            continue
+        out.flush()  # gallery-dl flushes per line too
+    if dump and not jsonl:
+        # Without output.jsonl nothing is printed until extraction has finished
+        json.dump(collected, out, indent=2)
+        out.write("\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
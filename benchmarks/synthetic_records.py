@@ -0,0 +1,69 @@
+"""
+Synthetic gallery-dl Instagram records for the offline benchmarks
+URLs follow the shape of the signed CDN URLs in minju.csv (efg vencode tag, oe= expiry)
+"""
+
+import base64
+import json
+import time
+
+
+def synthetic_url(rng, width=1440, height=1800):
+    """Signed CDN URL in the shape of the ones in minju.csv"""
+    media_id = f"{rng.randrange(10**8, 10**9)}_{rng.randrange(10**16, 10**17)}_{rng.randrange(10**18, 10**19)}_n"
+    tag = json.dumps({"vencode_tag": f"CAROUSEL_ITEM.image_urlgen.{width}x{height}.sdr.f82787.default_image"},
+                     separators=(',', ':'))
+    efg = base64.urlsafe_b64encode(tag.encode()).decode().rstrip('=')
+    expires = int(time.time()) + 3 * 86400
+    return (f"https://scontent-nrt1-2.cdninstagram.com/v/t51.2885-15/{media_id}.jpg"
+            f"?stp=dst-jpg_e35_tt6&efg={efg}&_nc_ht=scontent-nrt1-2.cdninstagram.com&_nc_cat=107"
+            f"&_nc_ohc={rng.randrange(10**10):x}&_nc_gid={rng.randrange(10**12):x}"
+            f"&edm=AP4sbd4BAAAA&ccb=7-5&oh=00_{rng.randrange(10**20):x}&oe={expires:X}&_nc_sid=7a9f4b")
+
+
+def synthetic_record(rng, num):
+    """One gallery-dl Instagram file record: a few fields we need, lots we don't"""
+    shortcode = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-')
+                        for _ in range(11))
+    url = synthetic_url(rng)
+    return {
+        "category": "instagram",
+        "subcategory": "posts",
+        "post_id": str(rng.randrange(10**18, 10**19)),
+        "post_shortcode": shortcode,
+        "post_url": f"https://www.instagram.com/p/{shortcode}/",
+        "post_date": time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1700000000 - num * 3600)),
+        "date": time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1700000000 - num * 3600)),
+        "pinned": [],
+        "likes": rng.randrange(10**6),
+        "liked": False,
+        "description": " ".join(rng.choice(["today", "🌸", "#ive", "wonyoung", "photo", "love", "✨"])
+                                for _ in range(40)),
+        "tags": ["ive", "wonyoung"],
+        "location_id": None,
+        "username": "for_everyoung10",
+        "fullname": "WONYOUNG",
+        "owner_id": "44404394066",
+        "coauthors": [],
+        "tagged_users": [{"id": str(rng.randrange(10**10)), "username": f"user{i}", "full_name": f"User {i}",
+                          "x": rng.random(), "y": rng.random()} for i in range(3)],
+        "user": {
+            "id": "44404394066", "username": "for_everyoung10", "full_name": "WONYOUNG",
+            "biography": "IVE " * 20, "is_private": False, "is_verified": True,
+            "edge_followed_by": {"count": 12000000}, "edge_follow": {"count": 0},
+            "profile_pic_url": synthetic_url(rng, 320, 320),
+        },
+        "num": num % 10 + 1,
+        "count": 10,
+        "media_id": str(rng.randrange(10**18, 10**19)),
+        "shortcode": shortcode,
+        "display_url": url,
+        "url": url,
+        "_fallback": [synthetic_url(rng, w, int(w * 1.25)) for w in (1080, 750, 640, 480, 320, 240)],
+        "width": 1440,
+        "height": 1800,
+        "video_url": None,
+        "audio_url": None,
+        "extension": "jpg",
+        "filename": url.rsplit('/', 1)[1].split('.')[0],
+    }
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Local companion service for the browser extension
+The extension POSTs the links it scraped to http://127.0.0.1:<port>/jobs and
+this process downloads them concurrently into a ZIP on disk, reporting
+progress as server-sent events. The browser then downloads the finished
+archive like any other file, so its memory use doesn't grow with the profile.
+
+    POST   /jobs                {"links": [...], "name": "profile"}  -> job
+    GET    /jobs, /jobs/<id>    job status
+    GET    /jobs/<id>/events    text/event-stream of progress
+    GET    /jobs/<id>/archive   the finished ZIP
+    DELETE /jobs/<id>           cancel and delete
+
+Only instagram.com and extension IDs given with --extension-id may call it, and
+only links on Instagram's CDN are fetched.
+"""
+
+import argparse
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from archive_writer import ArchiveWriter
+from downloader import CHUNK_SIZE, SessionPool, download_to_archive, filename_for
+from metrics import metrics, start_metrics
+from url_expiry import is_expired, url_expiry
+
+DEFAULT_PORT = 8765
+ALLOWED_ORIGINS = ('https://www.instagram.com',)
+ALLOWED_LINK_HOSTS = ('cdninstagram.com', 'fbcdn.net')
+MAX_REQUEST_BYTES = 32 * 1024 * 1024
+KEEPALIVE_SECONDS = 15
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+def link_allowed(url):
+    """True for http(s) links on Instagram's CDN hosts; anything else could point the service at the LAN"""
+    if not isinstance(url, str):
+        return False
+    try:
+        parsed = urlparse(url)
+        host = (parsed.hostname or '').lower()
+    except ValueError:
+        return False
+    if parsed.scheme not in ('http', 'https'):
+        return False
+    return any(host == domain or host.endswith('.' + domain) for domain in ALLOWED_LINK_HOSTS)
+
+
+class Job:
+    """One link list being downloaded into a ZIP"""
+
+    def __init__(self, links, name, output_dir):
+        self.id = uuid.uuid4().hex[:12]
+        self.links = links
+        self.name = re.sub(r'[^A-Za-z0-9._-]', '_', name or 'instagram')[:64]
+        self.archive = os.path.join(output_dir, f"{self.name}-{time.strftime('%Y%m%d')}-{self.id}.zip")
+        self.status = 'queued'
+        self.downloaded = 0
+        self.failed = 0
+        self.expired = 0
+        self.bytes = 0
+        self.error = None
+        self.created = time.time()
+        self.cancelled = threading.Event()
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        """Change fields and wake up anyone streaming this job's events"""
+        with self.changed:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def count(self, field, amount=1):
+        with self.changed:
+            setattr(self, field, getattr(self, field) + amount)
+            self.version += 1
+            self.changed.notify_all()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "total": len(self.links),
+            "downloaded": self.downloaded,
+            "failed": self.failed,
+            "expired": self.expired,
+            "bytes": self.bytes,
+            "error": self.error,
+            "events": f"/jobs/{self.id}/events",
+            "archive": f"/jobs/{self.id}/archive" if self.status == 'done' else None,
+        }
+
+
+class JobRunner:
+    """Runs jobs one after another, each with a bounded pool of download workers
+
+    Workers buffer each response and add it to the job's ZIP (see
+    archive_writer), so no loose files are left to zip afterwards. Memory is
+    capped at workers x SPOOL_SIZE; bodies bigger than that go through a
+    temp file and are written to disk twice.
+    """
+
+    def __init__(self, output_dir, workers=8):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, links, name=None):
+        job = Job(links, name, self.output_dir)
+        with self._lock:
+            self.jobs[job.id] = job
+        self._queue.put(job)
+        metrics.incr('companion_jobs')
+        print(f"📥 Job {job.id}: {len(links)} links for {job.name}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def all(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def remove(self, job_id):
+        """Cancel a job and delete its archive"""
+        with self._lock:
+            job = self.jobs.pop(job_id, None)
+        if job is None:
+            return False
+        job.cancelled.set()
+        if job.status not in FINISHED:
+            job.update(status='cancelled')
+        else:
+            for path in (job.archive, job.archive + '.part'):
+                if os.path.exists(path):
+                    os.remove(path)
+        return True
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            if job.cancelled.is_set():
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                job.update(status='failed', error=str(e))
+                print(f"❌ Job {job.id} failed: {e}")
+
+    def _run(self, job):
+        job.update(status='downloading')
+        pool = SessionPool(pool_size=self.workers)
+        archive = ArchiveWriter(job.archive, 'zip')
+        start = time.monotonic()
+
+        def fetch(index, url):
+            return download_to_archive(pool, url, archive, filename_for(index, url))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                pending = {}
+                items = iter(enumerate(job.links, 1))
+                while True:
+                    # Keep at most 2x workers submitted, like downloader.download_all
+                    while len(pending) < self.workers * 2 and not job.cancelled.is_set():
+                        item = next(items, None)
+                        if item is None:
+                            break
+                        index, url = item
+                        if is_expired(url_expiry(url), margin=0):
+                            job.count('expired')
+                            continue
+                        pending[executor.submit(fetch, index, url)] = (index, url)
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, url = pending.pop(future)
+                        try:
+                            _, size = future.result()
+                        except Exception as e:
+                            job.count('failed')
+                            print(f"  ✗ {index}: {e}")
+                            continue
+                        with job.changed:
+                            job.downloaded += 1
+                            job.bytes += size
+                            job.version += 1
+                            job.changed.notify_all()
+        except BaseException:
+            archive.abort()
+            raise
+        finally:
+            pool.close()
+        if job.cancelled.is_set():
+            archive.abort()
+            return
+        archive.close()
+
+        seconds = time.monotonic() - start
+        print(f"✅ Job {job.id}: {job.downloaded}/{len(job.links)} files, {job.bytes / 1e6:.1f} MB "
+              f"in {seconds:.1f}s → {job.archive}")
+        job.update(status='done')
+
+
+def make_handler(runner, allowed_origins=ALLOWED_ORIGINS):
+    """Request handler class bound to a JobRunner"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _origin_allowed(self):
+            origin = self.headers.get('Origin')
+            if origin is None:
+                # Only the archive download is a plain navigation without an Origin;
+                # it needs the job's unguessable id anyway
+                return self.command == 'GET' and self._route()[1] == 'archive'
+            return origin in allowed_origins
+
+        def _cors_headers(self):
+            origin = self.headers.get('Origin')
+            if origin and self._origin_allowed():
+                self.send_header('Access-Control-Allow-Origin', origin)
+                self.send_header('Vary', 'Origin')
+
+        def _send_json(self, status, data):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self._cors_headers()
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _route(self):
+            """(job or None, trailing path part) for /jobs/<id>[/part]"""
+            parts = self.path.split('?', 1)[0].strip('/').split('/')
+            if len(parts) < 2 or parts[0] != 'jobs':
+                return None, None
+            return runner.get(parts[1]), parts[2] if len(parts) > 2 else ''
+
+        def do_OPTIONS(self):
+            if not self._origin_allowed():
+                self.send_error(403)
+                return
+            self.send_response(204)
+            self._cors_headers()
+            self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+            # Chrome asks before a public site may talk to a localhost server
+            self.send_header('Access-Control-Allow-Private-Network', 'true')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_POST(self):
+            if not self._origin_allowed():
+                self.send_error(403)
+                return
+            if self.path.split('?', 1)[0].rstrip('/') != '/jobs':
+                self.send_error(404)
+                return
+            length = int(self.headers.get('Content-Length') or 0)
+            if not 0 < length <= MAX_REQUEST_BYTES:
+                self.send_error(413 if length else 400)
+                return
+            try:
+                payload = json.loads(self.rfile.read(length))
+                links = [url for url in payload['links'] if link_allowed(url)]
+                skipped = len(payload['links']) - len(links)
+            except (ValueError, KeyError, TypeError):
+                self._send_json(400, {"error": "expected {\"links\": [...]}"})
+                return
+            if not links:
+                self._send_json(400, {"error": f"no links on {' or '.join(ALLOWED_LINK_HOSTS)}"})
+                return
+            if skipped:
+                print(f"⚠️  Skipped {skipped} links outside {' / '.join(ALLOWED_LINK_HOSTS)}")
+            job = runner.submit(links, payload.get('name'))
+            self._send_json(202, job.to_dict())
+
+        def do_DELETE(self):
+            if not self._origin_allowed():
+                self.send_error(403)
+                return
+            job, _ = self._route()
+            if job is None or not runner.remove(job.id):
+                self._send_json(404, {"error": "no such job"})
+                return
+            self._send_json(200, {"id": job.id, "status": job.status})
+
+        def do_GET(self):
+            if not self._origin_allowed():
+                self.send_error(403)
+                return
+            path = self.path.split('?', 1)[0].rstrip('/')
+            if path in ('', '/health'):
+                self._send_json(200, {"ok": True, "jobs": len(runner.all())})
+                return
+            if path == '/jobs':
+                self._send_json(200, [job.to_dict() for job in runner.all()])
+                return
+            job, part = self._route()
+            if job is None:
+                self._send_json(404, {"error": "no such job"})
+            elif part == '':
+                self._send_json(200, job.to_dict())
+            elif part == 'events':
+                self._stream_events(job)
+            elif part == 'archive':
+                self._send_archive(job)
+            else:
+                self.send_error(404)
+
+        def _stream_events(self, job):
+            self.send_response(200)
+            self._cors_headers()
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            seen = -1
+            try:
+                while True:
+                    with job.changed:
+                        job.changed.wait_for(lambda: job.version != seen, timeout=KEEPALIVE_SECONDS)
+                        changed = job.version != seen
+                        seen = job.version
+                        state = job.to_dict()
+                    if not changed:
+                        self.wfile.write(b": keep-alive\n\n")
+                    else:
+                        event = 'done' if state['status'] in FINISHED else 'progress'
+                        self.wfile.write(f"event: {event}\ndata: {json.dumps(state)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    if state['status'] in FINISHED:
+                        return
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the tab went away; the job carries on
+
+        def _send_archive(self, job):
+            if job.status != 'done' or not os.path.exists(job.archive):
+                self._send_json(409, {"error": f"job is {job.status}"})
+                return
+            self.send_response(200)
+            self._cors_headers()
+            self.send_header('Content-Type', 'application/zip')
+            self.send_header('Content-Length', str(os.path.getsize(job.archive)))
+            self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(job.archive)}"')
+            self.end_headers()
+            try:
+                with open(job.archive, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, format, *args):
+            pass  # jobs print their own progress
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download and zip link lists sent by the browser extension')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port on 127.0.0.1 (default: {DEFAULT_PORT})')
+    parser.add_argument('--output-dir', default='companion_jobs', help='Where archives are written (default: companion_jobs)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent downloads per job (default: 8)')
+    parser.add_argument('--allow-origin', action='append', default=[],
+                        help='Extra page origin allowed to submit jobs (repeatable)')
+    parser.add_argument('--extension-id', action='append', default=[],
+                        help="ID of the browser extension allowed to call the service, as shown on "
+                             "chrome://extensions (repeatable; its content script on instagram.com needs none)")
+    parser.add_argument('--metrics', metavar='FILE', help='Write run metrics (timers, counters) as JSON to FILE at exit')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus-style metrics on 127.0.0.1:PORT while running')
+    args = parser.parse_args()
+    start_metrics(args.metrics, args.metrics_port)
+
+    runner = JobRunner(args.output_dir, workers=args.workers)
+    extension_origins = tuple(f"chrome-extension://{extension_id}" for extension_id in args.extension_id)
+    handler = make_handler(runner, ALLOWED_ORIGINS + tuple(args.allow_origin) + extension_origins)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), handler)
+    server.daemon_threads = True
+    print(f"🚀 Companion service on http://127.0.0.1:{args.port} (archives in {args.output_dir}/)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopping")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Thumbnail / derivative generation for downloaded media
+Turns every image in a download directory into resized WebP (or JPEG)
+derivatives, one sub-directory per size. Decoding, resizing and encoding are
+CPU bound, so files are spread over a process pool with a bounded number in
+flight; files whose derivatives are already up to date are skipped without
+being opened.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_SIZES = (320, 640)
+FORMATS = {'webp': '.webp', 'jpeg': '.jpg'}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def derivative_path(out_dir, src, size, fmt):
+    """e.g. thumbs/320/513876204_..._n.webp"""
+    stem = os.path.splitext(os.path.basename(src))[0]
+    return os.path.join(out_dir, str(size), stem + FORMATS[fmt])
+
+
+def missing_sizes(src, out_dir, sizes, fmt):
+    """Sizes whose derivative doesn't exist yet or is older than src"""
+    src_mtime = os.path.getmtime(src)
+    missing = []
+    for size in sizes:
+        try:
+            if os.path.getmtime(derivative_path(out_dir, src, size, fmt)) >= src_mtime:
+                continue
+        except OSError:
+            pass
+        missing.append(size)
+    return missing
+
+
+def make_derivatives(src, out_dir, sizes, fmt='webp', quality=80):
+    """Write src's derivatives for `sizes` (longest edge in px); runs in a worker process
+
+    The source is decoded once, at reduced scale when the format allows it (JPEG
+    draft mode), and each size is resized from the previous, larger one.
+    Returns the bytes written.
+    """
+    written = 0
+    with Image.open(src) as image:
+        image.draft('RGB', (max(sizes), max(sizes)))
+        image = image.convert('RGB')
+        for size in sorted(sizes, reverse=True):
+            image.thumbnail((size, size), Image.LANCZOS)
+            dest = derivative_path(out_dir, src, size, fmt)
+            part = dest + '.part'
+            image.save(part, format=fmt.upper(), quality=quality, **({'method': 4} if fmt == 'webp' else {}))
+            os.replace(part, dest)
+            written += os.path.getsize(dest)
+    return written
+
+
+def generate_derivatives(paths, out_dir, sizes=DEFAULT_SIZES, fmt='webp', quality=80, workers=None,
+                         max_in_flight=None, verbose=False):
+    """Make derivatives for the given image paths on a process pool; returns a stats dict
+
+    Only paths (not pixels) cross the process boundary and at most max_in_flight
+    files are queued at once, so memory stays flat however many files there are.
+    """
+    if Image is None:
+        raise RuntimeError("Derivatives need Pillow (pip install pillow)")
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    for size in sizes:
+        os.makedirs(os.path.join(out_dir, str(size)), exist_ok=True)
+    stats = {"processed": 0, "skipped": 0, "failed": 0, "bytes": 0, "errors": []}
+    start = time.monotonic()
+
+    def collect(done):
+        for future in done:
+            src = pending.pop(future)
+            try:
+                stats["bytes"] += future.result()
+                stats["processed"] += 1
+                if verbose:
+                    print(f"  🖼️  {os.path.basename(src)}")
+            except Exception as e:
+                stats["failed"] += 1
+                if len(stats["errors"]) < 20:
+                    stats["errors"].append(f"{os.path.basename(src)}: {e}")
+
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for src in paths:
+            needed = missing_sizes(src, out_dir, sizes, fmt)
+            if not needed:
+                stats["skipped"] += 1
+                continue
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(make_derivatives, src, out_dir, needed, fmt, quality)] = src
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    stats["seconds"] = round(time.monotonic() - start, 3)
+    return stats
+
+
+def image_files(directory):
+    """Image files directly inside a download directory, sorted by name"""
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(IMAGE_EXTENSIONS) and not name.endswith('.part')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Make WebP thumbnails / resized derivatives of downloaded images')
+    parser.add_argument('directory', help='Download directory (e.g. downloads)')
+    parser.add_argument('--output-dir', help='Where derivatives go, one sub-directory per size (default: DIRECTORY/derivatives)')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help=f"Comma-separated longest-edge sizes in px (default: {','.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='webp', help='Derivative format (default: webp)')
+    parser.add_argument('--quality', type=int, default=80, help='Encoder quality (default: 80)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU core)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Print every processed file')
+    args = parser.parse_args()
+
+    try:
+        sizes = sorted({int(size) for size in args.sizes.split(',') if size.strip()})
+    except ValueError:
+        print(f"❌ --sizes must be comma-separated numbers, got {args.sizes}")
+        return 1
+    if not os.path.isdir(args.directory):
+        print(f"❌ Directory not found: {args.directory}")
+        return 1
+    out_dir = args.output_dir or os.path.join(args.directory, 'derivatives')
+
+    paths = image_files(args.directory)
+    workers = args.workers or os.cpu_count() or 1
+    print(f"🚀 Making {'/'.join(map(str, sizes))}px {args.format} derivatives of {len(paths)} images "
+          f"with {workers} processes")
+    try:
+        stats = generate_derivatives(paths, out_dir, sizes, args.format, args.quality, workers, verbose=args.verbose)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+    seconds = stats["seconds"] or 1e-9
+    print(f"\n📊 Derivative results:")
+    print(f"   ✓ Processed: {stats['processed']} images ({stats['bytes'] / 1e6:.1f} MB written)")
+    print(f"   ↷ Skipped (up to date): {stats['skipped']}")
+    if stats["failed"]:
+        print(f"   ✗ Failed: {stats['failed']}")
+        for error in stats["errors"][:5]:
+            print(f"      {error}")
+    print(f"   ⏱  {stats['seconds']}s, {stats['processed'] / seconds:.1f} images/s → {out_dir}/")
+    return 0 if not stats["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
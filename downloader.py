@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Concurrent media downloader for extracted URL lists
+Reads the index,url CSVs written by the extractors (or minju.csv style files)
+and fetches the media with a bounded thread pool and keep-alive sessions per CDN host
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from archive_writer import SPOOL_SIZE, ArchiveWriter, archive_format, spool
+from gallery_dl_stream import DUMP_JSON, GalleryDLStream, CSV_HEADER, extract_record_url, format_csv_row
+from media_index import MediaIndex, media_key
+from metrics import metrics, instrument_session, start_metrics
+from output_formats import format_for_path, read_rows
+from url_expiry import url_expiry, is_expired, schedule_by_expiry
+from validator_cache import ValidatorCache, Validators
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+CHUNK_SIZE = 64 * 1024
+RESUME_ATTEMPTS = 3
+
+
+def read_url_rows(path):
+    """Yield {index, url, shortcode, expires, width, height} rows from an extractor CSV
+
+    Handles the extractors' index,url,shortcode,expires[,width,height] files as well as plain
+    index,url lists without a header such as minju.csv. JSONL, SQLite, Parquet
+    and Arrow outputs (--format) are read by extension.
+    """
+    if format_for_path(path) != 'csv':
+        yield from read_rows(path)
+        return
+    columns = ['index', 'url']
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or ',' not in line:
+                continue
+            if line.startswith('index,'):
+                columns = line.split(',')
+                continue
+            extra = len(columns) - 2
+            if extra > 0:
+                parts = line.rsplit(',', extra)
+                index, url = parts[0].split(',', 1)
+                values = dict(zip(columns[2:], parts[1:]))
+            else:
+                index, url = line.split(',', 1)
+                values = {}
+            url = url.strip()
+            if not url.startswith('http'):
+                continue  # junk
+            index = index.strip()
+            expires, width, height = (values.get(key, '').strip() for key in ('expires', 'width', 'height'))
+            yield {
+                "index": int(index) if index.isdigit() else line_num,
+                "url": url,
+                "shortcode": values.get('shortcode', '').strip() or None,
+                "expires": int(expires) if expires.isdigit() else url_expiry(url),
+                "width": int(width) if width.isdigit() else None,
+                "height": int(height) if height.isdigit() else None,
+            }
+
+
+def read_url_list(path):
+    """Yield (index, url) from an extractor CSV"""
+    for row in read_url_rows(path):
+        yield row['index'], row['url']
+
+
+def write_url_rows(rows, path):
+    """Save rows back out in the extractor CSV format"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(CSV_HEADER + "\n")
+        for row in rows:
+            f.write(format_csv_row(row['index'], row['url'], row.get('shortcode'),
+                                   row.get('width'), row.get('height')) + "\n")
+
+
+def filename_for(index, url):
+    """Local file name for a media URL, e.g. 513876204_..._n.jpg"""
+    name = os.path.basename(urlparse(url).path)
+    if not name or '.' not in name:
+        name = f"{index}.jpg"
+    return name
+
+
+class SessionPool:
+    """One pooled keep-alive requests.Session per CDN host"""
+
+    def __init__(self, pool_size=16, timeout=30.0):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                # Keep as many idle connections as there are workers so none get discarded
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['User-Agent'] = USER_AGENT
+                instrument_session(session)
+                self._sessions[host] = session
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+def download_one(pool, url, dest, validators=None, revalidate=False):
+    """Stream one URL to dest via a .part file; returns the number of bytes fetched
+
+    A .part left by an interrupted run (or a dropped connection) is continued
+    with a Range request, guarded by If-Range so a changed object starts over.
+    With revalidate and known validators, an existing dest is checked with a
+    conditional request instead; None is returned if it was unchanged. dest
+    only appears once the .part is complete, via an atomic rename.
+    """
+    part = dest + '.part'
+    session = pool.get(url)
+    known = validators.get(url) if validators else None
+    fetched = 0
+    conditional = revalidate and known and os.path.exists(dest)
+
+    for attempt in range(RESUME_ATTEMPTS):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {}
+        if conditional:
+            headers = known.conditional_headers()
+        elif offset:
+            headers['Range'] = f"bytes={offset}-"
+            if known and known.if_range():
+                headers['If-Range'] = known.if_range()
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=pool.timeout) as response:
+                if response.status_code == 304 and conditional:
+                    metrics.incr('not_modified')
+                    return None
+                conditional = False  # changed (or the retry of a changed file): a plain fetch from here on
+                if response.status_code == 416 and known and known.length == offset:
+                    break  # the .part was already complete when we were interrupted
+                if response.status_code == 416:
+                    os.remove(part)  # server doesn't recognise our offset; start over
+                    continue
+                response.raise_for_status()
+                resumed = (response.status_code == 206 and
+                           response.headers.get('Content-Range', '').startswith(f"bytes {offset}-"))
+                if resumed:
+                    metrics.incr('resumed_downloads')
+                    metrics.incr('resumed_bytes', offset)
+                known = Validators.from_response(response)
+                if validators:
+                    validators.put(url, known)
+                with open(part, 'ab' if resumed else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        fetched += len(chunk)
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError):
+            if attempt == RESUME_ATTEMPTS - 1:
+                raise  # the .part stays for the next run to resume
+            continue
+        if known.length is None or os.path.getsize(part) == known.length:
+            break
+    else:
+        size = os.path.getsize(part) if os.path.exists(part) else 0
+        raise IOError(f"incomplete download after {RESUME_ATTEMPTS} attempts: {size} bytes")
+
+    os.replace(part, dest)
+    metrics.incr('files_downloaded')
+    metrics.incr('bytes_written', fetched)
+    return fetched
+
+
+def download_to_archive(pool, url, archive, name):
+    """Buffer one URL's body (see archive_writer.spool) and add it as an ArchiveWriter entry; returns (entry name, bytes)"""
+    session = pool.get(url)
+    with session.get(url, stream=True, timeout=pool.timeout) as response, spool() as body:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            body.write(chunk)
+        size = body.tell()
+        body.seek(0)
+        name = archive.add(name, body, size)
+    metrics.incr('files_downloaded')
+    return name, size
+
+
+def re_resolve(rows, cookies=None, timeout=300):
+    """Fetch fresh signed URLs for expired rows from their post shortcodes
+
+    Returns (fresh rows, rows that couldn't be re-resolved). Only media that had
+    actually expired comes back, even though gallery-dl lists the whole post.
+    """
+    wanted = {}
+    unresolved = []
+    for row in rows:
+        if row.get('shortcode'):
+            wanted.setdefault(row['shortcode'], {})[media_key(row['url'])] = row
+        else:
+            unresolved.append(row)
+
+    fresh = []
+    for shortcode, by_key in wanted.items():
+        cmd = ['gallery-dl', '--no-download', *DUMP_JSON, '--quiet']
+        if cookies:
+            cmd.extend(['--cookies', cookies])
+        cmd.append(f"https://www.instagram.com/p/{shortcode}/")
+        try:
+            with GalleryDLStream(cmd, timeout=timeout) as stream:
+                for line_num, data in stream.records():
+                    url = extract_record_url(data)
+                    old = by_key.pop(media_key(url), None) if url else None
+                    if old:
+                        fresh.append(dict(old, url=url, expires=url_expiry(url)))
+        except Exception as e:
+            print(f"⚠️  Could not re-resolve post {shortcode}: {e}")
+        unresolved.extend(by_key.values())
+
+    return fresh, unresolved
+
+
+def check_repost(reposts, url, dest):
+    """Hash a fresh download and drop it if it's a near-duplicate of known media
+
+    Returns the (key, path, distance) of the image it duplicates, or None. Files
+    that aren't images (videos) or can't be decoded are kept and not indexed.
+    """
+    from repost_index import phash  # reposts is a RepostIndex, so it is already loaded
+    try:
+        with metrics.phase('phash'):
+            value = phash(dest)
+    except OSError:
+        return None
+    match = reposts.check(media_key(url), value, dest)
+    if match:
+        os.remove(dest)
+        metrics.incr('reposts')
+    return match
+
+
+def download_all(items, output_dir, workers=16, max_in_flight=None, skip_existing=True, verbose=False,
+                 media_index=None, validators=None, revalidate=False, reposts=None, archive=None):
+    """Download (index, url) items concurrently and return a stats dict
+
+    At most max_in_flight items are submitted to the pool at once, so even
+    a million-row CSV never builds a million pending futures. When a MediaIndex
+    is given, media it already knows as downloaded is skipped whatever its URL.
+    With a ValidatorCache and revalidate, files already on disk are checked
+    with a conditional request and only fetched again if they changed. With a
+    RepostIndex, fresh downloads that are near-duplicates of known images are
+    deleted again and listed in stats["reposts"]. With an ArchiveWriter, media
+    goes straight into the archive instead of into output_dir, and is only
+    marked in the MediaIndex once the archive has been closed.
+    """
+    if archive is None:
+        os.makedirs(output_dir, exist_ok=True)
+    max_in_flight = max_in_flight or workers * 2
+    slots = threading.BoundedSemaphore(max_in_flight)
+    stats = {"downloaded": 0, "skipped": 0, "expired": 0, "failed": 0, "bytes": 0, "errors": [],
+             "expired_urls": [], "reposts": []}
+    stats_lock = threading.Lock()
+    pool = SessionPool(pool_size=workers)
+    start = time.monotonic()
+
+    def task(index, url):
+        try:
+            if media_index and media_index.is_downloaded(url):
+                with stats_lock:
+                    stats["skipped"] += 1
+                return
+            # The queue may have outlived the signature; don't spend a connection on a sure 403
+            if is_expired(url_expiry(url), margin=0):
+                with stats_lock:
+                    stats["expired"] += 1
+                    stats["expired_urls"].append(url)
+                return
+            if archive is not None:
+                with metrics.phase('download'):
+                    name, size = download_to_archive(pool, url, archive, filename_for(index, url))
+                if media_index:
+                    # Only once the archive is complete; a killed run leaves nothing but a .part
+                    archive.when_closed(lambda url=url, path=os.path.join(archive.path, name), size=size:
+                                        media_index.mark_downloaded(url, path, size))
+                with stats_lock:
+                    stats["downloaded"] += 1
+                    stats["bytes"] += size
+                if verbose:
+                    print(f"  📦 {index}: {name} ({size} bytes)")
+                return
+            dest = os.path.join(output_dir, filename_for(index, url))
+            if skip_existing and os.path.exists(dest) and not (revalidate and validators and validators.get(url)):
+                if media_index:
+                    media_index.mark_downloaded(url, dest, os.path.getsize(dest))
+                with stats_lock:
+                    stats["skipped"] += 1
+                return
+            with metrics.phase('download'):
+                size = download_one(pool, url, dest, validators, revalidate and skip_existing)
+            if size is None:
+                with stats_lock:
+                    stats["skipped"] += 1
+                return
+            match = check_repost(reposts, url, dest) if reposts is not None else None
+            if match:
+                if media_index and match[1] and os.path.exists(match[1]):
+                    # Already on disk, just under the original's name
+                    media_index.mark_downloaded(url, match[1], os.path.getsize(match[1]))
+                with stats_lock:
+                    stats["reposts"].append((url, match[1] or match[0], match[2]))
+                    stats["bytes"] += size
+                if verbose:
+                    print(f"  ♻️  {index}: repost of {match[1] or match[0]} ({match[2]} bits apart)")
+                return
+            if media_index:
+                media_index.mark_downloaded(url, dest, os.path.getsize(dest))
+            with stats_lock:
+                stats["downloaded"] += 1
+                stats["bytes"] += size
+            if verbose:
+                print(f"  📥 {index}: {os.path.basename(dest)} ({size} bytes)")
+        except requests.HTTPError as e:
+            with stats_lock:
+                if e.response is not None and e.response.status_code == 403 and url_expiry(url):
+                    stats["expired"] += 1
+                    stats["expired_urls"].append(url)
+                else:
+                    stats["failed"] += 1
+                    if len(stats["errors"]) < 20:
+                        stats["errors"].append(f"{index}: {e}")
+        except Exception as e:
+            with stats_lock:
+                stats["failed"] += 1
+                if len(stats["errors"]) < 20:
+                    stats["errors"].append(f"{index}: {e}")
+        finally:
+            slots.release()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for index, url in items:
+                slots.acquire()
+                executor.submit(task, index, url)
+    finally:
+        pool.close()
+
+    stats["seconds"] = round(time.monotonic() - start, 3)
+    return stats
+
+
+def display_stats(stats):
+    """Print a download summary"""
+    seconds = stats["seconds"] or 1e-9
+    print(f"\n📊 Download results:")
+    print(f"   ✓ Downloaded: {stats['downloaded']} files ({stats['bytes'] / 1e6:.1f} MB)")
+    print(f"   ↷ Skipped (already on disk or unchanged): {stats['skipped']}")
+    if stats["expired"]:
+        print(f"   ⌛ Expired signed URLs: {stats['expired']}")
+    if stats["reposts"]:
+        print(f"   ♻️  Reposts of media already on disk (not kept): {len(stats['reposts'])}")
+    if stats["failed"]:
+        print(f"   ✗ Failed: {stats['failed']}")
+        for error in stats["errors"][:5]:
+            print(f"      {error}")
+    print(f"   ⏱  {stats['seconds']}s, {stats['downloaded'] / seconds:.1f} files/s, "
+          f"{stats['bytes'] / 1e6 / seconds:.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download media listed in an index,url CSV')
+    parser.add_argument('csv', help='Extractor output with index,url rows (e.g. urls.csv, minju.csv or urls.parquet)')
+    parser.add_argument('--output-dir', default='downloads', help='Directory to save media into (default: downloads)')
+    parser.add_argument('--workers', type=int, default=16, help='Concurrent downloads (default: 16)')
+    parser.add_argument('--max-in-flight', type=int, help='Maximum queued + running downloads (default: 2x workers)')
+    parser.add_argument('--no-skip', action='store_true', help='Re-download files that already exist')
+    parser.add_argument('--index', help='Media index database; media already downloaded under any URL is skipped')
+    parser.add_argument('--validators', help='ETag/Last-Modified cache used to resume and revalidate downloads '
+                                             '(default: OUTPUT_DIR/.validators.sqlite3)')
+    parser.add_argument('--revalidate', action='store_true',
+                        help='Check files already on disk with a conditional request and re-fetch the ones that changed')
+    parser.add_argument('--re-resolve', action='store_true',
+                        help='Fetch fresh URLs for expired media from their post shortcodes (needs gallery-dl)')
+    parser.add_argument('--cookies', help='Cookies file passed to gallery-dl when re-resolving')
+    parser.add_argument('--archive', metavar='PATH',
+                        help='Write media into this .zip or .tar instead of files in --output-dir '
+                             f'(bodies over {SPOOL_SIZE // 2**20} MB are written to a temp file first)')
+    parser.add_argument('--reposts', metavar='INDEX',
+                        help='Perceptual-hash index; downloads that are near-duplicates of known images are not kept')
+    parser.add_argument('--repost-distance', type=int, default=6,
+                        help='Bits two image hashes may differ by and still count as a repost (default: 6)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Print every downloaded file')
+    parser.add_argument('--metrics', metavar='FILE', help='Write run metrics (timers, counters) as JSON to FILE at exit')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus-style metrics on 127.0.0.1:PORT while running')
+    args = parser.parse_args()
+    start_metrics(args.metrics, args.metrics_port)
+
+    if not os.path.exists(args.csv):
+        print(f"❌ CSV file not found: {args.csv}")
+        return 1
+
+    if args.archive:
+        try:
+            archive_format(args.archive)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        if args.reposts or args.revalidate:
+            print("❌ --archive can't be combined with --reposts or --revalidate")
+            return 1
+        if os.path.exists(args.archive):
+            print(f"❌ {args.archive} already exists; pick a new --archive name")
+            return 1
+
+    rows = list(read_url_rows(args.csv))
+    live, expired = schedule_by_expiry(rows)
+    print(f"🚀 Downloading {len(live)} media from {args.csv} into {args.archive or args.output_dir + '/'} "
+          f"with {args.workers} workers")
+    if expired:
+        print(f"⌛ {len(expired)} of {len(rows)} URLs have already expired and won't be requested")
+
+    index = MediaIndex(args.index) if args.index else None
+    if args.archive:
+        validators = None
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        validators = ValidatorCache(args.validators or os.path.join(args.output_dir, '.validators.sqlite3'))
+    try:
+        reposts = None
+        if args.reposts:
+            # numpy and Pillow only matter for repost detection; don't pay for importing them otherwise
+            from repost_index import RepostIndex
+            reposts = RepostIndex(args.reposts, args.repost_distance)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    options = dict(workers=args.workers, max_in_flight=args.max_in_flight, skip_existing=not args.no_skip,
+                   verbose=args.verbose, media_index=index, validators=validators, revalidate=args.revalidate,
+                   reposts=reposts)
+    archive = options['archive'] = ArchiveWriter(args.archive) if args.archive else None
+    try:
+        # Earliest deadline first, so nothing expires while later URLs hog the workers
+        stats = download_all(((row['index'], row['url']) for row in live), args.output_dir, **options)
+        display_stats(stats)
+        failed = stats["failed"]
+
+        # Anything that expired while queued joins the expired set
+        by_url = {row['url']: row for row in live}
+        expired.extend(by_url[url] for url in stats["expired_urls"] if url in by_url)
+
+        if expired and args.re_resolve:
+            print(f"\n🔁 Re-resolving {len(expired)} expired URLs from their posts...")
+            fresh, expired = re_resolve(expired, cookies=args.cookies)
+            fresh, still_expired = schedule_by_expiry(fresh)
+            expired.extend(still_expired)
+            if fresh:
+                retry = download_all(((row['index'], row['url']) for row in fresh), args.output_dir, **options)
+                display_stats(retry)
+                failed += retry["failed"]
+    finally:
+        if archive is not None:
+            archive.close()
+            print(f"\n📦 {archive.count} files ({archive.bytes / 1e6:.1f} MB) in {args.archive}")
+        if validators is not None:
+            validators.close()
+        if reposts is not None:
+            reposts.close()
+        if index:
+            index.close()
+
+    if expired:
+        expired_path = os.path.splitext(args.csv)[0] + '_expired.csv'
+        write_url_rows(expired, expired_path)
+        print(f"\n⌛ {len(expired)} expired URLs saved to {expired_path}")
+        if not args.re_resolve:
+            print("💡 Re-run with --re-resolve to fetch fresh URLs for them")
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -416,8 +416,8 @@ function showModal(links, errors = []) {
     // Download ZIP button (JSZip)
     const zipBtn = document.createElement("button");
     zipBtn.id = "ig-getall-zip";
-    zipBtn.textContent = "Download ZIP (JSZip)";
-    zipBtn.onclick = async () => downloadAsZipJszip(links, zipBtn);
+    zipBtn.textContent = "Download ZIP";
+    zipBtn.onclick = async () => downloadAsZip(links, zipBtn);
     modal.appendChild(zipBtn);
 
     // Download TXT button
@@ -622,6 +622,87 @@ function downloadAsTxt(links, button) {
   }
 }
 
+// == ZIP via the local companion service (companion_service.py) ==
+// The service downloads and zips on disk; the tab only watches progress and then
+// downloads the finished archive like any other file, so memory stays flat.
+const COMPANION_URL = "http://127.0.0.1:8765";
+
+async function companionAvailable() {
+  try {
+    const controller = new AbortController();
+    setTimeout(() => controller.abort(), 1000);
+    const response = await fetch(`${COMPANION_URL}/health`, { signal: controller.signal });
+    return response.ok;
+  } catch (error) {
+    return false;
+  }
+}
+
+async function downloadViaCompanion(links, button) {
+  const originalText = button.textContent;
+  button.disabled = true;
+  button.textContent = "Sending to companion...";
+  try {
+    const profile = window.location.pathname.split("/").filter(Boolean)[0];
+    const response = await fetch(`${COMPANION_URL}/jobs`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ links, name: profile }),
+    });
+    if (!response.ok) throw new Error(`Companion service: HTTP ${response.status}`);
+    const job = await response.json();
+    debugLog("Companion job started:", job);
+
+    const finished = await new Promise((resolve, reject) => {
+      const events = new EventSource(`${COMPANION_URL}${job.events}`);
+      events.addEventListener("progress", (event) => {
+        const state = JSON.parse(event.data);
+        button.textContent = `Downloading ${state.downloaded + state.failed}/${state.total}...`;
+      });
+      events.addEventListener("done", (event) => {
+        events.close();
+        resolve(JSON.parse(event.data));
+      });
+      events.onerror = () => {
+        events.close();
+        reject(new Error("Lost connection to the companion service"));
+      };
+    });
+    if (finished.status !== "done") {
+      throw new Error(finished.error || `Companion job ${finished.status}`);
+    }
+
+    // A plain navigation download streams to disk instead of into a Blob
+    const a = document.createElement("a");
+    a.href = `${COMPANION_URL}${finished.archive}`;
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+    button.textContent = `Downloaded! (${finished.downloaded}/${finished.total})`;
+    setTimeout(() => {
+      button.textContent = originalText;
+      button.disabled = false;
+    }, 4000);
+  } catch (error) {
+    button.textContent = originalText;
+    button.disabled = false;
+    throw error;
+  }
+}
+
+// Prefer the companion service; fall back to building the ZIP in the tab
+async function downloadAsZip(links, button) {
+  if (await companionAvailable()) {
+    try {
+      await downloadViaCompanion(links, button);
+      return;
+    } catch (error) {
+      debugLog("Companion download failed, falling back to JSZip:", error);
+    }
+  }
+  await downloadAsZipJszip(links, button);
+}
+
 // == Enhanced ZIP Download with Better Error Handling ==
 async function downloadAsZipJszip(links, button) {
   const originalText = button.textContent;
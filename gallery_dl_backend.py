@@ -0,0 +1,167 @@
+"""
+In-process gallery-dl backend
+Drives gallery-dl's extractors directly and yields plain dicts: no process spawn,
+no temp config file and no JSON round-trip. Mirrors GalleryDLStream's interface so
+callers can fall back to the subprocess path when gallery-dl isn't importable.
+"""
+
+import copy
+import threading
+import time
+
+try:
+    from gallery_dl import config as gdl_config
+    from gallery_dl import extractor as gdl_extractor
+    from gallery_dl.extractor.message import Message
+    from gallery_dl.version import __version__ as GALLERY_DL_VERSION
+except ImportError:
+    gdl_config = gdl_extractor = Message = GALLERY_DL_VERSION = None
+
+from http_cache import cache_session
+from metrics import metrics, instrument_session
+
+# gallery-dl keeps its configuration in a module global that extractors read
+# while they run, so it is loaded once and never swapped. Each run gets its own
+# copy with its options merged in, and its extractors read that copy instead.
+_config_lock = threading.Lock()
+_base_configs = {}
+
+
+def available():
+    """True if gallery-dl can be imported into this process"""
+    return gdl_extractor is not None
+
+
+def _merge(target, source):
+    """Recursively merge source into target, source winning on conflicts"""
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _base_config(config_files=None):
+    """The user's gallery-dl config files (as the CLI loads them) plus config_files, loaded once per process"""
+    key = tuple(config_files or ())
+    with _config_lock:
+        if not _base_configs:
+            gdl_config.load()  # into gallery-dl's globals too, for the few places that read them directly
+        base = _base_configs.get(key)
+        if base is None:
+            base = copy.deepcopy(gdl_config._config)
+            if config_files:
+                gdl_config.load(config_files, strict=True, conf=base)
+            _base_configs[key] = base
+        return base
+
+
+def run_config(config=None, config_files=None, cookies=None):
+    """One run's config: the base config with `config` (same layout as gallery-dl's JSON config) merged in"""
+    conf = copy.deepcopy(_base_config(config_files))
+    _merge(conf, copy.deepcopy(config or {}))
+    if cookies:
+        conf.setdefault("extractor", {})["cookies"] = cookies
+    return conf
+
+
+def _bind_config(extr, conf):
+    """Point an extractor's config lookups at one run's config instead of gallery-dl's globals"""
+    path = extr._cfgpath
+    extr.config = lambda key, default=None: gdl_config.interpolate(path, key, default, conf)
+    extr.config_accumulate = lambda key: gdl_config.accumulate(path, key, conf)
+    extr._config_shared = lambda key, default=None: gdl_config.interpolate_common(
+        ("extractor",), path, key, default, conf)
+
+
+def iter_records(url, limit=None, cache=None, conf=None):
+    """Yield one dict per file gallery-dl finds for url, with the file URL under 'url'
+
+    Queued child URLs (e.g. a profile's posts) are followed depth-first, the same
+    order gallery-dl's own job uses; `limit` matches --range 1-<limit>. With
+    a ResponseCache, metadata requests are answered from it where possible.
+    Extractors read `conf` (from run_config) rather than gallery-dl's globals.
+    """
+    count = 0
+
+    def walk(extr):
+        nonlocal count
+        if conf is not None:
+            _bind_config(extr, conf)
+        extr.initialize()  # creates extr.session unless it was handed the parent's
+        instrument_session(extr.session)
+        if cache is not None:
+            cache_session(extr.session, cache)
+        for msg in extr:
+            if msg[0] == Message.Url:
+                record = dict(msg[2])
+                record['url'] = msg[1]
+                record['category'] = extr.category
+                record['subcategory'] = extr.subcategory
+                count += 1
+                yield record
+                if limit and count >= limit:
+                    return
+            elif msg[0] == Message.Queue:
+                child_url, kwdict = msg[1], msg[2]
+                cls = kwdict.get("_extractor")
+                child = cls.from_url(child_url) if cls else gdl_extractor.find(child_url)
+                if child is None:
+                    continue
+                if child.category == extr.category:
+                    child.session = extr.session  # reuse connections and login cookies
+                yield from walk(child)
+                if limit and count >= limit:
+                    return
+
+    extr = gdl_extractor.find(url)
+    if extr is None:
+        raise ValueError(f"gallery-dl has no extractor for {url}")
+    yield from walk(extr)
+
+
+class GalleryDLInProcess:
+    """Same interface as gallery_dl_stream.GalleryDLStream, but without a subprocess"""
+
+    def __init__(self, url, config=None, limit=None, config_files=None, cookies=None, cache=None):
+        self.url = url
+        self.limit = limit
+        self.returncode = None
+        self.stderr = ''
+        metrics.incr('gallery_dl_runs')
+        self._records = iter_records(url, limit, cache, run_config(config, config_files, cookies))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def records(self, errors=None):
+        """Yield (record_num, record) like GalleryDLStream.records"""
+        records = 0
+        waited = 0.0  # time spent inside gallery-dl (network and its own sleeps)
+        try:
+            start = time.perf_counter()
+            for record_num, record in enumerate(self._records, 1):
+                waited += time.perf_counter() - start
+                records += 1
+                yield record_num, record
+                start = time.perf_counter()
+            waited += time.perf_counter() - start
+            self.returncode = 0
+        except Exception as e:
+            # Surface extractor errors the way a failed subprocess would
+            self.returncode = 1
+            self.stderr = f"{e.__class__.__name__}: {e}"
+            if errors is not None:
+                errors.append(self.stderr)
+        finally:
+            metrics.observe('gallery_dl_wait', waited)
+            metrics.incr('records', records)
+
+    def close(self):
+        """Stop paginating; closing the generator unwinds the extractors"""
+        self._records.close()
+        if self.returncode is None:
+            self.returncode = 0
@@ -0,0 +1,195 @@
+"""
+Streaming reader for gallery-dl output
+Parses --dump-json records as gallery-dl prints them (one line each in output.jsonl
+mode) instead of buffering the whole run
+"""
+
+import subprocess
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+
+from record_decoder import get_decoder
+from url_expiry import url_expiry
+
+# Columns shared by every extractor's CSV output; expires is the URL's oe= deadline
+CSV_HEADER = "index,url,shortcode,expires,width,height"
+
+# Plain --dump-json prints one indented array when gallery-dl exits; with
+# output.jsonl each message is flushed as a [type, url, kwdict] line instead
+DUMP_JSON = ['--dump-json', '-o', 'output.jsonl=true']
+
+
+def extract_record_url(data):
+    """Pick the media URL out of a single gallery-dl JSON record"""
+    url = None
+    if 'url' in data:
+        url = data['url']
+    elif 'display_url' in data:
+        url = data['display_url']
+    elif 'thumbnail_url' in data:
+        url = data['thumbnail_url']
+
+    if url and url.startswith('http'):
+        return url
+    return None
+
+
+def format_csv_row(index, url, shortcode=None, width=None, height=None):
+    """One CSV line (without newline) for an extracted URL"""
+    expires = url_expiry(url)
+    return (f"{index},{url},{shortcode or ''},{expires if expires is not None else ''},"
+            f"{width or ''},{height or ''}")
+
+
+class GalleryDLStream:
+    """Run gallery-dl with Popen and hand out stdout lines as they arrive"""
+
+    def __init__(self, cmd, timeout=600, stderr_lines=200, decoder=None):
+        self.cmd = cmd
+        self.decoder = decoder or get_decoder()
+        self.timeout = timeout
+        self.timed_out = False
+        self._stderr = deque(maxlen=stderr_lines)
+        with metrics.phase('gallery_dl_spawn'):
+            self._proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding='utf-8',
+                bufsize=1
+            )
+        metrics.incr('gallery_dl_runs')
+        # Drain stderr in the background so a chatty gallery-dl can't block on a full pipe
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        self._timer = None
+        if timeout:
+            self._timer = threading.Timer(timeout, self._on_timeout)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _drain_stderr(self):
+        for line in self._proc.stderr:
+            self._stderr.append(line)
+
+    def _on_timeout(self):
+        self.timed_out = True
+        self._proc.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __iter__(self):
+        """Yield raw stdout lines until gallery-dl exits"""
+        finished = False
+        waited = 0.0  # time spent blocked on gallery-dl rather than in the caller
+        try:
+            start = time.perf_counter()
+            for line in self._proc.stdout:
+                waited += time.perf_counter() - start
+                yield line
+                start = time.perf_counter()
+            waited += time.perf_counter() - start
+            finished = True
+        finally:
+            metrics.observe('gallery_dl_wait', waited)
+            if not finished and self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.stdout.close()
+            self.wait()
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.cmd, self.timeout)
+
+    def records(self, errors=None):
+        """Yield (line_num, record) for every JSON line, collecting decode errors
+
+        Records only carry the fields in record_decoder.FIELDS.
+        """
+        decoded = failed = 0
+        decode_time = 0.0
+        try:
+            for line_num, line in enumerate(self, 1):
+                if not line.strip():
+                    continue
+                start = time.perf_counter()
+                try:
+                    record = self.decoder.decode(line)
+                except ValueError as e:
+                    failed += 1
+                    if errors is not None:
+                        errors.append(f"Line {line_num}: JSON decode error - {str(e)}")
+                    continue
+                finally:
+                    decode_time += time.perf_counter() - start
+                decoded += 1
+                if record is not None:
+                    yield line_num, record
+        finally:
+            metrics.observe('decode', decode_time, count=decoded + failed)
+            metrics.incr('records', decoded)
+            if failed:
+                metrics.incr('decode_errors', failed)
+
+    def wait(self):
+        """Wait for gallery-dl to exit and return its exit code"""
+        returncode = self._proc.wait()
+        if self._timer:
+            self._timer.cancel()
+        self._stderr_thread.join(timeout=5)
+        return returncode
+
+    def close(self):
+        """Stop gallery-dl early, e.g. once the caller has enough records"""
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self.wait()
+
+    @property
+    def returncode(self):
+        return self._proc.returncode
+
+    @property
+    def stderr(self):
+        return ''.join(self._stderr)
+
+
+class CSVAppender:
+    """Write CSV rows to disk as soon as each URL is found"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self._bytes = len(CSV_HEADER) + 1
+        self._write_time = 0.0
+        self._file = open(filename, 'w', encoding='utf-8', newline='')
+        self._file.write(CSV_HEADER + "\n")
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append(self, url, shortcode=None, width=None, height=None):
+        self.count += 1
+        row = format_csv_row(self.count, url, shortcode, width, height) + "\n"
+        start = time.perf_counter()
+        self._file.write(row)
+        self._file.flush()
+        self._write_time += time.perf_counter() - start
+        self._bytes += len(row.encode('utf-8'))
+        return self.count
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            metrics.observe('write', self._write_time, count=self.count)
+            metrics.incr('bytes_written', self._bytes)
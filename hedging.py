@@ -0,0 +1,196 @@
+"""
+Hedged extraction across backends
+Starts the first backend straight away and each further one after `hedge_delay`
+seconds without a record, or as soon as the one before it gives up. The first
+backend to produce a record wins and the others are cancelled, so a stalled
+backend costs at most the hedge delay instead of its whole timeout.
+"""
+
+import queue
+import threading
+import time
+
+from gallery_dl_backend import GalleryDLInProcess
+from gallery_dl_stream import DUMP_JSON, GalleryDLStream, extract_record_url
+
+_DONE = object()
+
+
+class Source:
+    """Iterable of (url, shortcode[, width, height]) records plus a way to stop it from another thread"""
+
+    def __init__(self, records, close=None):
+        self.records = records
+        self._close = close
+
+    def close(self):
+        if self._close:
+            self._close()
+
+
+class Backend:
+    """A named way to start extracting; open() returns a Source or any iterable"""
+
+    def __init__(self, name, open):
+        self.name = name
+        self.open = open
+
+
+def _gallery_dl_json_records(stream):
+    for _, data in stream.records():
+        url = extract_record_url(data)
+        if url:
+            yield url, data.get('post_shortcode') or data.get('shortcode'), data.get('width'), data.get('height')
+    if stream.returncode:
+        raise RuntimeError(stream.stderr.strip() or f"gallery-dl exited with {stream.returncode}")
+
+
+def _gallery_dl_print_records(stream):
+    for line in stream:
+        line = line.strip()
+        # -g prints fallback URLs as "| url"; the first URL is enough
+        if line.startswith('http'):
+            yield line, None
+    if stream.returncode:
+        raise RuntimeError(stream.stderr.strip() or f"gallery-dl exited with {stream.returncode}")
+
+
+def gallery_dl_json_backend(url, limit, timeout=600, inprocess=False, options=(), **inprocess_options):
+    """gallery-dl --dump-json, or the same records in-process; options are extra subprocess arguments"""
+    def open():
+        if inprocess:
+            stream = GalleryDLInProcess(url, limit=limit, **inprocess_options)
+        else:
+            cmd = ['gallery-dl', '--no-download', *DUMP_JSON, *options, '--range', f'1-{limit}', url]
+            stream = GalleryDLStream(cmd, timeout=timeout)
+        return Source(_gallery_dl_json_records(stream), stream.close)
+    return Backend('gallery-dl json', open)
+
+
+def gallery_dl_print_backend(url, limit, timeout=600, options=()):
+    """gallery-dl --get-urls: no metadata, but a different code path to the same files"""
+    def open():
+        cmd = ['gallery-dl', '--get-urls', *options, '--range', f'1-{limit}', url]
+        stream = GalleryDLStream(cmd, timeout=timeout)
+        return Source(_gallery_dl_print_records(stream), stream.close)
+    return Backend('gallery-dl print', open)
+
+
+class HedgedExtraction:
+    """Race backends and yield the records of whichever produces one first
+
+    After iterating, `winner` names the backend used (None if all failed) and
+    `errors` maps backend name to the error it stopped with.
+    """
+
+    def __init__(self, backends, hedge_delay=30.0, verbose=True):
+        if not backends:
+            raise ValueError("HedgedExtraction needs at least one backend")
+        self.backends = list(backends)
+        self.hedge_delay = hedge_delay
+        self.verbose = verbose
+        self.winner = None
+        self.errors = {}
+        self.started = []
+        self._queue = queue.Queue()
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _start(self, backend):
+        stop = threading.Event()
+        with self._lock:
+            self._running[backend.name] = [stop, None]
+        self.started.append(backend.name)
+        thread = threading.Thread(target=self._run, args=(backend, stop), daemon=True)
+        thread.start()
+
+    def _run(self, backend, stop):
+        error = None
+        source = None
+        try:
+            source = backend.open()
+            if not isinstance(source, Source):
+                source = Source(source, getattr(source, 'close', None))
+            with self._lock:
+                entry = self._running.get(backend.name)
+                if entry:
+                    entry[1] = source
+            for record in source.records:
+                if stop.is_set():
+                    break
+                self._queue.put((backend.name, record, None))
+        except Exception as e:
+            error = f"{e.__class__.__name__}: {e}"
+        finally:
+            if stop.is_set() and source is not None:
+                self._close_quietly(source)
+            self._queue.put((backend.name, _DONE, error))
+
+    @staticmethod
+    def _close_quietly(source):
+        try:
+            source.close()
+        except Exception:
+            # e.g. a generator that is mid-step in its own thread; it stops at the next record
+            pass
+
+    def _cancel(self, name):
+        with self._lock:
+            stop, source = self._running.pop(name, (None, None))
+        if stop is None:
+            return
+        stop.set()
+        if source is not None:
+            self._close_quietly(source)
+
+    def __iter__(self):
+        pending = list(self.backends)
+        self._start(pending.pop(0))
+        next_hedge = time.monotonic() + self.hedge_delay
+        try:
+            while True:
+                timeout = None
+                if pending and self.winner is None:
+                    timeout = max(0.0, next_hedge - time.monotonic())
+                try:
+                    name, item, error = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    backend = pending.pop(0)
+                    self._log(f"No results after {self.hedge_delay:g}s, also trying {backend.name}...")
+                    self._start(backend)
+                    next_hedge = time.monotonic() + self.hedge_delay
+                    continue
+
+                if self.winner is not None and name != self.winner:
+                    continue  # a cancelled loser still draining
+
+                if item is _DONE:
+                    with self._lock:
+                        self._running.pop(name, None)
+                    if error:
+                        self.errors[name] = error
+                    if self.winner is not None:
+                        return
+                    self._log(f"{name} finished without results" + (f": {error}" if error else ""))
+                    if pending:
+                        self._start(pending.pop(0))
+                        next_hedge = time.monotonic() + self.hedge_delay
+                    elif not self._running:
+                        return
+                    continue
+
+                if self.winner is None:
+                    self.winner = name
+                    self._log(f"Using results from {name}")
+                    for other in list(self._running):
+                        if other != name:
+                            self._cancel(other)
+                    pending = []
+                yield item
+        finally:
+            for name in list(self._running):
+                self._cancel(name)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+On-disk cache for Instagram metadata requests
+Profile lookups, GraphQL timeline pages and post info are cached in SQLite under
+a normalised request key (method, host, path and sorted parameters, minus cache
+busters), each endpoint with its own TTL, and evicted least-recently-used once
+the cache outgrows its size cap. Media downloads are never cached. instaloader
+and the in-process gallery-dl backend share one cache file, so re-running an
+extraction while iterating on formats or filters costs no requests at all.
+"""
+
+import argparse
+import hashlib
+import inspect
+import io
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from metrics import metrics
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Timeline pages move as new posts arrive; see capped_ttls()
+TIMELINE_PATHS = re.compile(r'/graphql/query|/api/v1/feed/user/')
+
+# First match wins; seconds a response stays fresh
+ENDPOINT_TTLS = (
+    # id, bio, counts: gallery-dl asks web_profile_info, instaloader loads the profile page itself
+    (re.compile(r'/api/v1/users/web_profile_info/|/api/v1/users/\d+/info/|^/[\w.]+/$'), 6 * 3600),
+    (re.compile(r'/api/v1/media/\d+/info/|/p/[^/]+/'), 24 * 3600),  # one post's media don't change
+    (TIMELINE_PATHS, 3600),
+)
+DEFAULT_TTL = 600  # any other JSON endpoint
+MEDIA_HOSTS = ('cdninstagram.com', 'fbcdn.net')
+
+# Parameters that change on every request without changing the answer
+VOLATILE_PARAMS = {'_', '__d', '__req', '__s', '__hsi', '__spin_t', 'jazoest', 'fb_dtsg', 'lsd'}
+# The JSON API answers the same on every instagram.com host
+HOST_ALIASES = {'instagram.com': 'www.instagram.com', 'i.instagram.com': 'www.instagram.com'}
+
+# Cached pages carry signed media URLs; they must stay usable for a while after a hit
+_OE_IN_BODY = re.compile(rb'oe=([0-9A-Fa-f]{8})(?![0-9A-Fa-f])')
+URL_MARGIN = 3600
+
+
+def capped_ttls(max_timeline_ttl, ttls=ENDPOINT_TTLS):
+    """ttls with timeline pages kept at most max_timeline_ttl seconds (0: not cached), e.g. below a poll interval"""
+    return tuple((pattern, min(ttl, max_timeline_ttl) if pattern is TIMELINE_PATHS else ttl)
+                 for pattern, ttl in ttls)
+
+
+def _normalise_value(value):
+    """JSON-valued parameters (GraphQL variables) compare by content, not key order"""
+    if value[:1] in '{[':
+        try:
+            return json.dumps(json.loads(value), sort_keys=True, separators=(',', ':'))
+        except ValueError:
+            pass
+    return value
+
+
+def request_key(method, url, data=None):
+    """(sha256 key, readable form) of a request; data is a form dict or urlencoded body"""
+    parts = urlsplit(url)
+    fields = parse_qsl(parts.query, keep_blank_values=True)
+    if isinstance(data, dict):
+        fields += [(key, str(value)) for key, value in data.items()]
+    elif data:
+        fields += parse_qsl(data.decode() if isinstance(data, bytes) else data, keep_blank_values=True)
+    fields = sorted((key, _normalise_value(value)) for key, value in fields if key not in VOLATILE_PARAMS)
+    host = parts.hostname or ''
+    request = f"{method.upper()} {HOST_ALIASES.get(host, host)}{parts.path.rstrip('/') or '/'}"
+    if fields:
+        request += '?' + urlencode(fields)
+    return hashlib.sha256(request.encode()).hexdigest(), request
+
+
+def signed_url_expiry(body):
+    """Earliest oe= expiry among the media URLs in a response body, or None"""
+    stamps = [int(match, 16) for match in _OE_IN_BODY.findall(body)]
+    return min(stamps) if stamps else None
+
+
+class ResponseCache:
+    """SQLite table of (status, headers, body) per request key, safe to share between threads"""
+
+    def __init__(self, path='http_cache.sqlite3', max_bytes=DEFAULT_MAX_BYTES, ttls=ENDPOINT_TTLS,
+                 default_ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                request TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used)")
+        self._conn.commit()
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def ttl_for(self, url):
+        """Seconds a response for url may be reused; 0 for media and other hosts"""
+        parts = urlsplit(url)
+        host = parts.hostname or ''
+        if host.endswith(MEDIA_HOSTS) or not host.endswith('instagram.com'):
+            return 0
+        for pattern, ttl in self.ttls:
+            if pattern.search(parts.path):
+                return ttl
+        return self.default_ttl
+
+    def get(self, key):
+        """(status, headers, body) of a fresh entry, or None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT status, headers, body, expires_at, size FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            if row and row[3] <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._bytes -= row[4]
+                row = None
+            elif row:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        metrics.incr('http_cache_hits' if row else 'http_cache_misses')
+        return (row[0], json.loads(row[1]), row[2]) if row else None
+
+    def put(self, key, request, status, headers, body, ttl):
+        """Store a response for ttl seconds (less if media URLs inside expire sooner)"""
+        now = time.time()
+        expires_at = now + ttl
+        url_expiry = signed_url_expiry(body)
+        if url_expiry is not None:
+            expires_at = min(expires_at, url_expiry - URL_MARGIN)
+        if expires_at <= now or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (key, request, status, json.dumps(dict(headers)), body, len(body),
+                                now, expires_at, now))
+            self._bytes += len(body) - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop expired entries, then least recently used ones, until under max_bytes; caller holds the lock"""
+        if self._bytes <= self.max_bytes:
+            return
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        evicted = 0
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if self._bytes <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._bytes -= size
+            evicted += 1
+        metrics.incr('http_cache_evictions', evicted)
+
+    def stats(self):
+        with self._lock:
+            count, size, oldest = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(stored_at) FROM responses").fetchone()
+        return {"entries": count, "bytes": size, "oldest": oldest}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            self._bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cached_response(request, status, headers, body):
+    """A requests.Response for a cache hit, marked with from_cache"""
+    response = Response()
+    response.status_code = status
+    response.reason = 'OK' if status == 200 else ''
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.raw = io.BytesIO(body)
+    response._content = body
+    response.url = request.url
+    response.request = request
+    response.from_cache = True
+    return response
+
+
+class CachingAdapter(BaseAdapter):
+    """Transport adapter that answers metadata requests from a ResponseCache
+
+    Wraps whatever adapter the session already had (gallery-dl mounts its own
+    with custom TLS settings), so everything that isn't cached goes out exactly
+    as before.
+    """
+
+    def __init__(self, cache, inner):
+        super().__init__()
+        self.cache = cache
+        self.inner = inner
+
+    def send(self, request, **kwargs):
+        ttl = self.cache.ttl_for(request.url) if request.method in ('GET', 'POST') else 0
+        if not ttl:
+            return self.inner.send(request, **kwargs)
+        key, normalised = request_key(request.method, request.url, request.body)
+        hit = self.cache.get(key)
+        if hit:
+            return cached_response(request, *hit)
+        response = self.inner.send(request, **kwargs)
+        if response.status_code == 200 and 'json' in response.headers.get('Content-Type', ''):
+            headers = {'Content-Type': response.headers['Content-Type']}
+            self.cache.put(key, normalised, 200, headers, response.content, ttl)
+        return response
+
+    def close(self):
+        self.inner.close()
+
+
+def cache_session(session, cache):
+    """Route a requests.Session's metadata requests through `cache`"""
+    for prefix in ('https://', 'http://'):
+        inner = session.get_adapter(prefix)
+        if not isinstance(inner, CachingAdapter):
+            session.mount(prefix, CachingAdapter(cache, inner))
+    return session
+
+
+def cache_instaloader(context, cache):
+    """Answer an InstaloaderContext's JSON queries and page lookups from `cache` where possible
+
+    instaloader sends GraphQL and iPhone API queries through throwaway copies
+    of its session, and profile pages (Profile.from_username) through an
+    anonymous one, none of which inherit adapters, so this wraps get_json and
+    get_page_data instead. A hit also skips instaloader's own rate-controller wait.
+    """
+    if getattr(context, '_http_cache', None) is cache:
+        return context
+    get_json = context.get_json
+    get_page_data = context.get_page_data
+    signature = inspect.signature(get_json)
+
+    def cached_get_json(*args, **kwargs):
+        call = signature.bind(*args, **kwargs)
+        call.apply_defaults()
+        options = call.arguments
+        url = f"https://{options['host']}/{options['path']}"
+        ttl = cache.ttl_for(url)
+        if not ttl:
+            return get_json(*args, **kwargs)
+        key, normalised = request_key('POST' if options['use_post'] else 'GET', url, options['params'])
+        hit = cache.get(key)
+        if hit:
+            if options['response_headers'] is not None:
+                options['response_headers'].update(hit[1])
+            return json.loads(hit[2])
+        result = get_json(*args, **kwargs)
+        cache.put(key, normalised, 200, {'Content-Type': 'application/json'},
+                  json.dumps(result).encode(), ttl)
+        return result
+
+    def cached_get_page_data(path):
+        url = f"https://www.instagram.com/{path}"
+        ttl = cache.ttl_for(url)
+        if not ttl:
+            return get_page_data(path)
+        key, normalised = request_key('GET', url)
+        hit = cache.get(key)
+        if hit:
+            return json.loads(hit[2])
+        result = get_page_data(path)
+        cache.put(key, normalised, 200, {'Content-Type': 'application/json'},
+                  json.dumps(result).encode(), ttl)
+        return result
+
+    context.get_json = cached_get_json
+    context.get_page_data = cached_get_page_data
+    context._http_cache = cache
+    return context
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or clear the metadata response cache')
+    parser.add_argument('cache', nargs='?', default='http_cache.sqlite3', help='Cache file (default: http_cache.sqlite3)')
+    parser.add_argument('--clear', action='store_true', help='Delete every cached response')
+    args = parser.parse_args()
+
+    with ResponseCache(args.cache) as cache:
+        if args.clear:
+            cache.clear()
+            print(f"🧹 Cleared {args.cache}")
+            return 0
+        stats = cache.stats()
+    age = f", oldest {(time.time() - stats['oldest']) / 60:.0f} min old" if stats['oldest'] else ''
+    print(f"🗄️  {stats['entries']} cached responses, {stats['bytes'] / 1e6:.1f} MB{age}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
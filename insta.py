@@ -1,195 +1,221 @@
-import instaloader
+"""
+Instagram photo URL scraper (instaloader)
+Command line wrapper around instagram_extractor: parses options, logs in, then
+scrapes one profile, a --profiles-file watchlist, a shared --queue or, with
+--daemon, keeps polling. Use instaload / instagram_extractor to embed the same
+extraction in another program.
+"""
+
 import time
 import sys
 import random
 import argparse
+import threading
 from instaloader.exceptions import ConnectionException, LoginException
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Instagram photo URL scraper')
-parser.add_argument('--wait', action='store_true', help='Wait for user input before starting')
-parser.add_argument('--delay', type=int, default=60, help='Base delay between operations (default: 60s)')
-args = parser.parse_args()
+from output_formats import FORMATS, output_path, write_urls
+from media_variants import parse_variant
+from account_pool import AccountPool
+from metrics import metrics, start_metrics
+from rate_control import AIMDController
+from profile_state import ProfileState
+from scheduler import PollScheduler
+from http_cache import ResponseCache, ENDPOINT_TTLS, capped_ttls
+from instagram_extractor import ProfileExtractor, create_loader, login
+from multi_profile import load_profiles_file, shard_path, run_profiles, run_queue, print_summary, write_summary
+from job_queue import open_queue
 
-PROFILE = 'for_everyoung10'  # Wonyoung's official IG handle
+DEFAULT_PROFILE = 'for_everyoung10'  # Wonyoung's official IG handle
 
     # To access private or your own posts, you need to login.
     # Replace 'your_username' and 'your_password' with your Instagram credentials.
 USERNAME = 'nagoyaka.hibi'
 PASSWORD = '207208'
 
-# Create Instaloader instance with more conservative settings
-L = instaloader.Instaloader(
-    download_pictures=False, 
-    download_videos=False, 
-    download_video_thumbnails=False,
-    download_geotags=False, 
-    download_comments=False, 
-    save_metadata=False, 
-    post_metadata_txt_pattern='',
-    max_connection_attempts=1,  # Reduce connection attempts
-    request_timeout=15.0,       # Increase timeout
-    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-)
-
-# Use session file to avoid repeated logins
-session_file = f"session-{USERNAME}"
-
-# Add some delay to avoid being flagged as bot
-if args.wait:
-    input("Press Enter when you want to start the scraping process...")
-
-initial_delay = random.randint(5, 15)
-print(f"Waiting {initial_delay} seconds before starting...")
-time.sleep(initial_delay)
-
-try:
-    # Try to load existing session
-    try:
-        L.load_session_from_file(USERNAME, session_file)
-        print("Loaded existing session")
-    except FileNotFoundError:
-        print("No existing session found, logging in...")
-        L.login(USERNAME, PASSWORD)
-        L.save_session_to_file(session_file)
-        print("Login successful and session saved!")
-    
-    time.sleep(3)  # Wait after login
-except LoginException as e:
-    print(f"Login failed: {e}")
-    sys.exit(1)
-except ConnectionException as e:
-    print(f"Connection error during login: {e}")
-    print("Please wait and try again later.")
-    sys.exit(1)
+def parse_args(argv=None):
+    """Command line options; only main() calls this, so importing insta has no side effects"""
+    parser = argparse.ArgumentParser(description='Instagram photo URL scraper')
+    parser.add_argument('--wait', action='store_true', help='Wait for user input before starting')
+    parser.add_argument('--delay', type=int, default=60, help='Base cooldown after a rate limit (default: 60s)')
+    parser.add_argument('--profile', default=DEFAULT_PROFILE, help='Instagram profile to scrape')
+    parser.add_argument('--state', help='Per-profile state file; stop once posts from a previous run are reached')
+    parser.add_argument('--profiles-file', help='File with one profile per line; each gets its own output shard')
+    parser.add_argument('--queue', metavar='QUEUE',
+                        help='Pull profiles from a job queue shared with other machines (a .sqlite3 file or a directory); '
+                             'profiles in --profiles-file are added to it first')
+    parser.add_argument('--workers', type=int, default=2, help='Maximum concurrent profiles for --profiles-file (default: 2)')
+    parser.add_argument('--output', default='urls.csv', help='Output file, or the base name for per-profile shards')
+    parser.add_argument('--sessions', nargs='+', help='Saved instaloader session files or cookies.txt files to spread requests across')
+    parser.add_argument('--account-rate', type=float, default=20, help='Requests per minute allowed for each account in --sessions (default: 20)')
+    parser.add_argument('--hedge', type=float, metavar='SECONDS',
+                        help='Also start gallery-dl when instaloader has found nothing after this many seconds')
+    parser.add_argument('--format', choices=FORMATS, default='csv',
+                        help='Output format (default: csv); the --output extension follows it')
+    parser.add_argument('--variant', type=parse_variant, metavar='POLICY',
+                        help='Image size to keep: largest, smallest, min:N (smallest at least N px wide) or width:N '
+                             '(default: the full-size image)')
+    parser.add_argument('--pipeline', type=int, metavar='WORKERS',
+                        help='Expand carousels on WORKERS threads ahead of the post walk, sharing the pacer (links keep post order)')
+    parser.add_argument('--quiet', action='store_true', help="Don't echo every link to the terminal")
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep polling --profile / --profiles-file, each as often as it actually posts')
+    parser.add_argument('--schedule', default='schedule.json', help='Where --daemon keeps what it learned (default: schedule.json)')
+    parser.add_argument('--min-interval', type=float, default=15, help='Shortest --daemon poll interval in minutes (default: 15)')
+    parser.add_argument('--max-interval', type=float, default=1440, help='Longest --daemon poll interval in minutes (default: 1440)')
+    parser.add_argument('--http-cache', nargs='?', const='http_cache.sqlite3', metavar='FILE',
+                        help='Answer repeated metadata requests (profile info, post pages) from an on-disk cache '
+                             'shared with gallery-dl (default file: http_cache.sqlite3)')
+    parser.add_argument('--http-cache-mb', type=int, default=256,
+                        help='Size cap for --http-cache; least recently used responses go first (default: 256)')
+    parser.add_argument('--metrics', metavar='FILE', help='Write run metrics (timers, counters) as JSON to FILE at exit')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus-style metrics on 127.0.0.1:PORT while running')
+    args = parser.parse_args(argv)
+    if args.format != 'csv':
+        args.output = output_path(args.output, args.format)
+    return args
 
-def fetch_posts_with_retry(profile, max_retries=3):
-    """Fetch posts with exponential backoff retry mechanism"""
-    for attempt in range(max_retries):
+def main(argv=None):
+    args = parse_args(argv)
+    start_metrics(args.metrics, args.metrics_port)
+    http_cache = None
+    if args.http_cache:
+        # A cached timeline page would hide new posts from the next --daemon poll
+        ttls = capped_ttls(args.min_interval * 60 / 2) if args.daemon else ENDPOINT_TTLS
+        http_cache = ResponseCache(args.http_cache, args.http_cache_mb * 1024 * 1024, ttls=ttls)
+    
+    L = create_loader(cache=http_cache)
+    
+    # Adaptive pacing: speeds up while Instagram answers, backs off hard when it rate limits
+    pacer = AIMDController(initial_delay=3.5, cooldown=args.delay)
+    
+    # High-water marks from previous runs, for incremental scraping
+    state = ProfileState(args.state) if args.state else None
+    if args.daemon and state is None:
+        state = ProfileState('profile_state.json')  # each poll should only pick up new posts
+    
+    # Use session file to avoid repeated logins
+    session_file = f"session-{USERNAME}"
+    
+    # Add some delay to avoid being flagged as bot
+    if args.wait:
+        input("Press Enter when you want to start the scraping process...")
+    
+    initial_delay = random.randint(5, 15)
+    print(f"Waiting {initial_delay} seconds before starting...")
+    with metrics.phase('startup_sleep'):
+        time.sleep(initial_delay)
+    
+    pool = None
+    if args.sessions:
+        # Spread requests across several accounts, each with its own token bucket
         try:
-            print(f"Attempt {attempt + 1} to fetch posts...")
-            posts = profile.get_posts()
-            print("Successfully fetched posts!")
-            return posts
-        except ConnectionException as e:
-            if "401" in str(e) or "rate limit" in str(e).lower() or "Please wait" in str(e):
-                base_wait = args.delay * (2 ** attempt)  # Use configurable base delay
-                wait_time = base_wait + random.randint(30, 90)
-                print(f"Rate limited on attempt {attempt + 1}. Waiting {wait_time} seconds...")
-                print(f"Instagram says: Please wait a few minutes before you try again.")
-                
-                if attempt < max_retries - 1:
-                    print(f"This is normal. We'll wait and try again automatically.")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    print(f"Reached maximum retries. Consider running the script again later.")
-            raise e
-    return None
-
-def try_alternative_approach(profile):
-    """Try an alternative approach to get post data"""
-    try:
-        print("Trying alternative approach - getting basic profile info first...")
-        
-        # Get basic profile info without posts
-        print(f"Posts count: {profile.mediacount}")
-        print(f"Followers: {profile.followers}")
-        print(f"Following: {profile.followees}")
-        
-        # Try to get a smaller number of posts first
-        print("Trying to get posts with takewhile to limit requests...")
-        from itertools import islice
-        
-        posts = islice(profile.get_posts(), 50)  # Only get first 50 posts
-        return posts
+            pool = AccountPool.from_files(args.sessions, lambda rate_controller=None: create_loader(rate_controller, http_cache),
+                                          rate=args.account_rate / 60.0)
+            print(f"Routing requests across {len(pool.accounts)} accounts")
+        except Exception as e:
+            print(f"Failed to load sessions: {e}")
+            return 1
+    else:
+        try:
+            with metrics.phase('login'):
+                login(L, USERNAME, PASSWORD, session_file, log=print)
         
-    except Exception as e:
-        print(f"Alternative approach also failed: {e}")
-        return None
-
-try:
-    print("Getting profile...")
-    profile = instaloader.Profile.from_username(L.context, PROFILE)
-    print(f"Profile found: {profile.full_name} (@{profile.username})")
+            time.sleep(3)  # Wait after login
+        except LoginException as e:
+            print(f"Login failed: {e}")
+            return 1
+        except ConnectionException as e:
+            print(f"Connection error during login: {e}")
+            print("Please wait and try again later.")
+            return 1
     
-    # Add longer delay before getting posts
-    delay = random.randint(10, 20)
-    print(f"Waiting {delay} seconds before fetching posts...")
-    time.sleep(delay)
+    extractor = ProfileExtractor(None if pool else L, pool=pool, pacer=pacer, state=state, variant=args.variant,
+                                 pipeline=args.pipeline, hedge=args.hedge, cache=http_cache, log=print,
+                                 verbose=not args.quiet)
     
-    print("Fetching posts...")
-    posts = fetch_posts_with_retry(profile)
+    def save_links(links, filename):
+        """Save (url, shortcode) links to a shard in the chosen --format"""
+        write_urls(links, filename, args.format)
+        print(f"Saved {len(links)} links to {filename}")
     
-    if posts is None:
-        print("Primary method failed. Trying alternative approach...")
-        posts = try_alternative_approach(profile)
+    worker_state = threading.local()
     
-    if posts is None:
-        print("Failed to fetch posts with primary method, trying alternative approach...")
-        posts = try_alternative_approach(profile)
+    def worker_loader():
+        """Instaloader for the current worker thread, reusing the saved session (None with --sessions)"""
+        if pool:
+            return None
+        loader = getattr(worker_state, 'loader', None)
+        if loader is None:
+            loader = create_loader(cache=http_cache)
+            loader.load_session_from_file(USERNAME, session_file)
+            worker_state.loader = loader
+        return loader
     
-    if posts is None:
-        print("Failed to fetch posts after all retries. Exiting.")
-        sys.exit(1)
+    def scrape_profile_shard(profile_name):
+        """Scrape one watchlist profile into its own CSV shard"""
+        links = extractor.scrape(profile_name, worker_loader())
+        save_links(links, shard_path(args.output, profile_name))
+        return len(links)
     
-    links = []
-    post_count = 0
+    def poll_profile(profile_name):
+        """One --daemon poll: save new links to a timestamped shard, return the new posts' timestamps"""
+        post_dates = []
+        links = list(extractor.links(profile_name, worker_loader(), post_dates))
+        if links:
+            save_links(links, shard_path(args.output, f"{profile_name}_{time.strftime('%Y%m%d-%H%M%S')}"))
+        return post_dates
     
-    for post in posts:
+    if args.daemon:
+        watchlist = (lambda: load_profiles_file(args.profiles_file)) if args.profiles_file else (lambda: [args.profile])
+        scheduler = PollScheduler(poll_profile, path=args.schedule, workers=args.workers,
+                                  min_interval=args.min_interval * 60, max_interval=args.max_interval * 60)
+        print(f"Watching {len(watchlist())} profiles, polling every {args.min_interval:g}-{args.max_interval:g} min")
         try:
-            post_count += 1
-            print(f"Processing post {post_count}...")
-            
-            if post.typename == "GraphImage":
-                links.append(post.url)
-            elif post.typename == "GraphSidecar":
-                # For posts with multiple images
-                for resource in post.get_sidecar_nodes():
-                    links.append(resource.display_url)
-            
-            # Add random delay between processing posts to appear more human
-            base_delay = random.uniform(2, 5)
-            if post_count % 5 == 0:  # Take longer breaks more frequently
-                print(f"Processed {post_count} posts, taking a longer break...")
-                time.sleep(base_delay + random.randint(10, 20))
-            else:
-                time.sleep(base_delay)
-                
-            # limit to 500
-            if len(links) >= 500:
-                print("Reached 500 image limit")
-                break
-                
-        except ConnectionException as e:
-            if "401" in str(e) or "rate limit" in str(e).lower():
-                wait_time = random.randint(120, 300)  # Wait 2-5 minutes
-                print(f"Rate limited on post {post_count}. Waiting {wait_time} seconds...")
-                time.sleep(wait_time)
-                continue
-            else:
-                print(f"Connection error on post {post_count}: {e}")
-                time.sleep(30)
-                continue
-        except Exception as e:
-            print(f"Error processing post {post_count}: {e}")
-            time.sleep(5)
-            continue
-
-except ConnectionException as e:
-    print(f"Connection error: {e}")
-    print("Instagram may be rate limiting. Please wait and try again later.")
-    sys.exit(1)
-except Exception as e:
-    print(f"Unexpected error: {e}")
-    sys.exit(1)
-
-# Print results
-print(f"\nFound {len(links)} image links:")
-print("=" * 50)
-
-# Print as CSV-ready lines
-for idx, link in enumerate(links):
-    print(f"{idx+1}, {link}")
+            scheduler.run(watchlist)
+        except KeyboardInterrupt:
+            print("\nStopping, schedule saved to", args.schedule)
+        scheduler.save()
+        return 0
+    
+    if args.queue:
+        queue = open_queue(args.queue)
+        if args.profiles_file:
+            print(f"Queued {queue.add(load_profiles_file(args.profiles_file))} new profiles from {args.profiles_file}")
+        results = run_queue(queue, scrape_profile_shard, max_workers=args.workers, output=args.output)
+        print_summary(results)
+        print(f"Queue status across all machines: python job_queue.py {args.queue} status")
+        return 0
+    
+    if args.profiles_file:
+        profiles = load_profiles_file(args.profiles_file)
+        print(f"Scraping {len(profiles)} profiles from {args.profiles_file}")
+        results = run_profiles(profiles, scrape_profile_shard, max_workers=args.workers, output=args.output)
+        print_summary(results)
+        write_summary(results, args.output)
+        return 0
+    
+    try:
+        links = extractor.scrape(args.profile)
+    except ConnectionException as e:
+        print(f"Connection error: {e}")
+        print("Instagram may be rate limiting. Please wait and try again later.")
+        return 1
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return 1
+    
+    save_links(links, args.output)
+    if not args.quiet:
+        # Print results
+        print(f"\nFound {len(links)} image links:")
+        print("=" * 50)
+        
+        # Print as CSV-ready lines
+        for idx, (link, *_) in enumerate(links):
+            print(f"{idx+1}, {link}")
+    
+    print(f"\nTotal images found: {len(links)}")
+    return 0
 
-print(f"\nTotal images found: {len(links)}")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,19 +5,76 @@ import os
 import argparse
 from urllib.parse import urlparse
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Instagram photo URL scraper using gallery-dl')
-parser.add_argument('--profile', default='for_everyoung10', help='Instagram profile to scrape')
-parser.add_argument('--limit', type=int, default=500, help='Maximum number of images to collect')
-parser.add_argument('--output', default='urls.csv', help='Output file for URLs')
-parser.add_argument('--dry-run', action='store_true', help='Only extract URLs without downloading')
-args = parser.parse_args()
+import gallery_dl_backend
+from gallery_dl_backend import GalleryDLInProcess
+from hedging import HedgedExtraction, gallery_dl_json_backend, gallery_dl_print_backend
+from gallery_dl_stream import DUMP_JSON, GalleryDLStream, extract_record_url
+from http_cache import ResponseCache
+from media_index import MediaIndex
+from metrics import metrics, start_metrics
+from output_formats import FORMATS, open_writer, output_path, write_urls
+from rate_control import AIMDController, is_rate_limit_error
+from record_decoder import get_decoder
+from multi_profile import load_profiles_file, shard_path, run_profiles, run_queue, print_summary, write_summary
+from job_queue import open_queue
 
-PROFILE = args.profile
-LIMIT = args.limit
+# Set by main(); importing this module parses nothing and opens nothing
+args = None
+PROFILE = None
+LIMIT = None
+http_cache = None
+
+# Shared pacing for every gallery-dl run; its sleep-request range adapts between runs
+pacer = AIMDController(initial_delay=3.5)
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description='Instagram photo URL scraper using gallery-dl')
+    parser.add_argument('--profile', default='for_everyoung10', help='Instagram profile to scrape')
+    parser.add_argument('--limit', type=int, default=500, help='Maximum number of images to collect')
+    parser.add_argument('--output', default='urls.csv', help='Output file for URLs')
+    parser.add_argument('--dry-run', action='store_true', help='Only extract URLs without downloading')
+    parser.add_argument('--stream', action='store_true', help='Write URLs to the output file as they are extracted')
+    parser.add_argument('--index', help='Media index database; media already downloaded is left out of the output')
+    parser.add_argument('--profiles-file', help='File with one profile per line; each gets its own output shard')
+    parser.add_argument('--queue', metavar='QUEUE',
+                        help='Pull profiles from a job queue shared with other machines (a .sqlite3 file or a directory); '
+                             'profiles in --profiles-file are added to it first')
+    parser.add_argument('--workers', type=int, default=4, help='Maximum concurrent gallery-dl workers for --profiles-file (default: 4)')
+    parser.add_argument('--backend', choices=['auto', 'inprocess', 'subprocess'], default='auto',
+                        help='Run gallery-dl inside this process or as a subprocess (default: in-process when importable)')
+    parser.add_argument('--hedge', type=float, metavar='SECONDS',
+                        help='Also start print mode when JSON mode has found nothing after this many seconds '
+                             '(default: print mode only once JSON mode has finished without any)')
+    parser.add_argument('--format', choices=FORMATS, default='csv',
+                        help='Output format (default: csv); the --output extension follows it')
+    parser.add_argument('--quiet', action='store_true', help="Don't echo extracted URLs to the terminal")
+    parser.add_argument('--http-cache', nargs='?', const='http_cache.sqlite3', metavar='FILE',
+                        help='Answer repeated metadata requests (profile info, post pages) from an on-disk cache '
+                             '(default file: http_cache.sqlite3)')
+    parser.add_argument('--http-cache-mb', type=int, default=256,
+                        help='Size cap for --http-cache; least recently used responses go first (default: 256)')
+    parser.add_argument('--metrics', metavar='FILE', help='Write run metrics (timers, counters) as JSON to FILE at exit')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus-style metrics on 127.0.0.1:PORT while running')
+    args = parser.parse_args(argv)
+    if args.format != 'csv':
+        args.output = output_path(args.output, args.format)
+    return args
+
+def use_inprocess():
+    """True when gallery-dl should be driven in-process instead of spawned"""
+    return args.backend != 'subprocess' and gallery_dl_backend.available()
 
 def check_gallery_dl():
     """Check if gallery-dl is installed"""
+    if use_inprocess():
+        print(f"gallery-dl version: {gallery_dl_backend.GALLERY_DL_VERSION} (in-process)")
+        return True
+    if args.backend == 'inprocess':
+        print("gallery-dl can't be imported for --backend inprocess")
+        print("Please install it using: pip install gallery-dl")
+        return False
+    
     try:
         result = subprocess.run(['gallery-dl', '--version'], 
                               capture_output=True, text=True, check=True)
@@ -28,87 +85,21 @@ def check_gallery_dl():
         print("Please install it using: pip install gallery-dl")
         return False
 
-def create_config():
-    """Create a gallery-dl config file optimized for Instagram"""
-    config = {
-        "extractor": {
-            "instagram": {
-                "include": "posts",
-                "videos": False,
-                "stories": False,
-                "highlights": False,
-                "tagged": False,
-                "metadata": True,
-                "sleep-request": [2, 5],  # Sleep 2-5 seconds between requests
-                "sleep-retry": [60, 300]  # Sleep 60-300 seconds on rate limit
-            },
-            "base-directory": "./downloads",
-            "skip": True
-        },
-        "output": {
-            "mode": "json",
-            "format": {
-                "filename": "{post_url}|{display_url}"
-            }
-        }
-    }
-    
-    config_path = "gallery_dl_config.json"
-    with open(config_path, 'w') as f:
-        json.dump(config, f, indent=2)
-    
-    print(f"Created config file: {config_path}")
-    return config_path
-
-def extract_urls_with_gallery_dl(profile, limit):
-    """Extract URLs using gallery-dl"""
-    
-    # Create config file
-    config_path = create_config()
-    
-    try:
-        # Construct the Instagram URL
-        instagram_url = f"https://www.instagram.com/{profile}/"
-        
-        print(f"Extracting URLs from: {instagram_url}")
-        print(f"Limit: {limit} images")
-        
-        # Run gallery-dl with JSON output to extract metadata
-        cmd = [
-            'gallery-dl',
-            '--config', config_path,
-            '--no-download',  # Don't download, just extract metadata
-            '--write-info-json',  # Write metadata to JSON files
-            '--range', f'1-{limit}',  # Limit number of posts
-            instagram_url
-        ]
-        
-        print(f"Running command: {' '.join(cmd)}")
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-        
-        if result.returncode != 0:
-            print(f"gallery-dl error: {result.stderr}")
-            if "login required" in result.stderr.lower():
-                print("\nInstagram requires login. You may need to:")
-                print("1. Set up authentication in gallery-dl config")
-                print("2. Use cookies from your browser")
-                print("3. Try with a different approach")
-            return None
-        
-        print("gallery-dl extraction completed successfully!")
-        return result.stdout
-        
-    except subprocess.TimeoutExpired:
-        print("gallery-dl operation timed out")
-        return None
-    except Exception as e:
-        print(f"Error running gallery-dl: {e}")
-        return None
-    finally:
-        # Clean up config file
-        if os.path.exists(config_path):
-            os.remove(config_path)
+def pacing_config():
+    """gallery-dl config carrying the pacer's current sleep-request range, for in-process runs"""
+    return {"extractor": {"instagram": {"sleep-request": pacer.sleep_request()}}}
+
+def pacing_options():
+    """The same range as gallery-dl -o options, for subprocess runs"""
+    return ['-o', f"extractor.instagram.sleep-request={json.dumps(pacer.sleep_request())}"]
+
+def record_pacing(returncode, stderr):
+    """Feed a finished gallery-dl run back into the pacing controller"""
+    if is_rate_limit_error(stderr):
+        pacer.on_rate_limit()
+        print(f"Rate limited, slowing gallery-dl to {pacer.sleep_request()}s between requests")
+    elif returncode == 0:
+        pacer.on_success()
 
 def extract_urls_json_mode(profile, limit):
     """Extract URLs using gallery-dl in JSON mode"""
@@ -118,18 +109,31 @@ def extract_urls_json_mode(profile, limit):
         print(f"Extracting URLs from: {instagram_url}")
         print("Using JSON output mode for better URL extraction...")
         
+        if use_inprocess():
+            errors = []
+            with GalleryDLInProcess(instagram_url, config=pacing_config(), limit=limit, cache=http_cache) as gdl:
+                urls = [url for _, data in gdl.records(errors) if (url := extract_record_url(data))]
+            record_pacing(gdl.returncode, gdl.stderr)
+            if errors:
+                print(f"gallery-dl error: {errors[0]}")
+            return urls
+        
         # Run gallery-dl with JSON output
         cmd = [
             'gallery-dl',
             '--no-download',
-            '--dump-json',
+            *DUMP_JSON,
+            *pacing_options(),
             '--range', f'1-{limit}',
             instagram_url
         ]
         
         print(f"Running command: {' '.join(cmd)}")
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        metrics.incr('gallery_dl_runs')
+        with metrics.phase('gallery_dl_run'):
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        record_pacing(result.returncode, result.stderr)
         
         if result.returncode != 0:
             print(f"gallery-dl error: {result.stderr}")
@@ -137,16 +141,20 @@ def extract_urls_json_mode(profile, limit):
         
         # Parse JSON output
         urls = []
+        decoder = get_decoder()
         for line in result.stdout.strip().split('\n'):
             if line.strip():
                 try:
-                    data = json.loads(line)
+                    data = decoder.decode(line)
+                    if not data:
+                        continue
                     if 'url' in data:
                         urls.append(data['url'])
                     elif 'display_url' in data:
                         urls.append(data['display_url'])
-                except json.JSONDecodeError:
+                except ValueError:
                     continue
+        metrics.incr('records', len(urls))
         
         return urls
         
@@ -157,67 +165,218 @@ def extract_urls_json_mode(profile, limit):
         print(f"Error running gallery-dl: {e}")
         return []
 
+def extract_urls_hedged(profile, limit):
+    """Race JSON mode against print mode and keep whichever returns URLs first"""
+    instagram_url = f"https://www.instagram.com/{profile}/"
+    
+    print(f"Extracting URLs from: {instagram_url}")
+    print(f"Starting JSON mode; print mode joins after {args.hedge:g}s without results...")
+    
+    backends = [
+        gallery_dl_json_backend(instagram_url, limit, inprocess=use_inprocess(), options=pacing_options(),
+                                config=pacing_config(), cache=http_cache),
+        gallery_dl_print_backend(instagram_url, limit, options=pacing_options()),
+    ]
+    extraction = HedgedExtraction(backends, hedge_delay=args.hedge)
+    urls = [record[0] for record in extraction]
+    
+    for name, error in extraction.errors.items():
+        print(f"{name} error: {error}")
+    return urls
+
+def extract_urls_print_mode(profile, limit):
+    """Extract URLs with gallery-dl --get-urls: no metadata, but a different code path to the same files"""
+    instagram_url = f"https://www.instagram.com/{profile}/"
+    
+    extraction = HedgedExtraction([gallery_dl_print_backend(instagram_url, limit, options=pacing_options())],
+                                  verbose=False)
+    urls = [record[0] for record in extraction]
+    
+    for name, error in extraction.errors.items():
+        print(f"{name} error: {error}")
+    return urls
+
+def extract_urls(profile, limit):
+    """JSON mode, then print mode if it found nothing; with --hedge both race instead"""
+    if args.hedge is not None:
+        return extract_urls_hedged(profile, limit)
+    urls = extract_urls_json_mode(profile, limit)
+    if not urls:
+        print("JSON mode found no URLs, trying print mode...")
+        urls = extract_urls_print_mode(profile, limit)
+    return urls
+
+def extract_urls_json_stream(profile, limit, filename, media_index=None):
+    """Extract URLs in JSON mode, appending each one to the output file as it arrives"""
+    instagram_url = f"https://www.instagram.com/{profile}/"
+    
+    print(f"Extracting URLs from: {instagram_url}")
+    print(f"Streaming JSON records into {filename}...")
+    
+    if use_inprocess():
+        print("Running gallery-dl in-process")
+        open_stream = lambda: GalleryDLInProcess(instagram_url, config=pacing_config(), limit=limit, cache=http_cache)
+    else:
+        cmd = [
+            'gallery-dl',
+            '--no-download',
+            *DUMP_JSON,
+            *pacing_options(),
+            '--range', f'1-{limit}',
+            instagram_url
+        ]
+        print(f"Running command: {' '.join(cmd)}")
+        open_stream = lambda: GalleryDLStream(cmd, timeout=600)
+    
+    try:
+        with open_stream() as stream, open_writer(filename, args.format) as out:
+            for line_num, data in stream.records():
+                url = extract_record_url(data)
+                if url and media_index and not media_index.add_extracted(url, profile):
+                    continue
+                if url:
+                    idx = out.append(url, data.get('post_shortcode') or data.get('shortcode'),
+                                     data.get('width'), data.get('height'))
+                    if not args.quiet:
+                        print(f"{idx},{url}")
+        
+        record_pacing(stream.returncode, stream.stderr)
+        if stream.returncode != 0:
+            print(f"gallery-dl error: {stream.stderr}")
+        
+        return out.count
+        
+    except subprocess.TimeoutExpired:
+        print("gallery-dl operation timed out")
+        return out.count
+    except Exception as e:
+        print(f"Error running gallery-dl: {e}")
+        return 0
+
 def save_urls_to_file(urls, filename):
-    """Save URLs to a CSV file"""
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write("index,url\n")  # CSV header
-        for idx, url in enumerate(urls, 1):
-            f.write(f"{idx},{url}\n")
+    """Save URLs to the output file in the chosen --format"""
+    write_urls(urls, filename, args.format)
     
     print(f"Saved {len(urls)} URLs to {filename}")
 
-def main():
+def drop_known_urls(urls, media_index, profile):
+    """Leave out URLs whose media the index already has on disk"""
+    if not media_index:
+        return urls
+    
+    new_urls = [url for url in urls if media_index.add_extracted(url, profile)]
+    if len(new_urls) < len(urls):
+        print(f"Skipped {len(urls) - len(new_urls)} URLs already downloaded (media index)")
+    return new_urls
+
+def extract_profile_shard(profile, media_index=None):
+    """Extract one watchlist profile into its own CSV shard"""
+    filename = shard_path(args.output, profile)
+    
+    if args.stream:
+        return extract_urls_json_stream(profile, LIMIT, filename, media_index)
+    
+    urls = drop_known_urls(extract_urls(profile, LIMIT), media_index, profile)
+    if urls:
+        save_urls_to_file(urls, filename)
+    return len(urls)
+
+def main(argv=None):
+    global args, PROFILE, LIMIT, http_cache
+    args = parse_args(argv)
+    PROFILE = args.profile
+    LIMIT = args.limit
+    http_cache = ResponseCache(args.http_cache, args.http_cache_mb * 1024 * 1024) if args.http_cache else None
+    
     print("Instagram URL Extractor using gallery-dl")
     print("=" * 50)
+    start_metrics(args.metrics, args.metrics_port)
     
     # Check if gallery-dl is available
     if not check_gallery_dl():
         sys.exit(1)
+    if http_cache and not use_inprocess():
+        print("--http-cache only covers the in-process backend; the gallery-dl subprocess fetches everything itself")
     
-    print(f"Target profile: @{PROFILE}")
-    print(f"Image limit: {LIMIT}")
+    media_index = MediaIndex(args.index) if args.index else None
     
-    if args.dry_run:
-        print("DRY RUN MODE - Only extracting URLs")
+    try:
+        if args.queue:
+            queue = open_queue(args.queue)
+            if args.profiles_file:
+                print(f"Queued {queue.add(load_profiles_file(args.profiles_file))} new profiles from {args.profiles_file}")
+            print(f"Image limit: {LIMIT} per profile")
+            results = run_queue(queue, lambda profile: extract_profile_shard(profile, media_index),
+                                max_workers=args.workers, output=args.output)
+            print_summary(results)
+            print(f"Queue status across all machines: python job_queue.py {args.queue} status")
+            return
     
-    # Try JSON mode first
-    print("\nAttempting to extract URLs...")
-    urls = extract_urls_json_mode(PROFILE, LIMIT)
+        if args.profiles_file:
+            profiles = load_profiles_file(args.profiles_file)
+            print(f"Target profiles: {len(profiles)} from {args.profiles_file}")
+            print(f"Image limit: {LIMIT} per profile")
+        
+            results = run_profiles(profiles, lambda profile: extract_profile_shard(profile, media_index),
+                                   max_workers=args.workers, output=args.output)
+            print_summary(results)
+            write_summary(results, args.output)
+            return
     
-    if not urls:
-        print("JSON mode failed, trying alternative extraction...")
-        result = extract_urls_with_gallery_dl(PROFILE, LIMIT)
-        if result is None:
-            print("Failed to extract URLs with gallery-dl")
-            sys.exit(1)
-        urls = []  # Would need to parse the result differently
+        print(f"Target profile: @{PROFILE}")
+        print(f"Image limit: {LIMIT}")
     
-    if urls:
-        print(f"\nSuccessfully extracted {len(urls)} URLs!")
-        
-        # Display first few URLs
-        print("\nFirst 5 URLs:")
-        for i, url in enumerate(urls[:5], 1):
-            print(f"{i}: {url}")
+        if args.dry_run:
+            print("DRY RUN MODE - Only extracting URLs")
+    
+        if args.stream:
+            print("\nAttempting to extract URLs...")
+            count = extract_urls_json_stream(PROFILE, LIMIT, args.output, media_index)
+            if count:
+                print(f"\nSuccessfully extracted {count} URLs!")
+                print(f"Saved {count} URLs to {args.output}")
+            else:
+                print("No URLs were extracted. This could be due to:")
+                print("1. Rate limiting by Instagram")
+                print("2. Private account requiring authentication")
+                print("3. Network issues")
+                print("4. Changes in Instagram's API")
+            return
+    
+        print("\nAttempting to extract URLs...")
+        urls = drop_known_urls(extract_urls(PROFILE, LIMIT), media_index, PROFILE)
+    
+        if urls:
+            print(f"\nSuccessfully extracted {len(urls)} URLs!")
         
-        if len(urls) > 5:
-            print(f"... and {len(urls) - 5} more")
+            # Display first few URLs
+            if not args.quiet:
+                print("\nFirst 5 URLs:")
+                for i, url in enumerate(urls[:5], 1):
+                    print(f"{i}: {url}")
+            
+                if len(urls) > 5:
+                    print(f"... and {len(urls) - 5} more")
         
-        # Save to file
-        save_urls_to_file(urls, args.output)
+            # Save to file
+            save_urls_to_file(urls, args.output)
         
-        # Also print all URLs for immediate use
-        print(f"\nAll URLs (CSV format):")
-        print("=" * 50)
-        for idx, url in enumerate(urls, 1):
-            print(f"{idx},{url}")
+            # Also print all URLs for immediate use
+            if not args.quiet:
+                print(f"\nAll URLs (CSV format):")
+                print("=" * 50)
+                for idx, url in enumerate(urls, 1):
+                    print(f"{idx},{url}")
     
-    else:
-        print("No URLs were extracted. This could be due to:")
-        print("1. Rate limiting by Instagram")
-        print("2. Private account requiring authentication")
-        print("3. Network issues")
-        print("4. Changes in Instagram's API")
+        else:
+            print("No URLs were extracted. This could be due to:")
+            print("1. Rate limiting by Instagram")
+            print("2. Private account requiring authentication")
+            print("3. Network issues")
+            print("4. Changes in Instagram's API")
+    finally:
+        if media_index:
+            media_index.close()
 
 if __name__ == "__main__":
     main()
@@ -4,22 +4,75 @@ import sys
 import os
 import argparse
 import time
+import tempfile
 from pathlib import Path
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Instagram photo URL scraper using gallery-dl')
-parser.add_argument('--profile', default='for_everyoung10', help='Instagram profile to scrape')
-parser.add_argument('--limit', type=int, default=500, help='Maximum number of images to collect')
-parser.add_argument('--output', default='urls.csv', help='Output file for URLs')
-parser.add_argument('--config', help='Path to gallery-dl config file')
-parser.add_argument('--cookies', help='Path to cookies file (exported from browser)')
-parser.add_argument('--username', help='Instagram username for authentication')
-parser.add_argument('--password', help='Instagram password for authentication')
-parser.add_argument('--verbose', action='store_true', help='Verbose output')
-args = parser.parse_args()
+import gallery_dl_backend
+from gallery_dl_backend import GalleryDLInProcess
+from gallery_dl_stream import DUMP_JSON, GalleryDLStream, extract_record_url
+from media_index import MediaIndex
+from metrics import metrics, start_metrics
+from output_formats import FORMATS, open_writer, output_path, write_urls
+from record_decoder import available_decoders, get_decoder
+from rate_control import AIMDController, is_rate_limit_error
+from profile_state import ProfileState, HighWaterMark, record_post_info
+from multi_profile import load_profiles_file, shard_path, run_profiles, print_summary, write_summary
+
+# Set by main(); importing this module parses nothing
+args = None
+# Only the few fields we read are pulled out of each gallery-dl record
+decoder = None
+
+def parse_args(argv=None):
+    """Command line options"""
+    parser = argparse.ArgumentParser(description='Instagram photo URL scraper using gallery-dl')
+    parser.add_argument('--profile', default='for_everyoung10', help='Instagram profile to scrape')
+    parser.add_argument('--limit', type=int, default=500, help='Maximum number of images to collect')
+    parser.add_argument('--output', default='urls.csv', help='Output file for URLs')
+    parser.add_argument('--config', help='Path to gallery-dl config file')
+    parser.add_argument('--cookies', help='Path to cookies file (exported from browser)')
+    parser.add_argument('--username', help='Instagram username for authentication')
+    parser.add_argument('--password', help='Instagram password for authentication')
+    parser.add_argument('--verbose', action='store_true', help='Verbose output')
+    parser.add_argument('--stream', action='store_true', help='Write URLs to the CSV as gallery-dl produces them')
+    parser.add_argument('--index', help='Media index database; media already downloaded is left out of the output')
+    parser.add_argument('--state', help='Per-profile state file; stop once posts from a previous run are reached (implies --stream)')
+    parser.add_argument('--profiles-file', help='File with one profile per line; each gets its own output shard')
+    parser.add_argument('--workers', type=int, default=4, help='Maximum concurrent gallery-dl workers for --profiles-file (default: 4)')
+    parser.add_argument('--backend', choices=['auto', 'inprocess', 'subprocess'], default='auto',
+                        help='Run gallery-dl inside this process or as a subprocess (default: in-process when importable)')
+    parser.add_argument('--decoder', choices=['auto'] + available_decoders(), default='auto',
+                        help='JSON record decoder (default: fastest installed)')
+    parser.add_argument('--format', choices=FORMATS, default='csv',
+                        help='Output format (default: csv); the --output extension follows it')
+    parser.add_argument('--quiet', action='store_true', help="Don't echo extracted URLs to the terminal")
+    parser.add_argument('--metrics', metavar='FILE', help='Write run metrics (timers, counters) as JSON to FILE at exit')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus-style metrics on 127.0.0.1:PORT while running')
+    args = parser.parse_args(argv)
+    if args.format != 'csv':
+        args.output = output_path(args.output, args.format)
+    return args
+
+# Shared pacing for every gallery-dl run; its sleep-request range adapts between runs
+pacer = AIMDController(initial_delay=3.5)
+
+def use_inprocess():
+    """True when gallery-dl should be driven in-process instead of spawned"""
+    if args.backend == 'subprocess':
+        return False
+    return gallery_dl_backend.available()
 
 def check_gallery_dl():
     """Check if gallery-dl is installed and get version"""
+    if use_inprocess():
+        print(f"✓ gallery-dl found: {gallery_dl_backend.GALLERY_DL_VERSION} (in-process)")
+        return True
+    if args.backend == 'inprocess':
+        print("✗ gallery-dl can't be imported for --backend inprocess")
+        print("\nTo install gallery-dl:")
+        print("  pip install gallery-dl")
+        return False
+    
     try:
         result = subprocess.run(['gallery-dl', '--version'], 
                               capture_output=True, text=True, check=True)
@@ -34,8 +87,8 @@ def check_gallery_dl():
         print("  .\\install_gallery_dl.ps1")
         return False
 
-def create_config_file():
-    """Create optimized gallery-dl config"""
+def build_config():
+    """Optimized gallery-dl config as a dict"""
     config = {
         "extractor": {
             "instagram": {
@@ -45,6 +98,7 @@ def create_config_file():
                 "highlights": False,
                 "tagged": False,
                 "sleep": [2, 5],
+                "sleep-request": pacer.sleep_request(),
                 "sleep-retry": [30, 120],
                 "timeout": 30.0,
                 "retries": 3
@@ -67,14 +121,36 @@ def create_config_file():
         config["extractor"]["instagram"]["password"] = args.password
         print("✓ Using username/password authentication")
     
-    config_path = "temp_gallery_dl_config.json"
+    return config
+
+def create_config_file(config_path="temp_gallery_dl_config.json"):
+    """Write the gallery-dl config for the subprocess backend"""
     with open(config_path, 'w') as f:
-        json.dump(config, f, indent=2)
+        json.dump(build_config(), f, indent=2)
     
     return config_path
 
-def run_gallery_dl_command(profile, limit, config_path=None):
-    """Run gallery-dl command with proper error handling"""
+def open_gallery_dl(profile, limit, config_path=None):
+    """Start extraction with the in-process backend, or spawn gallery-dl as a fallback"""
+    if not use_inprocess():
+        return GalleryDLStream(build_gallery_dl_command(profile, limit, config_path), timeout=600, decoder=decoder)
+    
+    instagram_url = f"https://www.instagram.com/{profile}/"
+    print(f"🔍 Extracting URLs from: {instagram_url}")
+    print(f"📊 Limit: {limit} posts")
+    if args.cookies:
+        print(f"✓ Using cookies from: {args.cookies}")
+    
+    return GalleryDLInProcess(
+        instagram_url,
+        config=build_config(),
+        limit=limit,
+        config_files=[args.config] if args.config else None,
+        cookies=args.cookies
+    )
+
+def build_gallery_dl_command(profile, limit, config_path=None):
+    """Build the gallery-dl command line for a profile"""
     
     instagram_url = f"https://www.instagram.com/{profile}/"
     
@@ -95,7 +171,7 @@ def run_gallery_dl_command(profile, limit, config_path=None):
     # Core options
     cmd.extend([
         '--no-download',        # Don't download files
-        '--dump-json',          # Output JSON for each post
+        *DUMP_JSON,             # One JSON line per file, as soon as it is found
         '--range', f'1-{limit}', # Limit posts
         '--quiet' if not args.verbose else '--verbose',
     ])
@@ -108,15 +184,24 @@ def run_gallery_dl_command(profile, limit, config_path=None):
     if args.verbose:
         print(f"🔧 Command: {' '.join(cmd)}")
     
+    return cmd
+
+def run_gallery_dl_command(profile, limit, config_path=None):
+    """Run gallery-dl command with proper error handling"""
+    
+    cmd = build_gallery_dl_command(profile, limit, config_path)
+    
     try:
         # Run with timeout
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            timeout=600,  # 10 minute timeout
-            encoding='utf-8'
-        )
+        metrics.incr('gallery_dl_runs')
+        with metrics.phase('gallery_dl_run'):
+            result = subprocess.run(
+                cmd, 
+                capture_output=True, 
+                text=True, 
+                timeout=600,  # 10 minute timeout
+                encoding='utf-8'
+            )
         
         return result
         
@@ -144,23 +229,17 @@ def parse_gallery_dl_output(result):
             continue
             
         try:
-            data = json.loads(line)
+            data = decoder.decode(line)
             
             # Extract URL from different possible fields
-            url = None
-            if 'url' in data:
-                url = data['url']
-            elif 'display_url' in data:
-                url = data['display_url']
-            elif 'thumbnail_url' in data:
-                url = data['thumbnail_url']
+            url = extract_record_url(data) if data else None
             
-            if url and url.startswith('http'):
+            if url:
                 urls.append(url)
                 if args.verbose:
                     print(f"  📸 Found URL {len(urls)}: {url[:80]}...")
             
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             errors.append(f"Line {line_num}: JSON decode error - {str(e)}")
             if args.verbose:
                 print(f"⚠️  Skipping malformed JSON on line {line_num}")
@@ -171,13 +250,86 @@ def parse_gallery_dl_output(result):
     
     return urls, errors
 
+def stream_gallery_dl_to_csv(profile, limit, filename, config_path=None, media_index=None, state=None):
+    """Run gallery-dl and append each URL to the CSV file as its record arrives"""
+    
+    errors = []
+    samples = []  # Only keep a few URLs in memory for the summary
+    known = 0
+    records_seen = 0
+    caught_up = False
+    mark = HighWaterMark(state.get(profile)) if state else None
+    
+    try:
+        with open_gallery_dl(profile, limit, config_path) as stream, open_writer(filename, args.format) as out:
+            for line_num, data in stream.records(errors):
+                records_seen += 1
+                if mark:
+                    while len(errors) > mark.failed_posts:
+                        mark.failed()  # a line before this one couldn't be decoded
+                    shortcode, timestamp = record_post_info(data)
+                    pinned = bool(data.get('pinned'))
+                    status = mark.observe(shortcode, timestamp, pinned=pinned)
+                    if status == 'stop':
+                        print(f"⏹  Reached posts from a previous run of @{profile}, stopping pagination")
+                        caught_up = True
+                        stream.close()
+                        break
+                    if status == 'known':
+                        continue
+                    mark.done(shortcode, timestamp, pinned)
+                
+                url = extract_record_url(data)
+                if not url:
+                    continue
+                if media_index and not media_index.add_extracted(url, profile):
+                    known += 1
+                    continue
+                
+                count = out.append(url, data.get('post_shortcode') or data.get('shortcode'),
+                                   data.get('width'), data.get('height'))
+                if len(samples) < 3:
+                    samples.append(url)
+                if args.quiet:
+                    continue
+                if args.verbose:
+                    print(f"  📸 Found URL {count}: {url[:80]}...")
+                elif count % 50 == 0:
+                    print(f"  📸 {count} URLs written so far...")
+            
+            count = out.count
+        
+        failed = stream.returncode != 0 and not caught_up
+        if failed:
+            print(f"❌ gallery-dl failed with return code {stream.returncode}")
+            if stream.stderr:
+                print(f"Error output: {stream.stderr}")
+        if mark:
+            # Only advance the mark once the walk reached it or the end of the feed;
+            # a run cut by --range or a failure keeps the band it fetched instead,
+            # otherwise posts between where it stopped and the old mark would be skipped
+            complete = caught_up or (not failed and records_seen < limit)
+            state.record_run(profile, mark, complete)
+        record_pacing(stream.returncode, stream.stderr)
+        
+    except subprocess.TimeoutExpired:
+        print("⏰ Operation timed out after 10 minutes")
+        count = out.count
+    except Exception as e:
+        print(f"❌ Error running gallery-dl: {e}")
+        return None
+    
+    if known:
+        print(f"   ↷ Skipped {known} URLs already downloaded (media index)")
+    if count == 0 and os.path.exists(filename):
+        os.remove(filename)
+    
+    return count, errors, samples
+
 def save_urls(urls, filename):
-    """Save URLs to CSV file"""
+    """Save URLs to the output file in the chosen --format"""
     try:
-        with open(filename, 'w', encoding='utf-8', newline='') as f:
-            f.write("index,url\n")
-            for idx, url in enumerate(urls, 1):
-                f.write(f"{idx},{url}\n")
+        write_urls(urls, filename, args.format)
         
         print(f"💾 Saved {len(urls)} URLs to {filename}")
         return True
@@ -185,10 +337,13 @@ def save_urls(urls, filename):
         print(f"❌ Failed to save URLs: {e}")
         return False
 
-def display_results(urls, errors):
+def display_results(urls, errors, total=None):
     """Display extraction results"""
+    if total is None:
+        total = len(urls)
+    
     print(f"\n📊 Results:")
-    print(f"   ✓ Successfully extracted: {len(urls)} URLs")
+    print(f"   ✓ Successfully extracted: {total} URLs")
     
     if errors:
         print(f"   ⚠️  Parsing errors: {len(errors)}")
@@ -198,29 +353,102 @@ def display_results(urls, errors):
             if len(errors) > 5:
                 print(f"      ... and {len(errors) - 5} more errors")
     
-    if urls:
+    if urls and not args.quiet:
         print(f"\n📸 Sample URLs (first 3):")
         for i, url in enumerate(urls[:3], 1):
             print(f"   {i}: {url}")
         
-        if len(urls) > 3:
-            print(f"   ... and {len(urls) - 3} more")
+        if total > 3:
+            print(f"   ... and {total - 3} more")
+
+def record_pacing(returncode, stderr):
+    """Feed a finished gallery-dl run back into the pacing controller"""
+    if is_rate_limit_error(stderr):
+        pacer.on_rate_limit()
+        print(f"🐢 Rate limited, slowing gallery-dl to {pacer.sleep_request()}s between requests")
+    elif returncode == 0:
+        pacer.on_success()
 
-def main():
+def extract_profile_shard(profile, media_index=None, state=None):
+    """Extract one watchlist profile into its own CSV shard"""
+    if use_inprocess():
+        streamed = stream_gallery_dl_to_csv(profile, args.limit, shard_path(args.output, profile), None,
+                                            media_index, state)
+        if streamed is None:
+            raise RuntimeError("gallery-dl extraction failed")
+        return streamed[0]
+    
+    # Fresh config per profile so it picks up the current sleep-request range
+    fd, config_path = tempfile.mkstemp(suffix='.json', prefix='gallery_dl_')
+    os.close(fd)
+    try:
+        create_config_file(config_path)
+        streamed = stream_gallery_dl_to_csv(profile, args.limit, shard_path(args.output, profile), config_path,
+                                            media_index, state)
+    finally:
+        os.remove(config_path)
+    if streamed is None:
+        raise RuntimeError("failed to run gallery-dl")
+    
+    count, errors, samples = streamed
+    return count
+
+def main(argv=None):
+    global args, decoder
+    args = parse_args(argv)
+    decoder = get_decoder(args.decoder)
+    
     print("🚀 Instagram URL Extractor using gallery-dl")
     print("=" * 50)
+    start_metrics(args.metrics, args.metrics_port)
     
     # Check dependencies
     if not check_gallery_dl():
         sys.exit(1)
     
-    print(f"🎯 Target: @{args.profile}")
+    profiles = load_profiles_file(args.profiles_file) if args.profiles_file else None
+    
+    if profiles:
+        print(f"🎯 Targets: {len(profiles)} profiles from {args.profiles_file}")
+    else:
+        print(f"🎯 Target: @{args.profile}")
     print(f"🔢 Limit: {args.limit} posts")
     
-    # Create temporary config
-    config_path = create_config_file()
+    # Create temporary config (the in-process backend takes it as a dict instead)
+    config_path = None if use_inprocess() else create_config_file()
+    media_index = MediaIndex(args.index) if args.index else None
+    state = ProfileState(args.state) if args.state else None
     
     try:
+        if profiles:
+            print(f"\n🔄 Starting multi-profile extraction...")
+            results = run_profiles(profiles, lambda profile: extract_profile_shard(profile, media_index, state),
+                                   max_workers=args.workers, output=args.output)
+            print_summary(results)
+            write_summary(results, args.output)
+            return
+        
+        if args.stream or state or use_inprocess():
+            print(f"\n🔄 Starting streaming extraction into {args.output}...")
+            streamed = stream_gallery_dl_to_csv(args.profile, args.limit, args.output, config_path,
+                                                media_index, state)
+            
+            if streamed is None:
+                print("❌ Failed to run gallery-dl")
+                sys.exit(1)
+            
+            count, errors, samples = streamed
+            display_results(samples, errors, total=count)
+            
+            if count:
+                print(f"\n✅ Success! Check {args.output} for all URLs")
+            else:
+                print(f"\n❌ No URLs extracted. Possible causes:")
+                print(f"   • Account is private (try --cookies or --username/--password)")
+                print(f"   • Rate limiting by Instagram")
+                print(f"   • Network issues")
+            return
+        
         # Run gallery-dl
         print(f"\n🔄 Starting extraction...")
         result = run_gallery_dl_command(args.profile, args.limit, config_path)
@@ -228,10 +456,19 @@ def main():
         if result is None:
             print("❌ Failed to run gallery-dl")
             sys.exit(1)
+        record_pacing(result.returncode, result.stderr)
         
         # Parse results
         print(f"🔍 Parsing results...")
-        urls, errors = parse_gallery_dl_output(result)
+        with metrics.phase('parse'):
+            urls, errors = parse_gallery_dl_output(result)
+        metrics.incr('records', len(urls))
+        
+        if media_index:
+            new_urls = [url for url in urls if media_index.add_extracted(url, args.profile)]
+            if len(new_urls) < len(urls):
+                print(f"   ↷ Skipped {len(urls) - len(new_urls)} URLs already downloaded (media index)")
+            urls = new_urls
         
         # Display results
         display_results(urls, errors)
@@ -242,10 +479,11 @@ def main():
                 print(f"\n✅ Success! Check {args.output} for all URLs")
             
             # Also print for immediate use
-            print(f"\n📋 All URLs (CSV format):")
-            print("=" * 50)
-            for idx, url in enumerate(urls, 1):
-                print(f"{idx},{url}")
+            if not args.quiet:
+                print(f"\n📋 All URLs (CSV format):")
+                print("=" * 50)
+                for idx, url in enumerate(urls, 1):
+                    print(f"{idx},{url}")
         else:
             print(f"\n❌ No URLs extracted. Possible causes:")
             print(f"   • Account is private (try --cookies or --username/--password)")
@@ -261,7 +499,9 @@ def main():
     
     finally:
         # Cleanup
-        if os.path.exists(config_path):
+        if media_index:
+            media_index.close()
+        if config_path and os.path.exists(config_path):
             os.remove(config_path)
 
 if __name__ == "__main__":
@@ -12,6 +12,8 @@ import tempfile
 import os
 from pathlib import Path
 
+from output_formats import FORMATS, output_path, write_urls
+
 def create_config_file(username=None, password=None, cookies_file=None):
     """Create a gallery-dl config file with authentication"""
     config = {
@@ -168,9 +170,14 @@ def main():
     parser.add_argument('--password', help='Instagram password for authentication')
     parser.add_argument('--cookies', help='Path to cookies.txt file')
     parser.add_argument('--output', help='Output file for URLs (default: print to stdout)')
+    parser.add_argument('--format', choices=FORMATS,
+                       help='Write --output as csv, jsonl, sqlite, parquet or arrow instead of plain "index, url" lines')
+    parser.add_argument('--quiet', '-q', action='store_true', help="Don't echo the URLs to the terminal")
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose output')
     
     args = parser.parse_args()
+    if args.output and args.format:
+        args.output = output_path(args.output, args.format)
     
     # Extract URLs
     urls, errors = extract_urls_with_auth(
@@ -190,16 +197,24 @@ def main():
     print()
     
     if urls:
-        print("🖼️  Image URLs:")
-        print("=" * 50)
+        if not args.quiet:
+            print("🖼️  Image URLs:")
+            print("=" * 50)
         
-        if args.output:
+        if args.output and args.format:
+            write_urls(urls, args.output, args.format)
+            if not args.quiet:
+                for idx, url in enumerate(urls, 1):
+                    print(f"{idx:3d}: {url}")
+            print(f"\n✓ URLs saved to: {args.output}")
+        elif args.output:
             # Write to file
             with open(args.output, 'w') as f:
                 for idx, url in enumerate(urls, 1):
                     line = f"{idx}, {url}\n"
                     f.write(line)
-                    print(f"{idx:3d}: {url}")
+                    if not args.quiet:
+                        print(f"{idx:3d}: {url}")
             print(f"\n✓ URLs saved to: {args.output}")
         else:
             # Print to stdout
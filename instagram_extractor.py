@@ -0,0 +1,396 @@
+"""
+Instaloader profile extraction as a library
+Everything insta.py does to turn a profile into image links (profile lookup,
+the paced post walk, carousel expansion, --variant selection, high-water marks
+for incremental runs, hedging with gallery-dl) without parsing arguments,
+logging in or sleeping at import time. insta.py is the command line on top.
+"""
+
+import threading
+
+import instaloader
+from instaloader.exceptions import ConnectionException
+
+from account_pool import CountingRateController
+from http_cache import cache_instaloader
+from media_variants import media_candidates
+from metrics import metrics, instrument_instaloader
+from pipeline import ordered_map
+from profile_state import HighWaterMark, parse_timestamp
+from rate_control import AIMDController, is_rate_limit_error
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+PAGE_SIZE = 12  # posts per get_posts() page
+LINK_LIMIT = 500
+
+
+def _silent(*args, **kwargs):
+    pass
+
+
+def create_loader(rate_controller=None, cache=None):
+    """Create Instaloader instance with more conservative settings"""
+    loader = instaloader.Instaloader(
+        download_pictures=False,
+        download_videos=False,
+        download_video_thumbnails=False,
+        download_geotags=False,
+        download_comments=False,
+        save_metadata=False,
+        post_metadata_txt_pattern='',
+        max_connection_attempts=1,  # Reduce connection attempts
+        request_timeout=15.0,       # Increase timeout
+        user_agent=USER_AGENT,
+        rate_controller=rate_controller or CountingRateController
+    )
+    instrument_instaloader(loader.context)  # before the cache, so hits aren't counted as requests
+    if cache:
+        cache_instaloader(loader.context, cache)
+    return loader
+
+
+class PerThreadContext:
+    """Stands in for loader.context, giving every other thread its own copy of the logged-in session
+
+    An InstaloaderContext (its requests.Session and RateController) isn't
+    thread-safe, so with --pipeline the post walk and each carousel worker get a
+    fresh loader carrying the same cookies; the thread that made this one keeps
+    using the loader itself.
+    """
+
+    def __init__(self, loader, cache=None):
+        self._loader = loader
+        self._cache = cache
+        self._owner = threading.get_ident()
+        self._local = threading.local()
+
+    def _context(self):
+        context = getattr(self._local, 'context', None)
+        if context is None:
+            context = self._loader.context
+            if threading.get_ident() != self._owner:
+                copy = create_loader(cache=self._cache)
+                if context.is_logged_in:
+                    copy.context.load_session(context.username, context.save_session())
+                context = copy.context
+            self._local.context = context
+        return context
+
+    def __getattr__(self, name):
+        return getattr(self._context(), name)
+
+
+def login(loader, username, password=None, session_file=None, log=None):
+    """Reuse username's saved session, or log in with password and save one; True if a session was loaded"""
+    log = log or _silent
+    try:
+        loader.load_session_from_file(username, session_file)
+        log("Loaded existing session")
+        return True
+    except FileNotFoundError:
+        if password is None:
+            raise
+        log("No existing session found, logging in...")
+        loader.login(username, password)
+        loader.save_session_to_file(session_file)
+        log("Login successful and session saved!")
+        return False
+
+
+def sidecar_media_nodes(post):
+    """Raw media nodes of a sidecar post, in the same order as get_sidecar_nodes()"""
+    iphone_struct = post._node.get('iphone_struct') or {}
+    if iphone_struct.get('carousel_media'):
+        return iphone_struct['carousel_media']
+    return [edge['node'] for edge in post._node.get('edge_sidecar_to_children', {}).get('edges', [])]
+
+
+def pick_variant(node, default_url, variant=None):
+    """(url, width, height) of the image a VariantPolicy asks for; default_url() is instaloader's own pick"""
+    candidates = media_candidates(node)
+    if variant is None or variant.mode == 'largest':
+        # instaloader already picks the full-size image (and tidies its URL), just add its size
+        best = max(candidates, key=lambda c: c.width or 0, default=None)
+        return default_url(), best.width if best else None, best.height if best else None
+    chosen = variant.choose(candidates)
+    if chosen is None:
+        return default_url(), None, None
+    return chosen.url, chosen.width, chosen.height
+
+
+def post_links(post, variant=None):
+    """(url, shortcode, width, height) links of one post; expanding a carousel may cost a request"""
+    if post.typename == "GraphImage":
+        url, width, height = pick_variant(post._node, lambda: post.url, variant)
+        return [(url, post.shortcode, width, height)]
+    links = []
+    if post.typename == "GraphSidecar":
+        # For posts with multiple images
+        nodes = sidecar_media_nodes(post)
+        for num, resource in enumerate(post.get_sidecar_nodes()):
+            node = nodes[num] if num < len(nodes) else {}
+            url, width, height = pick_variant(node, lambda: resource.display_url, variant)
+            links.append((url, post.shortcode, width, height))
+    return links
+
+
+def new_posts(posts, profile_name, mark=None, post_dates=None, log=None):
+    """Posts not seen on a previous run, stopping where the high-water mark says to"""
+    for post in posts:
+        if mark:
+            status = mark.observe(post.shortcode, post.date_utc, pinned=post.is_pinned)
+            if status == 'stop':
+                (log or _silent)(f"Reached posts from a previous run of @{profile_name}, stopping")
+                return
+            if status == 'known':
+                continue
+        metrics.incr('posts')
+        if post_dates is not None and not post.is_pinned:
+            post_dates.append(parse_timestamp(post.date_utc))
+        yield post
+
+
+class ProfileExtractor:
+    """Turns profiles into (url, shortcode, width, height) image links with instaloader
+
+    Requests go through `loader`, or through an AccountPool given as `pool`,
+    and are paced by `pacer`, which every profile walked shares. `state` (a
+    ProfileState) makes walks incremental, `variant` (a VariantPolicy) picks the
+    image size, `pipeline` expands carousels on that many threads and `hedge`
+    races gallery-dl after that many seconds without results. Progress goes to
+    `log` (print in the CLI, nowhere by default).
+    """
+
+    def __init__(self, loader=None, pool=None, pacer=None, state=None, variant=None, pipeline=None,
+                 hedge=None, limit=LINK_LIMIT, cache=None, log=None, verbose=False):
+        self.loader = loader
+        self.pool = pool
+        # Adaptive pacing: speeds up while Instagram answers, backs off hard when it rate limits
+        self.pacer = pacer or AIMDController(initial_delay=3.5)
+        self.state = state
+        self.variant = variant
+        self.pipeline = pipeline
+        self.hedge = hedge
+        self.limit = limit
+        self.cache = cache
+        self.log = log or _silent
+        self.verbose = verbose
+
+    def fetch_posts_with_retry(self, profile, max_retries=3):
+        """Fetch posts with exponential backoff retry mechanism"""
+        pacer, log = self.pacer, self.log
+        for attempt in range(max_retries):
+            try:
+                log(f"Attempt {attempt + 1} to fetch posts...")
+                posts = profile.get_posts()
+                log("Successfully fetched posts!")
+                return posts
+            except ConnectionException as e:
+                if is_rate_limit_error(e):
+                    wait_time = pacer.on_rate_limit()
+                    log(f"Rate limited on attempt {attempt + 1}. Waiting {wait_time:.0f} seconds...")
+                    log(f"Instagram says: Please wait a few minutes before you try again.")
+
+                    if attempt < max_retries - 1:
+                        log(f"This is normal. We'll wait and try again automatically.")
+                        pacer.pause(wait_time)
+                        continue
+                    else:
+                        log(f"Reached maximum retries. Consider running the script again later.")
+                raise e
+        return None
+
+    def try_alternative_approach(self, profile):
+        """Try an alternative approach to get post data"""
+        log = self.log
+        try:
+            log("Trying alternative approach - getting basic profile info first...")
+
+            # Get basic profile info without posts
+            log(f"Posts count: {profile.mediacount}")
+            log(f"Followers: {profile.followers}")
+            log(f"Following: {profile.followees}")
+
+            # Try to get a smaller number of posts first
+            log("Trying to get posts with takewhile to limit requests...")
+            from itertools import islice
+
+            posts = islice(profile.get_posts(), 50)  # Only get first 50 posts
+            return posts
+
+        except Exception as e:
+            log(f"Alternative approach also failed: {e}")
+            return None
+
+    def paced_post_links(self, post, max_retries=3):
+        """post_links() on a pipeline worker: carousels take a turn on the shared pacer first; None if it gave up"""
+        pacer = self.pacer
+        for attempt in range(max_retries):
+            if post.typename == "GraphSidecar":
+                pacer.acquire()
+            try:
+                links = post_links(post, self.variant)
+                pacer.on_success()
+                return links
+            except ConnectionException as e:
+                if not is_rate_limit_error(e):
+                    self.log(f"Connection error on post {post.shortcode}: {e}")
+                    pacer.hold(30)
+                    return None
+                wait_time = pacer.on_rate_limit()
+                self.log(f"Rate limited on post {post.shortcode}. Holding all workers for {wait_time:.0f} seconds...")
+                pacer.hold(wait_time)
+        self.log(f"Giving up on post {post.shortcode} after {max_retries} rate limits")
+        return None
+
+    def paced_pages(self, posts):
+        """Take a pacer turn before each post that starts a new page (and so costs a request)"""
+        posts = iter(posts)
+        num = 0
+        while True:
+            if num and num % PAGE_SIZE == 0:
+                self.pacer.acquire()
+            try:
+                post = next(posts)
+            except StopIteration:
+                return
+            num += 1
+            yield post
+
+    def links(self, profile_name, loader=None, post_dates=None):
+        """Yield (url, shortcode, width, height) image links for one profile, stopping at posts already seen when state is given
+
+        With an AccountPool every request (the lookup, each page of posts, each
+        carousel) goes through whichever account has budget left. The
+        high-water mark only moves when the walk gets down to it (or to the end
+        of the feed) without dropping a post; a walk cut short by the link limit
+        or by failed posts records the band of posts it did fetch instead. New
+        posts' timestamps are appended to `post_dates` if given.
+
+        With pipeline set the walk runs on its own thread while a few workers
+        expand carousels ahead of it; links still come out in post order. Each
+        of those threads gets its own copy of the loader's session (see
+        PerThreadContext).
+        """
+        loader = loader or self.loader
+        pool, pacer, log, state = self.pool, self.pacer, self.log, self.state
+        log("Getting profile...")
+        with metrics.phase('profile_lookup'):
+            if pool:
+                profile = pool.profile(profile_name)
+            else:
+                # Pipeline threads must not share the loader's session; the pool locks per account instead
+                context = PerThreadContext(loader, self.cache) if self.pipeline else loader.context
+                profile = instaloader.Profile.from_username(context, profile_name)
+        log(f"Profile found: {profile.full_name} (@{profile.username})")
+
+        pacer.on_success()
+        log(f"Waiting {pacer.delay:.1f} seconds before fetching posts...")
+        pacer.wait()
+
+        log("Fetching posts...")
+        posts = self.fetch_posts_with_retry(profile)
+
+        if posts is None:
+            log("Primary method failed. Trying alternative approach...")
+            posts = self.try_alternative_approach(profile)
+
+        if posts is None:
+            log("Failed to fetch posts with primary method, trying alternative approach...")
+            posts = self.try_alternative_approach(profile)
+
+        if posts is None:
+            raise RuntimeError("Failed to fetch posts after all retries")
+
+        found = 0
+        post_count = 0
+        mark = HighWaterMark(state.get(profile_name)) if state else None
+
+        if self.pipeline:
+            walk = new_posts(self.paced_pages(posts), profile_name, mark, post_dates, log)
+            expanded = ordered_map(self.paced_post_links, walk, workers=self.pipeline)
+        else:
+            expanded = ((post, None) for post in new_posts(posts, profile_name, mark, post_dates, log))
+
+        complete = True
+        for post, future in expanded:
+            try:
+                post_count += 1
+                if self.verbose:
+                    log(f"Processing post {post_count}...")
+
+                # A pipeline worker has already expanded (and paced) the post
+                links = future.result() if future else post_links(post, self.variant)
+                if links is None:
+                    if mark:
+                        mark.failed()
+                    continue
+                if mark:
+                    mark.done(post.shortcode, post.date_utc, post.is_pinned)
+                found += len(links)
+                metrics.incr('links', len(links))
+                yield from links
+
+                if post_count % 5 == 0:
+                    log(f"Processed {post_count} posts, pacing at {pacer.rate * 60:.0f} requests/min")
+                if not future:
+                    # Pace the next request by how well Instagram has been answering
+                    pacer.on_success()
+                    pacer.wait()
+
+                if found >= self.limit:
+                    log(f"Reached {self.limit} image limit")
+                    complete = False
+                    break
+
+            except ConnectionException as e:
+                if mark:
+                    mark.failed()
+                if is_rate_limit_error(e):
+                    wait_time = pacer.on_rate_limit()
+                    log(f"Rate limited on post {post_count}. Waiting {wait_time:.0f} seconds...")
+                    pacer.pause(wait_time)
+                    continue
+                else:
+                    log(f"Connection error on post {post_count}: {e}")
+                    pacer.pause(30)
+                    continue
+            except Exception as e:
+                if mark:
+                    mark.failed()
+                log(f"Error processing post {post_count}: {e}")
+                pacer.pause(5)
+                continue
+        expanded.close()
+
+        if mark:
+            state.record_run(profile_name, mark, complete)
+
+    def scrape(self, profile_name, loader=None):
+        """Collect image links for one profile, hedging with gallery-dl when hedge is set"""
+        loader = loader or self.loader
+        if self.hedge is None:
+            return list(self.links(profile_name, loader))
+        # gallery-dl only matters when hedging; don't pay for importing it otherwise
+        import gallery_dl_backend
+        from hedging import Backend, HedgedExtraction, gallery_dl_json_backend, gallery_dl_print_backend
+
+        instagram_url = f"https://www.instagram.com/{profile_name}/"
+        context = loader.context if loader else self.pool.choose().context
+        gallery_dl_options = {}
+        if gallery_dl_backend.available():
+            # Let gallery-dl reuse the logged-in session's cookies
+            gallery_dl_options = {'inprocess': True, 'cookies': context._session.cookies.get_dict(),
+                                  'cache': self.cache}
+        backends = [
+            Backend('instaloader', lambda: self.links(profile_name, loader)),
+            gallery_dl_json_backend(instagram_url, self.limit, **gallery_dl_options),
+            gallery_dl_print_backend(instagram_url, self.limit),
+        ]
+
+        extraction = HedgedExtraction(backends, hedge_delay=self.hedge, verbose=self.log is not _silent)
+        links = list(extraction)
+        if extraction.winner is None:
+            raise RuntimeError("; ".join(f"{name}: {error}" for name, error in extraction.errors.items())
+                               or "No backend returned any posts")
+        return links
@@ -0,0 +1,105 @@
+"""
+instaload as a library
+One import for embedding the extractors in another program. Nothing heavy is
+imported up front: instaloader, gallery-dl, requests, numpy and Pillow load the
+first time a name that needs them is used, so `import instaload` stays cheap
+and has no side effects (no argument parsing, logins, sleeps or files).
+
+    import instaload
+    for url, shortcode, width, height in instaload.profile_links('some_profile', session_file='session-me'):
+        ...
+    for url, shortcode, width, height in instaload.gallery_dl_links('some_profile', limit=50):
+        ...
+"""
+
+import importlib
+
+# Public name -> module it lives in, imported on first attribute access
+_LAZY = {
+    # instaloader extraction
+    'ProfileExtractor': 'instagram_extractor',
+    'create_loader': 'instagram_extractor',
+    'login': 'instagram_extractor',
+    'post_links': 'instagram_extractor',
+    'AccountPool': 'account_pool',
+    # gallery-dl extraction
+    'GalleryDLInProcess': 'gallery_dl_backend',
+    'iter_records': 'gallery_dl_backend',
+    'HedgedExtraction': 'hedging',
+    'Backend': 'hedging',
+    'gallery_dl_json_backend': 'hedging',
+    'gallery_dl_print_backend': 'hedging',
+    # pacing, state and caching
+    'AIMDController': 'rate_control',
+    'ProfileState': 'profile_state',
+    'PollScheduler': 'scheduler',
+    'ResponseCache': 'http_cache',
+    'open_queue': 'job_queue',
+    'parse_variant': 'media_variants',
+    'metrics': 'metrics',
+    # output and downloads
+    'write_urls': 'output_formats',
+    'open_writer': 'output_formats',
+    'read_rows': 'output_formats',
+    'download_all': 'downloader',
+    'ArchiveWriter': 'archive_writer',
+    'generate_derivatives': 'derivatives',
+    'MediaIndex': 'media_index',
+    'RepostIndex': 'repost_index',
+}
+
+__all__ = sorted(list(_LAZY) + ['profile_links', 'gallery_dl_links'])
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return __all__
+
+
+def profile_links(profile, session_file=None, username=None, loader=None, **options):
+    """Yield (url, shortcode, width, height) for a profile's images with instaloader
+
+    Uses `loader` if given, else a fresh one that loads username's saved
+    session from session_file when those are set (anonymous otherwise).
+    Other keyword arguments go to ProfileExtractor (pacer, state, variant,
+    pipeline, limit, cache, log, ...).
+    """
+    from instagram_extractor import ProfileExtractor, create_loader, login
+
+    if loader is None:
+        loader = create_loader(cache=options.get('cache'))
+        if username:
+            login(loader, username, session_file=session_file)
+    yield from ProfileExtractor(loader, **options).links(profile)
+
+
+def gallery_dl_links(profile, limit=500, inprocess=None, hedge_delay=None, **inprocess_options):
+    """Yield (url, shortcode, width, height) for a profile's images with gallery-dl
+
+    Runs in-process when gallery-dl is importable (inprocess=None) and passes
+    inprocess_options (cookies, config, cache) through. With hedge_delay set,
+    gallery-dl's print mode is raced in after that many seconds without a
+    record; its links carry no size, so width and height are None.
+    """
+    import gallery_dl_backend
+    from hedging import HedgedExtraction, gallery_dl_json_backend, gallery_dl_print_backend
+
+    if inprocess is None:
+        inprocess = gallery_dl_backend.available()
+    url = f"https://www.instagram.com/{profile}/"
+    backends = [gallery_dl_json_backend(url, limit, inprocess=inprocess, **inprocess_options)]
+    if hedge_delay is not None:
+        backends.append(gallery_dl_print_backend(url, limit))
+    extraction = HedgedExtraction(backends, hedge_delay=hedge_delay or 0, verbose=False)
+    for record in extraction:
+        yield tuple(record) + (None,) * (4 - len(record))
+    if extraction.winner is None and extraction.errors:
+        raise RuntimeError("; ".join(f"{name}: {error}" for name, error in extraction.errors.items()))
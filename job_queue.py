@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Shared profile job queue for running extractors on several machines
+Workers lease a job (a profile name), renew the lease with heartbeats while
+they scrape it and record a result pointer (the shard they wrote) when done.
+A lease that stops being renewed (crashed worker, dead box) expires and the job
+goes back to the queue, up to max_attempts. No central service: the queue is a
+SQLite file or a plain directory on storage every worker can reach.
+
+SQLite relies on the file system's locks and runs without WAL so it also
+works on a network share; the directory backend only needs atomic rename, which
+NFS and SMB provide even where their locking is unreliable.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+from urllib.parse import quote, unquote
+
+DEFAULT_LEASE = 300  # seconds; heartbeats renew it every lease / 3
+DEFAULT_MAX_ATTEMPTS = 3
+SQLITE_SUFFIXES = ('.sqlite3', '.sqlite', '.db')
+STATES = ('queued', 'leased', 'done', 'failed')
+
+
+class LeaseLost(Exception):
+    """The lease expired and the job was handed to another worker"""
+
+
+class Job(NamedTuple):
+    id: str
+    payload: Optional[dict]
+    attempts: int
+    token: str
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """Lease loop and heartbeats shared by both backends"""
+
+    def __init__(self, lease_seconds=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def leases(self, worker=None):
+        """Lease jobs one after another until none are left"""
+        worker = worker or default_worker_id()
+        while True:
+            job = self.lease(worker)
+            if job is None:
+                return
+            yield job
+
+    def heartbeat(self, job):
+        """Context manager renewing job's lease in the background while it runs"""
+        return Heartbeat(self, job)
+
+
+class Heartbeat:
+    """Renews a lease every lease_seconds / 3 until the block exits; .lost is set if it couldn't"""
+
+    def __init__(self, queue, job):
+        self.queue = queue
+        self.job = job
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job.id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.renew(self.job)
+            except LeaseLost:
+                self.lost = True
+                print(f"⚠️  Lost the lease on {self.job.id}; another worker may redo it")
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+
+class SQLiteJobQueue(JobQueue):
+    """Jobs in one SQLite table; every state change is its own short transaction"""
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        super().__init__(lease_seconds, max_attempts)
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode, so BEGIN IMMEDIATE below is the only transaction control
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                payload TEXT,
+                status TEXT NOT NULL DEFAULT 'queued',
+                worker TEXT,
+                token TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                added_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, added_at)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front, so two workers can't claim one job"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def add(self, ids, payload=None, again=False):
+        """Queue jobs that aren't known yet (or, with again, also re-queue finished ones); returns how many"""
+        now = time.time()
+        payload = json.dumps(payload) if payload is not None else None
+        added = 0
+        with self._transaction() as conn:
+            for job_id in ids:
+                added += conn.execute(
+                    "INSERT OR IGNORE INTO jobs (id, payload, added_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (job_id, payload, now, now)).rowcount
+                if again:
+                    added += conn.execute(
+                        "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, updated_at = ? "
+                        "WHERE id = ? AND status IN ('done', 'failed')", (now, job_id)).rowcount
+        return added
+
+    def lease(self, worker):
+        """Claim the oldest queued job (re-queueing abandoned leases first), or None"""
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "error = 'lease expired', token = NULL, updated_at = ? "
+                "WHERE status = 'leased' AND lease_until < ?", (self.max_attempts, now, now))
+            row = conn.execute(
+                "SELECT id, payload, attempts FROM jobs WHERE status = 'queued' "
+                "ORDER BY added_at, rowid LIMIT 1").fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', worker = ?, token = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker, token, now + self.lease_seconds, now, row[0]))
+        if row is None:
+            return None
+        return Job(row[0], json.loads(row[1]) if row[1] else None, row[2] + 1, token)
+
+    def _owned(self, job, sql, params):
+        with self._transaction() as conn:
+            cursor = conn.execute(sql + " WHERE id = ? AND token = ? AND status = 'leased'",
+                                  (*params, job.id, job.token))
+        if cursor.rowcount == 0:
+            raise LeaseLost(job.id)
+
+    def renew(self, job):
+        now = time.time()
+        self._owned(job, "UPDATE jobs SET lease_until = ?, updated_at = ?", (now + self.lease_seconds, now))
+
+    def complete(self, job, result=None):
+        """Mark the job done with a pointer to its result (e.g. the shard path)"""
+        self._owned(job, "UPDATE jobs SET status = 'done', result = ?, error = NULL, token = NULL, updated_at = ?",
+                    (result, time.time()))
+
+    def fail(self, job, error):
+        """Give the job back for another attempt, or fail it for good after max_attempts"""
+        status = 'failed' if job.attempts >= self.max_attempts else 'queued'
+        self._owned(job, "UPDATE jobs SET status = ?, error = ?, token = NULL, updated_at = ?",
+                    (status, str(error), time.time()))
+
+    def jobs(self):
+        """Every job as a dict, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, status, worker, attempts, result, error, lease_until FROM jobs "
+                "ORDER BY added_at, rowid").fetchall()
+        keys = ('id', 'status', 'worker', 'attempts', 'result', 'error', 'lease_until')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DirectoryJobQueue(JobQueue):
+    """One JSON file per job, moved between queued/, leased/, done/ and failed/ by atomic renames
+
+    A leased file is named <id>.<token>.json and its mtime is the last
+    heartbeat, so renewing is a touch. Every state change first renames the
+    job file into claims/, which only one worker can do, updates it there and
+    then renames it into its new state, so nothing is ever written at a path
+    another worker can already see. Claims left behind by a crashed worker go
+    back where they came from once they are a lease old.
+    """
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        super().__init__(lease_seconds, max_attempts)
+        self.path = path
+        for state in STATES + ('claims',):
+            os.makedirs(os.path.join(path, state), exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _file(self, state, job_id, token=None):
+        name = quote(job_id, safe='') + (f".{token}" if token else '') + '.json'
+        return os.path.join(self.path, state, name)
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write(path, record):
+        part = f"{path}.{uuid.uuid4().hex}.part"
+        with open(part, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(part, path)
+
+    def _entries(self, state):
+        """(job id, token, path) of the job files in one state directory"""
+        with os.scandir(os.path.join(self.path, state)) as entries:
+            names = [entry.name for entry in entries if entry.name.endswith('.json')]
+        for name in names:
+            stem = name[:-len('.json')]
+            job_id, _, token = stem.rpartition('.') if state == 'leased' else (stem, '', '')
+            yield unquote(job_id), token or None, os.path.join(self.path, state, name)
+
+    def _claims(self):
+        """(job id, state it was claimed from, path) of the files in claims/"""
+        with os.scandir(os.path.join(self.path, 'claims')) as entries:
+            names = [entry.name for entry in entries if entry.name.endswith('.claim')]
+        for name in names:
+            job_id, _, state = name[:-len('.claim')].rsplit('.', 2)
+            yield unquote(job_id), state, os.path.join(self.path, 'claims', name)
+
+    def _claim(self, path, job_id, state):
+        """Move a job file into claims/ so only we can change it; None if another worker got it first"""
+        claim = os.path.join(self.path, 'claims', f"{quote(job_id, safe='')}.{uuid.uuid4().hex}.{state}.claim")
+        try:
+            os.utime(path)  # a rename keeps the old mtime, and an old claim looks abandoned
+            os.rename(path, claim)
+        except FileNotFoundError:
+            return None
+        return claim
+
+    @staticmethod
+    def _settle(claim, record, path):
+        """Rewrite a claimed file and rename it to path; FileNotFoundError if the claim was taken back"""
+        with open(claim, 'r+', encoding='utf-8') as f:  # not 'w': that would recreate a claim taken back
+            f.truncate()
+            json.dump(record, f)
+        os.rename(claim, path)
+
+    def add(self, ids, payload=None, again=False):
+        added = 0
+        known = {state: {job_id for job_id, _, _ in self._entries(state)} for state in STATES}
+        claimed = {job_id for job_id, _, _ in self._claims()}
+        now = time.time()
+        for job_id in ids:
+            record = {"id": job_id, "payload": payload, "attempts": 0, "added_at": now}
+            if again and (job_id in known['done'] or job_id in known['failed']):
+                state = 'done' if job_id in known['done'] else 'failed'
+                claim = self._claim(self._file(state, job_id), job_id, state)
+                if claim is None:
+                    continue
+                try:
+                    self._settle(claim, record, self._file('queued', job_id))
+                except FileNotFoundError:
+                    continue
+                added += 1
+            elif job_id not in claimed and not any(job_id in names for names in known.values()):
+                self._write(self._file('queued', job_id), record)
+                added += 1
+        return added
+
+    def _recover_claims(self, now):
+        """Put claims whose worker died mid-update back in the state they were taken from"""
+        for job_id, state, path in self._claims():
+            try:
+                if os.path.getmtime(path) + self.lease_seconds >= now:
+                    continue
+                try:
+                    self._read(path)
+                except ValueError:
+                    # Died halfway through rewriting it; the payload is lost but the job isn't
+                    with open(path, 'w', encoding='utf-8') as f:
+                        json.dump({"id": job_id, "payload": None, "attempts": 0, "added_at": now}, f)
+                os.rename(path, self._file('queued' if state == 'leased' else state, job_id))
+            except FileNotFoundError:
+                continue
+
+    def _requeue_abandoned(self):
+        now = time.time()
+        self._recover_claims(now)
+        for job_id, token, path in self._entries('leased'):
+            try:
+                if os.path.getmtime(path) + self.lease_seconds >= now:
+                    continue
+            except FileNotFoundError:
+                continue
+            claim = self._claim(path, job_id, 'leased')
+            if claim is None:
+                continue  # renewed, finished or reclaimed by someone else meanwhile
+            record = self._read(claim)
+            state = 'failed' if record.get('attempts', 0) >= self.max_attempts else 'queued'
+            record['error'] = 'lease expired'
+            try:
+                self._settle(claim, record, self._file(state, job_id))
+            except FileNotFoundError:
+                continue
+
+    def lease(self, worker):
+        self._requeue_abandoned()
+        queued = []
+        for job_id, _, path in self._entries('queued'):
+            try:
+                queued.append((os.path.getmtime(path), job_id, path))
+            except FileNotFoundError:
+                continue
+        for _, job_id, path in sorted(queued):
+            claim = self._claim(path, job_id, 'queued')  # only one worker's rename can succeed
+            if claim is None:
+                continue
+            record = self._read(claim)
+            record.update(attempts=record.get('attempts', 0) + 1, worker=worker)
+            token = uuid.uuid4().hex
+            try:
+                # Written moments ago, so the new lease starts with a fresh mtime
+                self._settle(claim, record, self._file('leased', job_id, token))
+            except FileNotFoundError:
+                continue
+            return Job(job_id, record.get('payload'), record['attempts'], token)
+        return None
+
+    def renew(self, job):
+        try:
+            os.utime(self._file('leased', job.id, job.token))
+        except FileNotFoundError:
+            raise LeaseLost(job.id)
+
+    def _finish(self, job, state, **fields):
+        claim = self._claim(self._file('leased', job.id, job.token), job.id, 'leased')
+        if claim is None:
+            raise LeaseLost(job.id)
+        record = self._read(claim)
+        record.update(fields, updated_at=time.time())
+        try:
+            self._settle(claim, record, self._file(state, job.id))
+        except FileNotFoundError:
+            raise LeaseLost(job.id)
+
+    def complete(self, job, result=None):
+        self._finish(job, 'done', result=result, error=None)
+
+    def fail(self, job, error):
+        self._finish(job, 'failed' if job.attempts >= self.max_attempts else 'queued', error=str(error))
+
+    def jobs(self):
+        jobs = []
+        for state in STATES:
+            for job_id, _, path in self._entries(state):
+                try:
+                    record = self._read(path)
+                except (FileNotFoundError, ValueError):
+                    continue
+                lease_until = os.path.getmtime(path) + self.lease_seconds if state == 'leased' else None
+                jobs.append({"id": job_id, "status": state, "worker": record.get('worker'),
+                             "attempts": record.get('attempts', 0), "result": record.get('result'),
+                             "error": record.get('error'), "lease_until": lease_until,
+                             "added_at": record.get('added_at', 0)})
+        jobs.sort(key=lambda job: job.pop('added_at'))
+        return jobs
+
+    def close(self):
+        pass
+
+
+def open_queue(path, lease_seconds=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """SQLite queue for *.sqlite3 / *.db paths, directory queue otherwise"""
+    if path.lower().endswith(SQLITE_SUFFIXES):
+        return SQLiteJobQueue(path, lease_seconds, max_attempts)
+    return DirectoryJobQueue(path, lease_seconds, max_attempts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the shared profile job queue used with --queue')
+    parser.add_argument('queue', help='Queue: a .sqlite3 file or a directory, on storage every worker can reach')
+    sub = parser.add_subparsers(dest='command', required=True)
+    add = sub.add_parser('add', help='Queue the profiles in a file (one per line)')
+    add.add_argument('profiles_file')
+    add.add_argument('--again', action='store_true', help='Also re-queue profiles that are done or failed')
+    sub.add_parser('status', help='Show every job and its state')
+    requeue = sub.add_parser('requeue', help='Put failed jobs back in the queue')
+    requeue.add_argument('--all', action='store_true', help='Re-queue finished jobs too')
+    args = parser.parse_args()
+
+    from multi_profile import load_profiles_file
+
+    queue = open_queue(args.queue)
+    with queue:
+        if args.command == 'add':
+            profiles = load_profiles_file(args.profiles_file)
+            added = queue.add(profiles, again=args.again)
+            print(f"📥 Queued {added} of {len(profiles)} profiles in {args.queue}")
+        elif args.command == 'requeue':
+            jobs = [job['id'] for job in queue.jobs() if job['status'] == 'failed' or
+                    (args.all and job['status'] == 'done')]
+            print(f"🔁 Re-queued {queue.add(jobs, again=True)} jobs")
+        else:
+            jobs = queue.jobs()
+            counts = {state: sum(job['status'] == state for job in jobs) for state in STATES}
+            print(f"📋 {args.queue}: " + ", ".join(f"{count} {state}" for state, count in counts.items()))
+            for job in jobs:
+                detail = job['result'] or job['error'] or ''
+                if job['status'] == 'leased':
+                    detail = f"{job['worker']}, lease {job['lease_until'] - time.time():+.0f}s"
+                print(f"   {job['status']:<7} @{job['id']} (attempt {job['attempts']}) {detail}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Canonical media index
+Remembers which media we have already extracted/downloaded, keyed by an identity
+that survives Instagram's rotating signed URL parameters (_nc_oc, _nc_gid, oh, oe...)
+"""
+
+import base64
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+# e.g. 513876204_18054089165599399_8862404465474695928_n
+MEDIA_STEM = re.compile(r'^\d+_\d+_\d+_n$')
+
+
+def media_key(url):
+    """Canonical identity for a CDN media URL
+
+    The numeric filename stem is identical across re-extractions of the same image,
+    so it is preferred; ig_cache_key (base64 media id) is used when the stem doesn't
+    look like an Instagram media name, and the bare path is the last resort.
+    """
+    parsed = urlparse(url)
+    stem = os.path.splitext(os.path.basename(parsed.path))[0]
+    if MEDIA_STEM.match(stem):
+        return stem
+
+    cache_key = parse_qs(parsed.query).get('ig_cache_key', [''])[0]
+    if cache_key:
+        encoded = cache_key.split('.', 1)[0]
+        try:
+            return 'ig:' + base64.b64decode(encoded).decode('ascii')
+        except (ValueError, UnicodeDecodeError):
+            return 'ig:' + encoded
+
+    return parsed.netloc + parsed.path
+
+
+class MediaIndex:
+    """SQLite-backed set of known media keys, shared by extractors and the downloader"""
+
+    def __init__(self, path='media_index.sqlite3'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS media (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                profile TEXT,
+                path TEXT,
+                bytes INTEGER,
+                first_seen REAL NOT NULL,
+                downloaded_at REAL
+            )
+        """)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def is_downloaded(self, url):
+        """True if the media behind this URL is already on disk according to the index"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT downloaded_at FROM media WHERE key = ?", (media_key(url),)).fetchone()
+        return bool(row and row[0])
+
+    def add_extracted(self, url, profile=None):
+        """Record an extracted URL; returns False if its media was already downloaded"""
+        key = media_key(url)
+        with self._lock:
+            row = self._conn.execute("SELECT downloaded_at FROM media WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO media (key, url, profile, first_seen) VALUES (?, ?, ?, ?)",
+                    (key, url, profile, time.time()))
+            else:
+                # Keep the freshest signed URL around for re-downloads
+                self._conn.execute("UPDATE media SET url = ? WHERE key = ?", (url, key))
+            self._conn.commit()
+        return not (row and row[0])
+
+    def mark_downloaded(self, url, path, size):
+        """Record that the media behind this URL has been saved to path"""
+        key = media_key(url)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO media (key, url, path, bytes, first_seen, downloaded_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    url = excluded.url, path = excluded.path,
+                    bytes = excluded.bytes, downloaded_at = excluded.downloaded_at
+            """, (key, url, path, size, now, now))
+            self._conn.commit()
+
+    def stats(self):
+        """Return (known, downloaded) counts"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*), COUNT(downloaded_at) FROM media").fetchone()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
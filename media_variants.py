@@ -0,0 +1,76 @@
+"""
+Media variant selection
+Instagram lists each image at several resolutions (e.g. 640/750/1080/1440 px
+wide, all separately signed). A --variant policy picks one of them at
+extraction time, so preview and thumbnail jobs can fetch a small variant
+instead of downloading the full-size image and scaling it down.
+"""
+
+import argparse
+from typing import NamedTuple, Optional
+
+POLICIES = ('largest', 'smallest', 'min', 'width')
+
+
+class Variant(NamedTuple):
+    url: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def media_candidates(node):
+    """Variants listed in an Instagram media node, web (GraphQL) or mobile API shaped"""
+    node = node.get('iphone_struct') or node
+    found = []
+    for candidate in (node.get('image_versions2') or {}).get('candidates') or []:
+        if candidate.get('url'):
+            found.append(Variant(candidate['url'], candidate.get('width'), candidate.get('height')))
+    for resource in node.get('display_resources') or []:
+        if resource.get('src'):
+            found.append(Variant(resource['src'], resource.get('config_width'), resource.get('config_height')))
+    if not found and node.get('display_url'):
+        dimensions = node.get('dimensions') or {}
+        found.append(Variant(node['display_url'], dimensions.get('width'), dimensions.get('height')))
+    return found
+
+
+class VariantPolicy:
+    """Which candidate to keep: largest, smallest, min:N (smallest at least N px wide) or width:N"""
+
+    def __init__(self, mode='largest', size=None):
+        if mode not in POLICIES:
+            raise ValueError(f"Unknown variant policy '{mode}' (choose from {', '.join(POLICIES)})")
+        if mode in ('min', 'width') and not size:
+            raise ValueError(f"Variant policy '{mode}' needs a width, e.g. {mode}:640")
+        self.mode = mode
+        self.size = size
+
+    def __str__(self):
+        return f"{self.mode}:{self.size}" if self.size else self.mode
+
+    def choose(self, candidates):
+        """The candidate this policy wants, or None if there are none"""
+        if not candidates:
+            return None
+        sized = [c for c in candidates if c.width]
+        if not sized:
+            return candidates[0]  # nothing to compare; Instagram lists the best one first
+        largest = max(sized, key=lambda c: c.width)
+        if self.mode == 'largest':
+            return largest
+        if self.mode == 'smallest':
+            return min(sized, key=lambda c: c.width)
+        if self.mode == 'min':
+            big_enough = [c for c in sized if c.width >= self.size]
+            return min(big_enough, key=lambda c: c.width) if big_enough else largest
+        # width: exact match, else the closest one (the larger on a tie, so it can be scaled down)
+        return min(sized, key=lambda c: (abs(c.width - self.size), -c.width))
+
+
+def parse_variant(spec):
+    """argparse type for --variant: largest, smallest, min:N or width:N"""
+    mode, _, size = spec.partition(':')
+    try:
+        return VariantPolicy(mode, int(size) if size else None)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e) if size.isdigit() or not size else f"'{size}' is not a width in px")
@@ -0,0 +1,179 @@
+"""
+Run metrics for the extractors and the downloader
+Counters (requests, records, rate-limit hits, sleep seconds, bytes written) and
+per-phase timers, dumped as JSON when the run ends and optionally served in the
+Prometheus text format while it is running.
+"""
+
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+PROMETHEUS_PREFIX = 'instaload'
+
+
+class Metrics:
+    """Thread-safe counters and phase timers"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._counters = {}
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, phase, seconds, count=1):
+        """Add `count` runs of a phase that took `seconds` in total"""
+        with self._lock:
+            stats = self._phases.get(phase)
+            if stats is None:
+                stats = self._phases[phase] = {"count": 0, "seconds": 0.0, "max": 0.0}
+            stats["count"] += count
+            stats["seconds"] += seconds
+            stats["max"] = max(stats["max"], seconds / count if count else seconds)
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as one run of phase `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        """Plain dict of everything recorded so far"""
+        with self._lock:
+            return {
+                "started": self.started,
+                "elapsed_seconds": round(time.perf_counter() - self._start, 3),
+                "counters": {name: round(value, 3) if isinstance(value, float) else value
+                             for name, value in sorted(self._counters.items())},
+                "phases": {name: {"count": stats["count"], "seconds": round(stats["seconds"], 3),
+                                  "max_seconds": round(stats["max"], 3)}
+                           for name, stats in sorted(self._phases.items())},
+            }
+
+    def write_summary(self, path):
+        """Write the snapshot as JSON (atomically, so a reader never sees half a file)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def prometheus_text(self):
+        """Snapshot in the Prometheus text exposition format"""
+        snap = self.snapshot()
+        lines = [
+            f"# TYPE {PROMETHEUS_PREFIX}_elapsed_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_elapsed_seconds {snap['elapsed_seconds']}",
+        ]
+        for name, value in snap["counters"].items():
+            metric = f"{PROMETHEUS_PREFIX}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        if snap["phases"]:
+            metric = f"{PROMETHEUS_PREFIX}_phase_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for name, stats in snap["phases"].items():
+                lines.append(f'{metric}_sum{{phase="{name}"}} {stats["seconds"]}')
+                lines.append(f'{metric}_count{{phase="{name}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve /metrics on a daemon thread; returns the server"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # ~40 ms, only needed with --metrics-port
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of the extractor's output
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def instrument_session(session):
+    """Count requests, 429s and response bytes going through a requests.Session"""
+    if getattr(session, '_metrics_hooked', False):
+        return session
+
+    def on_response(response, *args, **kwargs):
+        if getattr(response, 'from_cache', False):
+            return  # answered by http_cache, nothing went over the wire
+        metrics.incr('http_requests')
+        if response.status_code == 429:
+            metrics.incr('http_429')
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit():
+            metrics.incr('http_response_bytes', int(length))
+
+    session.hooks.setdefault('response', []).append(on_response)
+    session._metrics_hooked = True
+    return session
+
+
+def instrument_instaloader(context):
+    """Count and time the requests an InstaloaderContext sends
+
+    instaloader sends GraphQL and API queries through throwaway copies of its
+    session and profile pages through an anonymous one, which session hooks
+    never see, so this wraps get_json and get_page_data (every metadata request
+    goes through one of them) instead. Wrap before http_cache so cache hits
+    aren't counted. 429s are counted by account_pool.CountingRateController.
+    """
+    if getattr(context, '_metrics_hooked', False):
+        return context
+
+    def counted(method):
+        def request(*args, **kwargs):
+            metrics.incr('http_requests')
+            with metrics.phase('instaloader_request'):
+                return method(*args, **kwargs)
+        return request
+
+    context.get_json = counted(context.get_json)
+    context.get_page_data = counted(context.get_page_data)
+    context._metrics_hooked = True
+    return context
+
+
+def start_metrics(summary_path=None, port=None):
+    """Write the JSON summary at exit and/or serve /metrics on localhost:port"""
+    if summary_path:
+        atexit.register(metrics.write_summary, summary_path)
+    if port:
+        metrics.serve(port)
+        print(f"📈 Metrics on http://127.0.0.1:{port}/metrics")
+
+
+# Process-wide registry the other modules record into
+metrics = Metrics()
@@ -0,0 +1,134 @@
+"""
+Multi-profile extraction helpers
+Spreads a watchlist of profiles over a bounded worker pool, one output shard per profile
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from job_queue import LeaseLost, default_worker_id
+
+
+def load_profiles_file(path):
+    """Read profile names from a file, one per line (blank lines and # comments are ignored)"""
+    profiles = []
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            name = line.split('#', 1)[0].strip().lstrip('@').strip('/')
+            if name and name not in seen:
+                seen.add(name)
+                profiles.append(name)
+    return profiles
+
+
+def shard_path(output, profile):
+    """Per-profile output file derived from the main --output name, e.g. urls.csv -> urls_<profile>.csv"""
+    base, ext = os.path.splitext(output)
+    return f"{base}_{profile}{ext or '.csv'}"
+
+
+def _timed(profile, worker, output):
+    """Run worker(profile) and describe the outcome as a summary result dict"""
+    result = {"profile": profile, "status": "error", "count": 0, "seconds": 0, "error": None,
+              "output": shard_path(output, profile) if output else None}
+    start = time.monotonic()
+    try:
+        result["count"] = worker(profile) or 0
+        result["status"] = "ok" if result["count"] else "empty"
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.monotonic() - start, 2)
+    return result
+
+
+def run_profiles(profiles, worker, max_workers=4, output=None):
+    """Run worker(profile) for every profile with at most max_workers running at once
+
+    worker returns the number of URLs it saved; exceptions are recorded per profile
+    so one failing account doesn't stop the rest of the watchlist.
+    """
+    results = []
+    max_workers = max(1, min(max_workers, len(profiles) or 1))
+    print(f"👥 Processing {len(profiles)} profiles with {max_workers} workers")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_timed, profile, worker, output) for profile in profiles]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            print(f"   [{done}/{len(profiles)}] @{result['profile']}: {result['status']} "
+                  f"({result['count']} URLs, {result['seconds']}s)")
+
+    # Keep the summary in watchlist order rather than completion order
+    order = {profile: i for i, profile in enumerate(profiles)}
+    results.sort(key=lambda r: order[r['profile']])
+    return results
+
+
+def run_queue(queue, worker, max_workers=4, output=None):
+    """Like run_profiles, but take profiles from a shared job queue until it is drained
+
+    Other machines can pull from the same queue at the same time; each profile
+    is leased by one worker, kept alive by heartbeats while it runs, and marked
+    done with its shard as the result pointer (None for a profile with no URLs). Failed profiles go back to the
+    queue for another attempt (by whichever worker gets there first).
+    """
+    results = []
+    lock = threading.Lock()
+    worker_id = default_worker_id()
+    print(f"👥 Pulling profiles from {queue.path} with {max_workers} workers as {worker_id}")
+
+    def drain(num):
+        for job in queue.leases(f"{worker_id}/{num}"):
+            with queue.heartbeat(job):
+                result = _timed(job.id, worker, output)
+            try:
+                if result["status"] == "error":
+                    queue.fail(job, result["error"])
+                else:
+                    # An empty profile wrote no shard, so there is nothing to point at
+                    queue.complete(job, result["output"] if result["status"] == "ok" else None)
+            except LeaseLost:
+                result["error"] = "lease expired while running; the profile was handed to another worker"
+            with lock:
+                results.append(result)
+                print(f"   [{len(results)}] @{result['profile']}: {result['status']} "
+                      f"({result['count']} URLs, {result['seconds']}s, attempt {job.attempts})")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for future in [pool.submit(drain, num) for num in range(max(1, max_workers))]:
+            future.result()
+    return results
+
+
+def print_summary(results):
+    """Print the combined summary for a multi-profile run"""
+    total = sum(r['count'] for r in results)
+    failed = [r for r in results if r['status'] == 'error']
+    empty = [r for r in results if r['status'] == 'empty']
+
+    print(f"\n📊 Combined summary:")
+    print(f"   ✓ Profiles: {len(results)} ({len(results) - len(failed) - len(empty)} ok, "
+          f"{len(empty)} empty, {len(failed)} failed)")
+    print(f"   ✓ Total URLs: {total}")
+    for r in failed:
+        print(f"   ✗ @{r['profile']}: {r['error']}")
+
+
+def write_summary(results, output):
+    """Write the combined summary next to the shards as JSON"""
+    base, _ = os.path.splitext(output)
+    path = f"{base}_summary.json"
+    summary = {
+        "profiles": len(results),
+        "total_urls": sum(r['count'] for r in results),
+        "results": results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    print(f"💾 Summary saved to {path}")
+    return path
@@ -0,0 +1,235 @@
+"""
+Output formats for extracted URLs
+CSV stays the default. JSONL, SQLite, Parquet and Arrow writers take the same
+index,url,shortcode,expires,width,height rows in batches (one transaction / row group per
+batch), so large jobs don't pay per-row I/O and downstream jobs can load the
+result without parsing CSV text.
+"""
+
+import abc
+import json
+import os
+import sqlite3
+import time
+
+from gallery_dl_stream import CSVAppender
+from metrics import metrics
+from url_expiry import url_expiry
+
+FORMATS = ('csv', 'jsonl', 'sqlite', 'parquet', 'arrow')
+EXTENSIONS = {
+    'csv': '.csv',
+    'jsonl': '.jsonl',
+    'sqlite': '.sqlite3',
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+}
+
+
+def output_path(output, fmt):
+    """--output adjusted to the format's extension, e.g. urls.csv -> urls.parquet"""
+    base, ext = os.path.splitext(output)
+    if not ext or ext.lower() in EXTENSIONS.values():
+        return base + EXTENSIONS[fmt]
+    return output
+
+
+def format_for_path(path):
+    """Format of an output file, judged by its extension"""
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, fmt_ext in EXTENSIONS.items():
+        if ext == fmt_ext:
+            return fmt
+    return 'csv'
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet/Arrow output needs pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+class BatchedWriter(abc.ABC):
+    """Same interface as CSVAppender, but rows are written batch_size at a time"""
+    batch_size = 1000
+
+    def __init__(self, filename, batch_size=None):
+        self.filename = filename
+        self.count = 0
+        self.batch_size = batch_size or self.batch_size
+        self._batch = []
+        self._batches = 0
+        self._write_time = 0.0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append(self, url, shortcode=None, width=None, height=None):
+        self.count += 1
+        self._batch.append((self.count, url, shortcode or None, url_expiry(url), width or None, height or None))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+        return self.count
+
+    def flush(self):
+        if self._batch:
+            start = time.perf_counter()
+            self._write(self._batch)
+            self._write_time += time.perf_counter() - start
+            self._batches += 1
+            self._batch = []
+
+    def close(self):
+        if not self._closed:
+            self.flush()
+            self._finish()
+            self._closed = True
+            metrics.observe('write', self._write_time, count=self._batches)
+            if os.path.exists(self.filename):
+                metrics.incr('bytes_written', os.path.getsize(self.filename))
+
+    @abc.abstractmethod
+    def _write(self, rows):
+        """Write one batch of (idx, url, shortcode, expires, width, height) rows"""
+
+    def _finish(self):
+        pass
+
+
+class JSONLWriter(BatchedWriter):
+    def __init__(self, filename, batch_size=None):
+        super().__init__(filename, batch_size)
+        self._file = open(filename, 'w', encoding='utf-8')
+
+    def _write(self, rows):
+        self._file.write(''.join(
+            json.dumps({"index": index, "url": url, "shortcode": shortcode, "expires": expires,
+                        "width": width, "height": height}) + "\n"
+            for index, url, shortcode, expires, width, height in rows
+        ))
+        self._file.flush()
+
+    def _finish(self):
+        self._file.close()
+
+
+class SQLiteWriter(BatchedWriter):
+    """Table `urls` with one transaction per batch"""
+
+    def __init__(self, filename, batch_size=None):
+        super().__init__(filename, batch_size)
+        if os.path.exists(filename):
+            os.remove(filename)
+        self._conn = sqlite3.connect(filename)
+        self._conn.execute(
+            'CREATE TABLE urls ("index" INTEGER PRIMARY KEY, url TEXT NOT NULL, shortcode TEXT, expires INTEGER, '
+            'width INTEGER, height INTEGER)'
+        )
+
+    def _write(self, rows):
+        with self._conn:
+            self._conn.executemany('INSERT INTO urls VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def _finish(self):
+        self._conn.close()
+
+
+class _ArrowBase(BatchedWriter):
+    batch_size = 65536  # one row group / record batch each
+
+    def __init__(self, filename, batch_size=None):
+        super().__init__(filename, batch_size)
+        self._pa = _pyarrow()
+        self._schema = self._pa.schema([
+            ('index', self._pa.int64()),
+            ('url', self._pa.string()),
+            ('shortcode', self._pa.string()),
+            ('expires', self._pa.int64()),
+            ('width', self._pa.int32()),
+            ('height', self._pa.int32()),
+        ])
+        self._writer = self._open()
+
+    def _write(self, rows):
+        columns = list(zip(*rows))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+            schema=self._schema,
+        ))
+
+    def _finish(self):
+        self._writer.close()
+
+
+class ParquetWriter(_ArrowBase):
+    def _open(self):
+        return self._pa.parquet.ParquetWriter(self.filename, self._schema)
+
+
+class ArrowWriter(_ArrowBase):
+    """Arrow IPC file (a.k.a. Feather v2), memory-mappable by downstream jobs"""
+
+    def _open(self):
+        return self._pa.ipc.new_file(self.filename, self._schema)
+
+
+WRITERS = {
+    'csv': CSVAppender,
+    'jsonl': JSONLWriter,
+    'sqlite': SQLiteWriter,
+    'parquet': ParquetWriter,
+    'arrow': ArrowWriter,
+}
+
+
+def open_writer(filename, fmt=None):
+    """Writer for filename; the format defaults to the one its extension implies"""
+    return WRITERS[fmt or format_for_path(filename)](filename)
+
+
+def write_urls(urls, filename, fmt=None):
+    """Write (url, shortcode[, width, height]) tuples or bare URLs in one go; returns the row count"""
+    with open_writer(filename, fmt) as out:
+        for item in urls:
+            if isinstance(item, str):
+                out.append(item)
+            else:
+                out.append(*item)
+    return out.count
+
+
+def read_rows(path):
+    """Yield {index, url, shortcode, expires, width, height} rows from a JSONL, SQLite, Parquet or Arrow output"""
+    fmt = format_for_path(path)
+    if fmt == 'jsonl':
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif fmt == 'sqlite':
+        conn = sqlite3.connect(path)
+        try:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(urls)')]
+            for values in conn.execute('SELECT * FROM urls ORDER BY "index"'):
+                yield dict(zip(columns, values))
+        finally:
+            conn.close()
+    elif fmt in ('parquet', 'arrow'):
+        pa = _pyarrow()
+        if fmt == 'parquet':
+            batches = pa.parquet.ParquetFile(path).iter_batches()
+        else:
+            reader = pa.ipc.open_file(path)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        for batch in batches:
+            yield from batch.to_pylist()
+    else:
+        raise ValueError(f"{path} is not a JSONL, SQLite, Parquet or Arrow output")
@@ -0,0 +1,64 @@
+"""
+Ordered concurrent map for request pipelines
+A producer thread pulls items from an iterator (which may make requests of its
+own, like instaloader's paginated get_posts()) and submits each one to a thread
+pool; the caller gets (item, future) pairs back in the original order. A bounded
+queue keeps the producer at most `ahead` items in front of the caller.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+class _Failed:
+    """The producer's iterator raised; re-raised in the caller's thread"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def ordered_map(fn, items, workers=4, ahead=None):
+    """Yield (item, future of fn(item)) in input order while `workers` threads run fn ahead
+
+    Closing the generator early (break, hedging giving up on a backend) stops
+    the producer and cancels work that hasn't started yet.
+    """
+    slots = queue.Queue(maxsize=ahead or workers * 2)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipeline')
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                slots.put(entry, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if stop.is_set() or not put((item, executor.submit(fn, item))):
+                    return
+        except BaseException as e:
+            put(_Failed(e))
+            return
+        put(_DONE)
+
+    producer = threading.Thread(target=produce, name='pipeline-producer', daemon=True)
+    producer.start()
+    try:
+        while True:
+            entry = slots.get()
+            if entry is _DONE:
+                return
+            if isinstance(entry, _Failed):
+                raise entry.error
+            yield entry
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
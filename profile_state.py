@@ -0,0 +1,174 @@
+"""
+Per-profile high-water marks for incremental extraction
+Remembers the newest post seen for each profile so later runs can stop
+paginating as soon as they reach posts we already have
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Pinned posts sit at the top of a profile regardless of age, so a single old
+# post isn't proof we've caught up; stop after this many known posts in a row.
+KNOWN_STREAK = 4
+
+
+def parse_timestamp(value):
+    """Epoch seconds from a gallery-dl date string, datetime or number"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    try:
+        parsed = datetime.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=timezone.utc).timestamp()
+
+
+def record_post_info(data):
+    """(shortcode, timestamp) of the post a gallery-dl record belongs to"""
+    shortcode = data.get('post_shortcode') or data.get('shortcode')
+    timestamp = parse_timestamp(data.get('post_date') or data.get('date'))
+    return shortcode, timestamp
+
+
+class ProfileState:
+    """JSON file of {profile: {newest_shortcode, newest_timestamp, updated[, fetched_from, fetched_to]}}
+
+    Everything at or below the newest_* mark has been fetched. A run that was
+    cut short (link limit, --range, failed posts) can't move the mark, since the
+    posts between where it stopped and the mark are still missing; it records
+    the band of posts it did fetch instead, and the next run skips that band and
+    carries on below it.
+    """
+
+    def __init__(self, path='profile_state.json'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._marks = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._marks = json.load(f)
+
+    def get(self, profile):
+        with self._lock:
+            return dict(self._marks.get(profile) or {})
+
+    def update(self, profile, shortcode, timestamp):
+        """Move the profile's mark forward (never backwards) and save; clears any fetched band"""
+        if timestamp is None:
+            return
+        with self._lock:
+            mark = self._marks.get(profile) or {}
+            if timestamp >= mark.get('newest_timestamp', 0):
+                self._marks[profile] = {
+                    "newest_shortcode": shortcode,
+                    "newest_timestamp": timestamp,
+                    "updated": time.time(),
+                }
+                self._save()
+
+    def record_run(self, profile, mark, complete):
+        """Save a run's HighWaterMark: a new mark if the walk was complete, else the band it fetched"""
+        if complete and not mark.failed_posts:
+            self.update(profile, mark.newest_shortcode, mark.newest_timestamp)
+            return
+        band = mark.fetched_band()
+        if band is None:
+            return
+        with self._lock:
+            entry = dict(self._marks.get(profile) or {})
+            entry.update(fetched_from=band[0], fetched_to=band[1], updated=time.time())
+            self._marks[profile] = entry
+            self._save()
+
+    def _save(self):
+        # Write to a temp file first so a crash never leaves half a state file
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._marks, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+class HighWaterMark:
+    """Tracks one extraction run against a profile's stored mark
+
+    observe() classifies posts as the walk reaches them. The caller reports
+    the posts it actually finished with done() (per post or per file) and the
+    ones it dropped with failed(), so a walk that ends early only claims the
+    unbroken run of posts from the top of the feed down.
+    """
+
+    def __init__(self, mark=None, known_streak=KNOWN_STREAK):
+        mark = mark or {}
+        self.shortcode = mark.get('newest_shortcode')
+        self.timestamp = mark.get('newest_timestamp')
+        self.fetched_from = mark.get('fetched_from')
+        self.fetched_to = mark.get('fetched_to')
+        self.known_streak = known_streak
+        self.newest_shortcode = None
+        self.newest_timestamp = None
+        self.failed_posts = 0
+        self._streak = 0
+        self._last_post = None
+        self._edge = None  # oldest post finished with nothing missing above it
+        self._pending = None  # (shortcode, timestamp) of the post whose files are still arriving
+        self._broken = False
+
+    def is_known(self, shortcode, timestamp):
+        """True if this post is at or below the stored mark"""
+        if self.shortcode and shortcode == self.shortcode:
+            return True
+        return self.timestamp is not None and timestamp is not None and timestamp <= self.timestamp
+
+    def in_fetched_band(self, timestamp):
+        """True if an earlier, unfinished run already fetched this post"""
+        return (self.fetched_from is not None and timestamp is not None
+                and self.fetched_from <= timestamp <= self.fetched_to)
+
+    def observe(self, shortcode, timestamp, pinned=False):
+        """Classify a post as 'new', 'known' or 'stop' (caught up, stop paginating)"""
+        timestamp = parse_timestamp(timestamp)
+        if timestamp is not None and (self.newest_timestamp is None or timestamp > self.newest_timestamp):
+            self.newest_shortcode = shortcode
+            self.newest_timestamp = timestamp
+
+        if not self.is_known(shortcode, timestamp):
+            self._streak = 0
+            self._last_post = shortcode
+            return 'known' if self.in_fetched_band(timestamp) else 'new'
+
+        # Carousel items share a post; only count each post once
+        if shortcode != self._last_post and not pinned:
+            self._streak += 1
+        self._last_post = shortcode
+        return 'stop' if self._streak >= self.known_streak else 'known'
+
+    def done(self, shortcode, timestamp, pinned=False):
+        """The caller has everything it wanted from this post (or from one of its files)"""
+        if pinned or self._broken:
+            return  # pinned posts sit outside the date order
+        if self._pending and self._pending[0] != shortcode:
+            self._edge = self._pending[1]
+        self._pending = (shortcode, parse_timestamp(timestamp))
+
+    def failed(self):
+        """The post just reached was dropped; nothing below it counts as fetched in an unfinished run"""
+        if self._pending and not self._broken:
+            self._edge = self._pending[1]
+        self._broken = True
+        self.failed_posts += 1
+
+    def fetched_band(self):
+        """(oldest, newest) timestamps of the unbroken run of fetched posts from the top, or None"""
+        # The last post may have been cut off part way through its files
+        if self._edge is None or self.newest_timestamp is None:
+            return None
+        return self._edge, max(self.newest_timestamp, self.fetched_to or 0)
@@ -0,0 +1,176 @@
+"""
+Request pacing primitives shared by the extractors
+"""
+
+import random
+import threading
+import time
+
+from metrics import metrics
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` requests per second on average, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Nothing accrues while the bucket is penalised
+        start = max(self._updated, self._blocked_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+            self._updated = now
+
+    def available(self):
+        """Tokens that could be spent right now (0 while penalised)"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return 0.0
+            self._refill(now)
+            return self._tokens
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` could be taken"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            refill = max(0.0, (tokens - self._tokens) / self.rate)
+            return max(0.0, self._blocked_until - now) + refill
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return False
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available and take them; returns seconds waited"""
+        waited = 0.0
+        while not self.try_acquire(tokens):
+            delay = max(self.wait_time(tokens), 0.01)
+            time.sleep(delay)
+            waited += delay
+        if waited:
+            metrics.observe('token_wait', waited)
+        return waited
+
+    def penalize(self, seconds):
+        """Empty the bucket and refuse tokens for `seconds`, e.g. after a 429"""
+        with self._lock:
+            self._tokens = 0.0
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._updated = now
+
+
+def is_rate_limit_error(error):
+    """True for the errors Instagram uses to tell us to slow down"""
+    message = str(error).lower()
+    return any(marker in message for marker in ('401', '429', 'rate limit', 'please wait', 'too many requests'))
+
+
+class AIMDController:
+    """Adaptive pacing: additive increase of the request rate while Instagram answers,
+    multiplicative decrease (plus a cooldown) as soon as it rate limits us.
+
+    The same controller feeds gallery-dl's sleep-request range, so both backends
+    slow down and speed up together.
+    """
+
+    def __init__(self, initial_delay=3.0, min_delay=1.0, max_delay=60.0, increase=0.02,
+                 decrease=0.5, cooldown=60.0, max_cooldown=900.0, jitter=0.25,
+                 sleep=time.sleep, rand=None):
+        self.min_rate = 1.0 / max_delay
+        self.max_rate = 1.0 / min_delay
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.jitter = jitter
+        self._rate = 1.0 / initial_delay
+        self._failures = 0
+        self._sleep = sleep
+        self._random = rand or random.random
+        self._lock = threading.Lock()
+        self._next_turn = 0.0
+        self.slept = 0.0
+        self.rate_limits = 0
+
+    @property
+    def rate(self):
+        """Current target in requests per second"""
+        return self._rate
+
+    @property
+    def delay(self):
+        """Current pause between requests in seconds"""
+        return 1.0 / self._rate
+
+    def on_success(self):
+        with self._lock:
+            self._failures = 0
+            self._rate = min(self.max_rate, self._rate + self.increase)
+
+    def on_rate_limit(self):
+        """Cut the rate and return how long to cool down before retrying"""
+        with self._lock:
+            self._failures += 1
+            self.rate_limits += 1
+            metrics.incr('rate_limit_hits')
+            self._rate = max(self.min_rate, self._rate * self.decrease)
+            cooldown = min(self.max_cooldown, self.cooldown * 2 ** (self._failures - 1))
+        return cooldown * (1 + self.jitter * self._random())
+
+    def wait(self):
+        """Sleep for the current delay (with jitter so we don't look like a metronome)"""
+        delay = self.delay * (1 + self.jitter * (2 * self._random() - 1))
+        self._pause(delay, 'pacing_sleep')
+        return delay
+
+    def acquire(self):
+        """Wait for this thread's turn to send a request; returns seconds waited
+
+        For several threads sharing the controller: turns are handed out the
+        current delay apart across all callers, so together they still send at
+        the controller's rate instead of each pacing itself.
+        """
+        delay = self.delay * (1 + self.jitter * (2 * self._random() - 1))
+        with self._lock:
+            now = time.monotonic()
+            turn = max(now, self._next_turn)
+            self._next_turn = turn + delay
+        if turn > now:
+            self._pause(turn - now, 'pacing_sleep')
+        return turn - now
+
+    def hold(self, seconds):
+        """Hand out no acquire() turns for `seconds`, e.g. the cooldown after a rate limit"""
+        with self._lock:
+            self._next_turn = max(self._next_turn, time.monotonic() + seconds)
+
+    def pause(self, seconds):
+        """Sleep for an explicit number of seconds (cooldowns, retries), counted in `slept`"""
+        self._pause(seconds, 'retry_sleep')
+
+    def _pause(self, seconds, kind):
+        self._sleep(seconds)
+        with self._lock:
+            self.slept += seconds
+        metrics.observe(kind, seconds)
+
+    def sleep_request(self):
+        """[min, max] seconds for gallery-dl's sleep-request option"""
+        delay = self.delay
+        return [round(delay * (1 - self.jitter), 2), round(delay * (1 + self.jitter), 2)]
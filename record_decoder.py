@@ -0,0 +1,118 @@
+"""
+Field-selective decoding of gallery-dl --dump-json records
+A record is a large nested metadata dict, but the extractors only ever read a
+handful of its fields. The decoders here return just those fields, using
+msgspec (skips everything else without building it) or orjson when installed
+and the stdlib json module otherwise.
+"""
+
+import json
+from typing import List, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Every field the extractors look at: URL choice, dimensions, shortcode, high-water marks
+FIELDS = ('url', 'display_url', 'thumbnail_url', 'width', 'height', 'post_shortcode', 'shortcode', 'post_date',
+          'date', 'pinned')
+
+# gallery-dl's message type for a file, as printed by its jsonl output mode: [3, url, kwdict]
+MESSAGE_URL = 3
+
+
+def _select(data):
+    """Slim record from a fully decoded line, or None if it isn't a file record"""
+    if isinstance(data, list):
+        if len(data) < 3 or data[0] != MESSAGE_URL or not isinstance(data[2], dict):
+            return None
+        record = _select(data[2])
+        record['url'] = data[1]
+        return record
+    if not isinstance(data, dict):
+        return None
+    return {field: data[field] for field in FIELDS if field in data}
+
+
+class JSONDecoder:
+    """Stdlib fallback: decodes the whole record, keeps the fields we need"""
+    name = 'json'
+
+    def decode(self, line):
+        return _select(json.loads(line))
+
+
+class OrjsonDecoder:
+    """Same as JSONDecoder, with orjson doing the parsing"""
+    name = 'orjson'
+
+    def decode(self, line):
+        return _select(orjson.loads(line))
+
+
+class MsgspecDecoder:
+    """Decodes straight into a struct of FIELDS; every other key is skipped, not built"""
+    name = 'msgspec'
+
+    def __init__(self):
+        class Record(msgspec.Struct):
+            url: object = None
+            display_url: object = None
+            thumbnail_url: object = None
+            width: object = None
+            height: object = None
+            post_shortcode: object = None
+            shortcode: object = None
+            post_date: object = None
+            date: object = None
+            pinned: object = None
+
+        self._record = msgspec.json.Decoder(Record)
+        self._line = msgspec.json.Decoder(Union[Record, List[msgspec.Raw]])
+        self._int = msgspec.json.Decoder(int)
+        self._str = msgspec.json.Decoder(str)
+
+    def decode(self, line):
+        try:
+            data = self._line.decode(line)
+            if isinstance(data, list):
+                if len(data) < 3 or self._int.decode(data[0]) != MESSAGE_URL:
+                    return None
+                record = self._slim(self._record.decode(data[2]))
+                record['url'] = self._str.decode(data[1])
+                return record
+            return self._slim(data)
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            raise ValueError(str(e)) from None
+
+    @staticmethod
+    def _slim(record):
+        return {field: value for field in FIELDS if (value := getattr(record, field)) is not None}
+
+
+DECODERS = {
+    'msgspec': MsgspecDecoder if msgspec else None,
+    'orjson': OrjsonDecoder if orjson else None,
+    'json': JSONDecoder,
+}
+
+
+def available_decoders():
+    """Names of the decoders usable in this environment, fastest first"""
+    return [name for name, cls in DECODERS.items() if cls]
+
+
+def get_decoder(name='auto'):
+    """Decoder instance by name; 'auto' picks the fastest one installed"""
+    if name == 'auto':
+        name = available_decoders()[0]
+    cls = DECODERS.get(name)
+    if cls is None:
+        raise ValueError(f"Record decoder '{name}' is not available (installed: {', '.join(available_decoders())})")
+    return cls()
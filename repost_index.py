@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Perceptual-hash repost index
+The same photo reposted by another profile (or re-uploaded) gets a brand new
+URL and media id, so media_key() can't tell it apart. A 64-bit DCT perceptual
+hash survives re-encoding and resizing; near-duplicates are hashes a few bits
+apart. Hashes are kept in SQLite and searched as one NumPy array, so a lookup
+against millions of images is a single vectorized XOR + popcount.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+HASH_BITS = 64
+DEFAULT_MAX_DISTANCE = 6  # bits out of 64; re-encodes and resizes land well below this
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.heic')
+
+_dct = None
+
+
+def _require():
+    if np is None or Image is None:
+        raise RuntimeError("Repost detection needs numpy and Pillow (pip install numpy pillow)")
+
+
+def _dct_matrix(n=32):
+    """Orthonormal DCT-II matrix, so dct2(x) = D @ x @ D.T"""
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def phash(image):
+    """64-bit perceptual hash of an image file (or PIL image), as an int
+
+    The image is reduced to 32x32 grey, transformed with a 2D DCT, and each of
+    the 8x8 lowest frequencies becomes one bit: above or below their median.
+    """
+    global _dct
+    _require()
+    if _dct is None:
+        _dct = _dct_matrix()
+    if not isinstance(image, Image.Image):
+        with Image.open(image) as opened:
+            # JPEG can decode straight at 1/8 scale, which is most of the speed-up
+            opened.draft('L', (64, 64))
+            return phash(opened.convert('L'))
+    pixels = np.asarray(image.convert('L').resize((32, 32), Image.BILINEAR), dtype=np.float64)
+    low = (_dct @ pixels @ _dct.T)[:8, :8].ravel()
+    bits = low > np.median(low[1:])  # the DC term only says how bright the image is
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _popcount(values):
+    """Set bits per element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8) if np else None
+
+
+def _to_signed(value):
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+class RepostIndex:
+    """Known image hashes on disk (SQLite) and in memory (a growable uint64 array)"""
+
+    def __init__(self, path='reposts.sqlite3', max_distance=DEFAULT_MAX_DISTANCE):
+        _require()
+        self.path = path
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL,
+                path TEXT,
+                hash INTEGER NOT NULL,
+                added_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        rows = self._conn.execute("SELECT id, hash FROM images ORDER BY id").fetchall()
+        self._size = len(rows)
+        self._hashes = np.zeros(max(1024, self._size * 2), dtype=np.uint64)
+        self._ids = np.zeros(len(self._hashes), dtype=np.int64)
+        if rows:
+            ids, hashes = zip(*rows)
+            self._ids[:self._size] = ids
+            self._hashes[:self._size] = np.array(hashes, dtype=np.int64).view(np.uint64)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, needed):
+        if needed > len(self._hashes):
+            capacity = max(needed, len(self._hashes) * 2)
+            self._hashes = np.resize(self._hashes, capacity)
+            self._ids = np.resize(self._ids, capacity)
+
+    def _insert(self, entries):
+        """entries: (key, path, hash) tuples; caller holds the lock"""
+        now = time.time()
+        cursor = self._conn.cursor()
+        ids = []
+        for key, path, value in entries:
+            cursor.execute("INSERT INTO images (key, path, hash, added_at) VALUES (?, ?, ?, ?)",
+                           (key, path, _to_signed(value), now))
+            ids.append(cursor.lastrowid)
+        self._conn.commit()
+        self._grow(self._size + len(ids))
+        end = self._size + len(ids)
+        self._ids[self._size:end] = ids
+        self._hashes[self._size:end] = np.array([value for _, _, value in entries], dtype=np.uint64)
+        self._size = end
+
+    def _search(self, value, max_distance, limit):
+        distances = _popcount(self._hashes[:self._size] ^ np.uint64(value))
+        hits = np.flatnonzero(distances <= max_distance)
+        if not len(hits):
+            return []
+        hits = hits[np.argsort(distances[hits], kind='stable')[:limit]]
+        by_id = {row[0]: row[1:] for row in self._conn.execute(
+            f"SELECT id, key, path FROM images WHERE id IN ({','.join('?' * len(hits))})",
+            [int(i) for i in self._ids[hits]])}
+        return [(*by_id[int(self._ids[i])], int(distances[i])) for i in hits]
+
+    def search(self, value, max_distance=None, limit=5):
+        """Known images within max_distance bits of a hash, closest first: [(key, path, distance)]"""
+        max_distance = self.max_distance if max_distance is None else max_distance
+        with self._lock:
+            return self._search(value, max_distance, limit)
+
+    def add(self, key, value, path=None):
+        with self._lock:
+            self._insert([(key, path, value)])
+
+    def add_many(self, entries):
+        """Bulk add (key, path, hash) tuples in one transaction"""
+        with self._lock:
+            self._insert(list(entries))
+
+    def check(self, key, value, path=None):
+        """Closest known near-duplicate of this image, or None after adding it to the index
+
+        Search and insert happen under one lock, so two workers holding the same
+        repost can't both decide they have the original.
+        """
+        with self._lock:
+            matches = self._search(value, self.max_distance, 5)
+            if any(match[0] == key for match in matches):
+                return None  # indexed on an earlier run
+            if matches:
+                return matches[0]
+            self._insert([(key, path, value)])
+            return None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hash downloaded images and report reposts (near-duplicates)')
+    parser.add_argument('directory', help='Directory of downloaded images')
+    parser.add_argument('--index', default='reposts.sqlite3', help='Hash index database (default: reposts.sqlite3)')
+    parser.add_argument('--max-distance', type=int, default=DEFAULT_MAX_DISTANCE,
+                        help=f'Bits two hashes may differ by and still count as the same photo (default: {DEFAULT_MAX_DISTANCE})')
+    args = parser.parse_args()
+
+    try:
+        index = RepostIndex(args.index, args.max_distance)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+    names = sorted(name for name in os.listdir(args.directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    print(f"🔍 Hashing {len(names)} images in {args.directory} against {len(index)} known")
+    reposts = 0
+    start = time.monotonic()
+    with index:
+        for name in names:
+            path = os.path.join(args.directory, name)
+            try:
+                value = phash(path)
+            except OSError as e:
+                print(f"  ⚠️  {name}: {e}")
+                continue
+            match = index.check(os.path.splitext(name)[0], value, path)
+            if match:
+                reposts += 1
+                print(f"  ♻️  {name} ≈ {match[1] or match[0]} ({match[2]} bits apart)")
+    print(f"✅ {reposts} reposts among {len(names)} images ({time.monotonic() - start:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Watchlist scheduler for long-running extraction
+Keeps every profile in a heap ordered by when it is next due and polls it on an
+interval learned from how often it actually posts, so quiet profiles stop
+spending the same request budget as active ones.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import metrics
+
+MIN_INTERVAL = 15 * 60
+MAX_INTERVAL = 24 * 3600
+POLL_FRACTION = 0.5  # poll twice per typical gap between posts
+GAP_SMOOTHING = 0.3  # weight of the newest observed gap in the moving average
+
+
+def estimate_gap(gap, post_times, last_post=None, alpha=GAP_SMOOTHING):
+    """Moving average of the seconds between posts, updated with new post timestamps"""
+    times = sorted(t for t in post_times if t and (last_post is None or t > last_post))
+    if last_post:
+        times.insert(0, last_post)
+    for earlier, later in zip(times, times[1:]):
+        observed = later - earlier
+        gap = observed if gap is None else alpha * observed + (1 - alpha) * gap
+    return gap
+
+
+class ProfileSchedule:
+    """When one profile is next due and what we've learned about its posting rate"""
+
+    def __init__(self, profile, next_due=0.0, gap=None, last_post=None, polls=0, failures=0):
+        self.profile = profile
+        self.next_due = next_due
+        self.gap = gap
+        self.last_post = last_post
+        self.polls = polls
+        self.failures = failures
+
+    def interval(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        if self.gap is None:
+            return min_interval  # nothing learned yet, check back soon
+        return min(max_interval, max(min_interval, self.gap * POLL_FRACTION))
+
+    def to_dict(self):
+        return {"next_due": self.next_due, "gap": self.gap, "last_post": self.last_post,
+                "polls": self.polls, "failures": self.failures}
+
+    @classmethod
+    def from_dict(cls, profile, data):
+        return cls(profile, **{key: data.get(key) for key in ('gap', 'last_post')},
+                   next_due=data.get('next_due') or 0.0, polls=data.get('polls') or 0,
+                   failures=data.get('failures') or 0)
+
+
+class PollScheduler:
+    """Poll profiles on a bounded worker pool, each when it falls due
+
+    poll(profile) does the scraping and returns the timestamps of the new posts
+    it found; those drive the profile's next interval. The learned schedule is
+    kept in a JSON file so a restart doesn't start from scratch.
+    """
+
+    def __init__(self, poll, path=None, workers=2, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 clock=time.time):
+        self.poll = poll
+        self.path = path
+        self.workers = max(1, workers)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.clock = clock
+        self._entries = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._running = set()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for profile, data in json.load(f).items():
+                    self._entries[profile] = ProfileSchedule.from_dict(profile, data)
+
+    def _push(self, entry):
+        heapq.heappush(self._heap, (entry.next_due, next(self._seq), entry.profile))
+
+    def sync(self, profiles):
+        """Make the watchlist exactly `profiles`; new ones are due immediately"""
+        wanted = set(profiles)
+        for profile in list(self._entries):
+            if profile not in wanted:
+                del self._entries[profile]  # its heap item goes stale and is skipped
+        for profile in profiles:
+            entry = self._entries.get(profile)
+            if entry is None:
+                entry = self._entries[profile] = ProfileSchedule(profile)
+            queued = any(name == profile and due == entry.next_due for due, _, name in self._heap)
+            if profile not in self._running and not queued:
+                self._push(entry)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({profile: entry.to_dict() for profile, entry in self._entries.items()}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def record(self, entry, post_times, now=None):
+        """Learn from a successful poll and schedule the next one"""
+        now = now or self.clock()
+        entry.gap = estimate_gap(entry.gap, post_times, entry.last_post)
+        newest = max([t for t in post_times if t] + [entry.last_post or 0]) or None
+        if newest and (entry.gap is None or now - newest > entry.gap):
+            # Quiet for longer than usual: the real gap is at least the silence so far
+            entry.gap = now - newest
+        entry.last_post = newest
+        entry.polls += 1
+        entry.failures = 0
+        entry.next_due = now + entry.interval(self.min_interval, self.max_interval)
+
+    def record_failure(self, entry, now=None):
+        """Back off exponentially from a profile that keeps failing"""
+        now = now or self.clock()
+        entry.failures += 1
+        entry.next_due = now + min(self.max_interval, self.min_interval * 2 ** entry.failures)
+
+    def _due(self, now):
+        """Pop the next due, live entry from the heap, or None"""
+        while self._heap:
+            due, _, profile = self._heap[0]
+            entry = self._entries.get(profile)
+            if entry is None or entry.next_due != due or profile in self._running:
+                heapq.heappop(self._heap)  # removed or rescheduled since it was pushed
+                continue
+            if due > now:
+                return None
+            heapq.heappop(self._heap)
+            return entry
+        return None
+
+    def seconds_until_due(self, now=None):
+        now = now or self.clock()
+        live = [due for due, _, profile in self._heap
+                if profile in self._entries and self._entries[profile].next_due == due]
+        return max(0.0, min(live) - now) if live else None
+
+    def run(self, watchlist=None, stop=None, check_every=60.0):
+        """Poll until `stop` is set; watchlist() is re-read every check_every seconds if given"""
+        stop = stop or threading.Event()
+        if watchlist:
+            self.sync(watchlist())
+        last_check = self.clock()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while not stop.is_set():
+                now = self.clock()
+                if watchlist and now - last_check >= check_every:
+                    self.sync(watchlist())
+                    last_check = now
+
+                while len(running) < self.workers:
+                    entry = self._due(now)
+                    if entry is None:
+                        break
+                    interval = entry.interval(self.min_interval, self.max_interval)
+                    print(f"⏰ Polling @{entry.profile} (every {interval / 60:.0f} min)")
+                    self._running.add(entry.profile)
+                    running[executor.submit(self.poll, entry.profile)] = entry
+
+                timeout = self.seconds_until_due(now)
+                if timeout is None or len(running) >= self.workers:
+                    timeout = check_every  # nothing can start before a poll finishes anyway
+                else:
+                    timeout = min(timeout, check_every)
+                if not running:
+                    stop.wait(timeout)
+                    continue
+
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entry = running.pop(future)
+                    self._running.discard(entry.profile)
+                    metrics.incr('polls')
+                    try:
+                        post_times = future.result()
+                    except Exception as e:
+                        self.record_failure(entry)
+                        print(f"❌ Polling @{entry.profile} failed: {e}; retrying in "
+                              f"{(entry.next_due - self.clock()) / 60:.0f} min")
+                    else:
+                        self.record(entry, post_times or [])
+                        print(f"✓ @{entry.profile}: {len(post_times or [])} new posts, next poll in "
+                              f"{(entry.next_due - self.clock()) / 60:.0f} min")
+                    if entry.profile in self._entries:
+                        self._push(entry)
+                    self.save()
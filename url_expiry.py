@@ -0,0 +1,46 @@
+"""
+Signed CDN URL expiry helpers
+Instagram media URLs carry oe=<hex unix time>; after that moment the CDN answers 403
+"""
+
+import re
+import time
+
+# Don't start a download that would expire while it is still queued or in flight
+EXPIRY_MARGIN = 60
+
+# First oe= query parameter; a regex is several times cheaper than urlparse + parse_qs per row
+_OE_PARAM = re.compile(r'[?&]oe=([0-9A-Fa-f]+)(?=[&#]|$)')
+
+
+def url_expiry(url):
+    """Unix timestamp the signed URL stops working, or None if it isn't signed"""
+    match = _OE_PARAM.search(url.split('#', 1)[0])
+    return int(match.group(1), 16) if match else None
+
+
+def is_expired(expires, now=None, margin=EXPIRY_MARGIN):
+    """True if a URL with this expiry timestamp is (about to be) dead"""
+    if expires is None:
+        return False
+    return expires <= (now or time.time()) + margin
+
+
+def schedule_by_expiry(rows, now=None, margin=EXPIRY_MARGIN):
+    """Split rows into (live rows ordered earliest-expiry-first, expired rows)
+
+    Unsigned URLs never expire, so they go to the back of the queue.
+    """
+    now = now or time.time()
+    live = []
+    expired = []
+    for row in rows:
+        expires = row.get('expires')
+        if expires is None:
+            expires = row['expires'] = url_expiry(row['url'])
+        if is_expired(expires, now, margin):
+            expired.append(row)
+        else:
+            live.append(row)
+    live.sort(key=lambda row: row['expires'] if row['expires'] is not None else float('inf'))
+    return live, expired
@@ -0,0 +1,93 @@
+"""
+HTTP validator cache for the downloader
+Remembers the ETag, Last-Modified and length the CDN sent for each media file,
+keyed like the media index so re-signed URLs still match. Interrupted
+downloads resume with If-Range against these, and files already on disk can be
+revalidated with a conditional request instead of being fetched again.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from media_index import media_key
+
+
+class Validators(NamedTuple):
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    length: Optional[int] = None
+
+    @classmethod
+    def from_response(cls, response):
+        """Validators of a 200 or 206 response; length is the full object's size"""
+        headers = response.headers
+        length = None
+        if response.status_code == 206:
+            total = headers.get('Content-Range', '').rpartition('/')[2]
+            length = int(total) if total.isdigit() else None
+        elif (headers.get('Content-Length') or '').isdigit() and 'Content-Encoding' not in headers:
+            length = int(headers['Content-Length'])
+        return cls(headers.get('ETag'), headers.get('Last-Modified'), length)
+
+    def if_range(self):
+        """Value for an If-Range header; only a strong ETag or a date qualifies"""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def conditional_headers(self):
+        """If-None-Match / If-Modified-Since for revalidating a file on disk"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ValidatorCache:
+    """SQLite table of validators per media key, safe to share between download threads"""
+
+    def __init__(self, path='validators.sqlite3'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS validators (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                length INTEGER,
+                checked_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, url):
+        """Validators recorded for the media behind url, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, length FROM validators WHERE key = ?", (media_key(url),)).fetchone()
+        return Validators(*row) if row else None
+
+    def put(self, url, validators):
+        if not (validators.etag or validators.last_modified or validators.length):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO validators (key, etag, last_modified, length, checked_at) VALUES (?, ?, ?, ?, ?)",
+                (media_key(url), *validators, time.time()))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()